@@ -0,0 +1,49 @@
+// 匿名聊天客户端（落地页扫码者与车主聊天页共用）
+// 用法：MoveCarChat(容器元素, WebSocket 路径, 本端角色 'SCANNER' | 'OWNER')
+function MoveCarChat(root, path, role){
+  var log = root.querySelector('[data-chat-log]');
+  var form = root.querySelector('[data-chat-form]');
+  var input = root.querySelector('[data-chat-input]');
+  var state = root.querySelector('[data-chat-state]');
+  var ws = null, retry = 1000;
+
+  function line(text, cls){
+    var p = document.createElement('div');
+    p.className = 'chat-line ' + (cls || '');
+    p.textContent = text;
+    log.appendChild(p);
+    log.scrollTop = log.scrollHeight;
+  }
+
+  function connect(){
+    var proto = location.protocol === 'https:' ? 'wss://' : 'ws://';
+    ws = new WebSocket(proto + location.host + path);
+    ws.onopen = function(){ retry = 1000; state.textContent = '已连接'; };
+    ws.onmessage = function(ev){
+      var m = JSON.parse(ev.data);
+      if (m.type === 'message') {
+        var mine = m.sender === role;
+        line((mine ? '我' : (m.sender === 'OWNER' ? '车主' : '访客')) + '：' + m.text, mine ? 'chat-line--mine' : '');
+      } else if (m.type === 'presence' && role === 'SCANNER') {
+        state.textContent = m.owner_online ? '车主在线' : '车主暂不在线，消息会通知车主';
+      } else if (m.type === 'error') {
+        line(m.detail + (m.retry_after ? '（' + m.retry_after + ' 秒后再试）' : ''), 'chat-line--error');
+      }
+    };
+    ws.onclose = function(ev){
+      state.textContent = '连接已断开，正在重连…';
+      if (ev.code === 1008) { state.textContent = '聊天不可用'; return; }
+      setTimeout(connect, retry);
+      retry = Math.min(retry * 2, 30000);
+    };
+  }
+
+  form.addEventListener('submit', function(ev){
+    ev.preventDefault();
+    var text = input.value.trim();
+    if (!text || !ws || ws.readyState !== 1) return;
+    ws.send(JSON.stringify({text: text}));
+    input.value = '';
+  });
+  connect();
+}
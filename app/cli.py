@@ -0,0 +1,117 @@
+"""命令行工具。
+
+用法：
+    python -m app.cli init
+    python -m app.cli vacuum
+    python -m app.cli provision --owner admin --count 1000 --prefix 车队- --out stickers.pdf
+
+`init`：建表、执行迁移并引导默认管理员（部署步骤；应用随后可用 `APP_INIT=skip` 启动）。
+`vacuum`：将 SQLite 库切换为增量 auto_vacuum（一次完整 VACUUM，期间阻塞写入），此后保留期任务才会回收空闲页。
+`provision`：为指定用户在一个事务内批量创建挪车码，并输出 A4 多联打印文件（按扩展名选择 PDF/SVG）。
+二维码地址依次取 `--base-url`、后台配置的站点地址、`APP_BASE_URL`。
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+
+def cmd_init(args) -> int:
+    from .database import init_db
+    from .migrations import current_version
+    from . import database
+
+    t0 = time.perf_counter()
+    init_db()
+    print(json.dumps({
+        "db_url": database.DB_URL,
+        "schema_version": current_version(database.engine),
+        "init_sec": round(time.perf_counter() - t0, 3),
+    }, ensure_ascii=False, indent=2))
+    return 0
+
+
+def cmd_vacuum(args) -> int:
+    from .database import init_db
+    from .services.retention import enable_incremental_vacuum
+
+    init_db()
+    t0 = time.perf_counter()
+    result = enable_incremental_vacuum()
+    result["vacuum_sec"] = round(time.perf_counter() - t0, 3)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0
+
+
+def cmd_provision(args) -> int:
+    from .database import SessionLocal, init_db
+    from .models import User
+    from .services.provision import bulk_create_codes, owner_stickers
+    from .services.sheet import sheet_renderer
+    from .services.site import get_site_context
+
+    init_db()
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.username == args.owner).first()
+        if user is None:
+            print(f"user not found: {args.owner}", file=sys.stderr)
+            return 1
+        base = (args.base_url or get_site_context(db).base_url or os.getenv("APP_BASE_URL", "")).strip()
+        if not base:
+            print("base url required: --base-url / 站点地址 / APP_BASE_URL", file=sys.stderr)
+            return 1
+        t0 = time.perf_counter()
+        codes = bulk_create_codes(db, user.id, args.count, args.prefix)
+        t1 = time.perf_counter()
+        stickers = owner_stickers(db, user.id, base, codes[0].id, codes[-1].id)
+    finally:
+        db.close()
+    fmt = "svg" if args.out.lower().endswith(".svg") else "pdf"
+    size = 0
+    try:
+        with open(args.out, "wb") as f:
+            for chunk in sheet_renderer.iter_sheet(fmt, stickers):
+                f.write(chunk)
+                size += len(chunk)
+    finally:
+        sheet_renderer.shutdown(wait=True)
+    t2 = time.perf_counter()
+    print(json.dumps({
+        "count": len(codes),
+        "first_id": codes[0].id,
+        "last_id": codes[-1].id,
+        "out": args.out,
+        "bytes": size,
+        "create_sec": round(t1 - t0, 3),
+        "render_sec": round(t2 - t1, 3),
+    }, ensure_ascii=False, indent=2))
+    return 0
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("init", help="初始化数据库（建表、迁移、默认管理员）")
+    p.set_defaults(func=cmd_init)
+    p = sub.add_parser("vacuum", help="切换为增量 auto_vacuum（完整 VACUUM）")
+    p.set_defaults(func=cmd_vacuum)
+    p = sub.add_parser("provision", help="批量创建挪车码并生成打印文件")
+    p.add_argument("--owner", default=os.getenv("ADMIN_USERNAME", "admin"), help="归属用户名")
+    p.add_argument("--count", type=int, required=True, help="数量")
+    p.add_argument("--prefix", default="", help="备注前缀（备注为 前缀+序号）")
+    p.add_argument("--out", default="stickers.pdf", help="输出文件（.pdf 或 .svg）")
+    p.add_argument("--base-url", default="", help="二维码中的站点地址")
+    p.set_defaults(func=cmd_provision)
+    args = ap.parse_args(argv)
+    try:
+        return args.func(args)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
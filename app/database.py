@@ -62,7 +62,7 @@ def _load_env():
 
 # 模块导入即加载 .env（若存在）
 _load_env()
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.exc import OperationalError
 from sqlalchemy import text
@@ -70,44 +70,133 @@ from sqlalchemy import text
 
 DB_URL = os.getenv("DB_URL", "sqlite:///data/app.db")
 
-def _make_engine(url: str):
+
+def _sqlite_profile_enabled() -> bool:
+    """是否启用 SQLite 性能配置（`SQLITE_PROFILE`，默认开启；设为 0 回到库默认行为）。"""
+    return os.getenv("SQLITE_PROFILE", "1") != "0"
+
+
+def _sqlite_pragmas(readonly: bool = False) -> list[str]:
+    """连接建立时执行的 PRAGMA 列表（均可用环境变量调整）。
+
+    - journal_mode=WAL：读写互不阻塞（`SQLITE_JOURNAL_MODE`）；
+    - synchronous=NORMAL：WAL 下每次提交不再 fsync，崩溃时最多丢失最近的提交而不会损坏库（`SQLITE_SYNCHRONOUS`）；
+    - busy_timeout：遇到锁时等待而非立即报 "database is locked"（`SQLITE_BUSY_TIMEOUT_MS`，默认 5000）；
+    - mmap_size / cache_size / temp_store：内存映射读、页缓存（负数为 KiB）与临时表位置；
+    - 只读连接额外设置 query_only，误写会直接报错。
+    """
+    pragmas = [
+        f"journal_mode={os.getenv('SQLITE_JOURNAL_MODE', 'WAL')}",
+        f"synchronous={os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')}",
+        f"busy_timeout={int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))}",
+        f"mmap_size={int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))}",
+        f"cache_size={int(os.getenv('SQLITE_CACHE_SIZE', '-65536'))}",
+        f"temp_store={os.getenv('SQLITE_TEMP_STORE', 'MEMORY')}",
+    ]
+    if readonly:
+        # 日志模式由写连接设置即可（WAL 持久记录在库文件中）
+        pragmas = pragmas[1:] + ["query_only=ON"]
+    return pragmas
+
+
+def _is_memory_url(url: str) -> bool:
+    return ":memory:" in url or url.rstrip("/") in ("sqlite:", "sqlite+pysqlite:")
+
+
+def _make_engine(url: str, readonly: bool = False, profile: bool | None = None):
     """根据 URL 创建引擎。
 
     sqlite 下关闭 `check_same_thread` 以便 TestClient 多线程使用；
     当使用 `sqlite+pysqlite:///:memory:` 等 URI 形式时启用 `uri` 连接参数。
+
+    启用性能配置时（文件库）：
+    - 写引擎常驻 `SQLITE_WRITE_POOL`（默认 1）个连接，写入主要在进程内排队而不是在库锁上竞争；
+      另允许 `SQLITE_WRITE_OVERFLOW`（默认 2）个临时连接，溢出的写入由 SQLite `busy_timeout` 串行化，
+      避免嵌套的第二个写会话在连接池上等满 `SQLITE_POOL_TIMEOUT_SEC`；
+    - 只读引擎（`readonly=True`）连接池大小为 `SQLITE_READ_POOL`（默认 8），供 GET 路由使用。
+
+    写会话约定：请求路径上持有 `get_db` 会话时不得再打开 `SessionLocal()`，且不得在持有写会话时进行网络 I/O
+    （先提交/关闭，结果另开短事务写入，如 `code_notify_test`）。会独立打开写会话的只有请求之外的后台路径：
+    通知发件箱投递器、留言保留期任务、聊天批量写入、图片流水线回写；只读加载（黑名单索引、挪车码缓存预热）
+    使用 `ReadSessionLocal`。
     """
-    if url.startswith("sqlite"):
-        # enable cross-thread for TestClient and potential shared memory DB
-        connect_args = {"check_same_thread": False, "uri": url.startswith("sqlite+")}
+    if not url.startswith("sqlite"):
+        return create_engine(url, echo=False, future=True)
+    # enable cross-thread for TestClient and potential shared memory DB
+    connect_args = {"check_same_thread": False, "uri": url.startswith("sqlite+")}
+    if profile is None:
+        profile = _sqlite_profile_enabled()
+    if not profile or _is_memory_url(url):
+        return create_engine(url, echo=False, future=True, connect_args=connect_args)
+    if readonly:
+        size, overflow = int(os.getenv("SQLITE_READ_POOL", "8")), 0
     else:
-        connect_args = {}
-    return create_engine(url, echo=False, future=True, connect_args=connect_args)
+        size, overflow = int(os.getenv("SQLITE_WRITE_POOL", "1")), int(os.getenv("SQLITE_WRITE_OVERFLOW", "2"))
+    eng = create_engine(
+        url,
+        echo=False,
+        future=True,
+        connect_args=connect_args,
+        pool_size=max(1, size),
+        max_overflow=max(0, overflow),
+        pool_timeout=float(os.getenv("SQLITE_POOL_TIMEOUT_SEC", "30")),
+    )
+    pragmas = _sqlite_pragmas(readonly)
+
+    @event.listens_for(eng, "connect")
+    def _apply_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            for p in pragmas:
+                cur.execute(f"PRAGMA {p}")
+        finally:
+            cur.close()
+
+    return eng
+
+
+def _make_read_engine(url: str, writer):
+    """创建只读引擎；内存库或未启用性能配置时直接复用写引擎。"""
+    if url.startswith("sqlite") and _sqlite_profile_enabled() and not _is_memory_url(url):
+        return _make_engine(url, readonly=True)
+    return writer
 
 
 engine = _make_engine(DB_URL)
+read_engine = _make_read_engine(DB_URL, engine)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False, future=True)
 
 Base = declarative_base()
 
 
 def _reconfigure(url: str):
-    """更新全局引擎与会话工厂的绑定。"""
-    global engine, SessionLocal, DB_URL
+    """更新全局引擎与会话工厂的绑定（释放旧引擎的连接池）。"""
+    global engine, read_engine, DB_URL
+    old = {engine, read_engine}
     DB_URL = url
     engine = _make_engine(url)
+    read_engine = _make_read_engine(url, engine)
     SessionLocal.configure(bind=engine)
+    ReadSessionLocal.configure(bind=read_engine)
+    for e in old:
+        e.dispose()
 
 
 def init_db():
     """初始化数据表，必要时降级到内存库。
 
     - 在受限文件系统（只读）时捕获 `OperationalError` 并切换到内存库；
+    - 执行版本化迁移，迁移失败时异常向上抛出；
     - 始终调用 `bootstrap_admin` 以保证默认管理员存在。
+
+    应用进程内由 `app/startup.py` 在启动阶段调用；部署时也可单独执行 `python -m app.cli init`。
     """
     # 导入模型以注册元数据
     from . import models  # noqa: F401
-    # 重建引擎以拾取可能变更的环境变量（测试友好）
-    _reconfigure(DB_URL)
+    # 引擎已在导入时按 `DB_URL` 创建，这里不再重建；仅释放已有连接（库文件可能已被替换，如测试重建库）
+    for e in {engine, read_engine}:
+        e.dispose()
     try:
         Base.metadata.create_all(bind=engine)
     except OperationalError as e:
@@ -118,20 +207,22 @@ def init_db():
             Base.metadata.create_all(bind=engine)
         else:
             raise
+    # 版本化迁移（见 app/migrations.py）：补齐存量库的字段与热点索引；
+    # 须先于 bootstrap_admin 执行，否则 ORM 查询会引用存量库尚不存在的新列
+    from .migrations import run_migrations
+
+    # 迁移失败时直接抛出（启动失败），不在半迁移的表结构上继续提供服务；已成功的版本保留，下次启动重试其余迁移
+    run_migrations(engine)
     # Ensure admin exists (idempotent)
     bootstrap_admin()
-    # 轻量迁移：补充 app_setting.site_title / footer_html 字段（若不存在）
-    try:
-        with engine.begin() as conn:
-            res = conn.execute(text("PRAGMA table_info('app_setting')")).fetchall()
-            cols = {r[1] for r in res} if res else set()
-            if "site_title" not in cols:
-                conn.execute(text("ALTER TABLE app_setting ADD COLUMN site_title VARCHAR(256) NULL"))
-            if "footer_html" not in cols:
-                conn.execute(text("ALTER TABLE app_setting ADD COLUMN footer_html TEXT NULL"))
-    except Exception:
-        # 忽略迁移错误以保证启动不中断
-        pass
+    # 数据库可能已重建：清空依赖数据库内容的进程内缓存
+    from .services.site import invalidate_site_context
+    from .services.codes import code_cache
+    from .services.blacklist import blacklist_index
+
+    invalidate_site_context()
+    code_cache.clear()
+    blacklist_index.clear()
 
 
 def bootstrap_admin():
@@ -183,3 +274,12 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """FastAPI 依赖：只读会话（GET 路由使用，不占用写连接）。"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
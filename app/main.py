@@ -2,27 +2,68 @@
 
 职责：
 - 创建 FastAPI 应用并挂载静态资源；
-- 配置会话中间件（使用 `APP_SECRET`）；
-- 初始化数据库与默认管理员；
-- 注册页面路由与 API 路由。
+- 配置会话中间件（使用 `APP_SECRET`）、上传大小限制中间件与指标中间件（`/metrics`）；
+- 在 lifespan 启动阶段初始化数据库与默认管理员、预热缓存并预编译模板（`APP_INIT`，见 `app/startup.py`）；
+- 注册页面路由、API 路由与 WebSocket 路由（匿名聊天）。
+- 通过 lifespan 持有通知连接池并启停后台任务（通知发件箱投递器、黑名单索引重载、留言保留期任务、聊天消息批量写入、图片处理与打印文件渲染进程池）。
 
-说明：在 `create_app` 中调用 `init_db()` 方便测试环境直接使用 TestClient。
+说明：导入本模块不访问数据库；不运行 lifespan 的 TestClient 由 `StartupGuardMiddleware` 在首个请求前完成初始化。
 """
 
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
-from .database import init_db
+from starlette.concurrency import run_in_threadpool
+
+from .startup import init_mode, initializer
+from .services.blacklist import blacklist_index
+from .services.retention import retention_job
+from .services.outbox import outbox_dispatcher
+from .services.notify import notify_http
+from .services.images import image_pipeline
+from .services.sheet import sheet_renderer
+from .services.events import event_broker
+from .services.chat import chat_hub
 from .utils import ensure_dirs
+from .middleware import BodySizeLimitMiddleware, MetricsMiddleware, StartupGuardMiddleware
+from .services.metrics import install_db_events, metrics_enabled, server_timing_enabled, sql_debug_enabled
+from .services.uploads import max_image_bytes
 from .routes import pages as pages_routes
 from .routes import api as api_routes
+from .routes import ws as ws_routes
+from .routes import metrics as metrics_routes
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：完成启动初始化，持有通知连接池，启动/停止后台任务（通知发件箱投递器、图片处理与打印文件渲染进程池）。"""
+    await run_in_threadpool(initializer.run)
+    await notify_http.start()
+    await outbox_dispatcher.start()
+    await blacklist_index.start()
+    await retention_job.start()
+    await chat_hub.writer.start()
+    try:
+        yield
+    finally:
+        # 先结束 SSE 长连接，避免拖住服务退出
+        event_broker.close()
+        # 写入尚未落库的聊天消息
+        await chat_hub.writer.stop()
+        await retention_job.stop()
+        await blacklist_index.stop()
+        await outbox_dispatcher.stop()
+        await notify_http.aclose()
+        image_pipeline.shutdown()
+        sheet_renderer.shutdown()
 
 
 def create_app() -> FastAPI:
     """创建并返回 FastAPI 应用实例。"""
-    app = FastAPI(title="Move Car - Open Source")
+    app = FastAPI(title="Move Car - Open Source", lifespan=lifespan)
 
     # static mounts
     data_dir, uploads_dir = ensure_dirs()
@@ -30,16 +71,28 @@ def create_app() -> FastAPI:
     app.mount("/static", StaticFiles(directory="app"), name="static")
     app.mount("/media", StaticFiles(directory=uploads_dir), name="media")
 
+    # 未运行 lifespan 时在首个请求前补做初始化（最内层，位于会话与指标之后）
+    app.add_middleware(StartupGuardMiddleware, initializer=initializer)
     # sessions
     secret = os.getenv("APP_SECRET", "change-me")
     app.add_middleware(SessionMiddleware, secret_key=secret)
+    # 上传大小：在解析表单前按 Content-Length/已接收字节拒绝过大的留言请求（预留表单字段开销）
+    app.add_middleware(BodySizeLimitMiddleware, max_bytes=max_image_bytes() + 256 * 1024)
+    # 指标：最外层中间件，耗时包含会话解析与上传限制；请求内数据库耗时由游标事件累加
+    record, timing, sql_debug = metrics_enabled(), server_timing_enabled(), sql_debug_enabled()
+    if record or timing or sql_debug:
+        install_db_events()
+        app.add_middleware(MetricsMiddleware, record=record, server_timing=timing, sql_debug=sql_debug)
 
-    # 初始化数据库与默认管理员（便于测试直连，不依赖 lifespan 事件）
-    init_db()
+    # 兼容旧行为：导入时同步初始化数据库、预热缓存与预编译模板
+    if init_mode() == "import":
+        initializer.run()
 
     # routes
     app.include_router(pages_routes.router)
     app.include_router(api_routes.router)
+    app.include_router(ws_routes.router)
+    app.include_router(metrics_routes.router)
 
     return app
 
@@ -0,0 +1,170 @@
+"""ASGI 中间件。
+
+- `BodySizeLimitMiddleware`：在表单解析之前拒绝过大的请求体（413），
+  `Content-Length` 超限时直接拒绝；分块传输时边接收边计数，超限即中止。
+- `MetricsMiddleware`：按路由模板记录请求数、耗时与请求内数据库耗时（见 `services/metrics.py`），
+  可选输出 `Server-Timing` 响应头并在调试模式下报告 N+1 查询。
+- `StartupGuardMiddleware`：未运行 lifespan 时（如不带 `with` 的 TestClient）在首个请求前完成启动初始化。
+"""
+
+import logging
+import time
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .services.metrics import (
+    RequestStats,
+    http_db_time,
+    http_latency,
+    http_requests,
+    notify_observers,
+    request_stats,
+    track_statements,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class _BodyTooLarge(HTTPException):
+    """请求体超限；在路由内解析表单时抛出，由异常处理转换为 413 响应。"""
+
+    def __init__(self):
+        super().__init__(status_code=413, detail="Request body too large")
+
+
+class BodySizeLimitMiddleware:
+    """限制指定路径前缀下 POST 请求体的大小。
+
+    参数：
+        max_bytes: 允许的最大请求体字节数（应包含表单字段与 multipart 开销）。
+        path_prefixes: 生效的路径前缀（默认仅扫码留言 `/c/`）。
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, path_prefixes: tuple[str, ...] = ("/c/",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_prefixes = path_prefixes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get("method") != "POST" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope.get("headers", ()):
+            if name == b"content-length":
+                try:
+                    if int(value) > self.max_bytes:
+                        await self._reject(scope, receive, send)
+                        return
+                except ValueError:
+                    pass
+                break
+
+        received = 0
+        started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise _BodyTooLarge()
+            return message
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except _BodyTooLarge:
+            if started:
+                raise
+            await self._reject(scope, receive, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send) -> None:
+        response = PlainTextResponse("Request body too large", status_code=413, headers={"Connection": "close"})
+        await response(scope, receive, send)
+
+
+class MetricsMiddleware:
+    """按路由模板（如 `/c/{public_code}`）统计 HTTP 请求，并提供请求级数据库统计。
+
+    路由模板在路由匹配后才写入 scope（FastAPI 的 `scope["route"]`），因此在请求结束后读取；
+    静态挂载（`/static`、`/media`）以挂载路径计，未匹配的路径统一记为 `<unmatched>`，避免标签基数失控。
+    耗时计到响应体发送完毕（流式响应即整个流的时长）。
+
+    参数：
+        record: 是否写入 `/metrics` 指标。
+        server_timing: 是否在响应头中附带 `Server-Timing`（截至响应开始时的数据库耗时/语句数与总耗时）。
+        sql_debug: 是否检测同一请求内的重复语句（N+1）并记录警告日志。
+    """
+
+    def __init__(self, app: ASGIApp, record: bool = True, server_timing: bool = False, sql_debug: bool = False):
+        self.app = app
+        self.record = record
+        self.server_timing = server_timing
+        self.sql_debug = sql_debug
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(track_statements=self.sql_debug or track_statements())
+        token = request_stats.set(stats)
+        root_path = scope.get("root_path", "")
+        status_code = 500
+        t0 = time.perf_counter()
+
+        async def tracking_send(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append("Server-Timing", (
+                        f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.db_queries} queries", '
+                        f"app;dur={(time.perf_counter() - t0) * 1000:.2f}"
+                    ))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, tracking_send)
+        finally:
+            elapsed = time.perf_counter() - t0
+            request_stats.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                label = route.path
+            elif scope.get("root_path", "") != root_path:
+                label = scope["root_path"][len(root_path):]
+            else:
+                label = "<unmatched>"
+            method = scope["method"]
+            if self.record:
+                http_requests.inc((method, label, str(status_code)))
+                http_latency.observe(elapsed, (method, label))
+                http_db_time.observe(stats.db_seconds, (label,))
+            if self.sql_debug and stats.duplicates():
+                logger.warning("possible N+1 in %s %s: %s", method, label, stats.report())
+            notify_observers(method, label, stats)
+
+
+class StartupGuardMiddleware:
+    """首个请求前确保启动初始化已完成（见 `app/startup.py`）；完成后每个请求只多一次属性判断。"""
+
+    def __init__(self, app: ASGIApp, initializer) -> None:
+        self.app = app
+        self.initializer = initializer
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.initializer.done and scope["type"] in ("http", "websocket"):
+            await run_in_threadpool(self.initializer.run)
+        await self.app(scope, receive, send)
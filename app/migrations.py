@@ -0,0 +1,215 @@
+"""版本化数据库迁移。
+
+- 已应用的版本记录在 `schema_version` 表中，启动时（`init_db`）按版本号顺序执行尚未应用的迁移；
+- 每个迁移在独立事务中执行，并与版本记录一同提交；迁移步骤本身幂等
+ （先检查列是否存在、`CREATE INDEX IF NOT EXISTS`），因此新建库（`create_all` 已建好最新结构）
+  或多个进程同时启动时重复执行也不会出错；
+- 新增迁移：在 `MIGRATIONS` 末尾追加 `Migration(版本号, 说明, 函数)`，不要修改已发布的迁移；
+- `check_query_plans` 对热点查询执行 `EXPLAIN QUERY PLAN`，返回未走索引（全表扫描）的查询，
+  可通过 `python -m app.migrations` 查看。
+"""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+
+@dataclass(frozen=True)
+class Migration:
+    """单个迁移：版本号（严格递增）、说明与执行函数（接收事务内的连接）。"""
+    version: int
+    name: str
+    apply: Callable[[Connection], None]
+
+
+def _columns(conn: Connection, table: str) -> set[str]:
+    return {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def _add_column(conn: Connection, table: str, column: str, ddl: str) -> None:
+    """列不存在时追加（幂等）。"""
+    if column not in _columns(conn, table):
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def _m001_app_setting_site_fields(conn: Connection) -> None:
+    _add_column(conn, "app_setting", "site_title", "VARCHAR(256) NULL")
+    _add_column(conn, "app_setting", "footer_html", "TEXT NULL")
+
+
+def _m002_message_thumb_path(conn: Connection) -> None:
+    _add_column(conn, "messages", "thumb_path", "VARCHAR(256) NULL")
+
+
+# 索引名与 models.py 中 `__table_args__` 的声明保持一致
+HOT_PATH_INDEXES = (
+    ("ix_messages_code_created", "messages", "code_id, created_at"),
+    ("ix_messages_created", "messages", "created_at, id"),
+    ("ix_blacklist_code_ip", "blacklist", "code_id, ip_hash"),
+    ("ix_codes_owner_created", "codes", "owner_id, created_at"),
+    ("ix_code_notify_pref_code", "code_notify_pref", "code_id"),
+    ("ix_notify_outbox_status_due", "notify_outbox", "status, next_attempt_at"),
+    ("ix_notify_outbox_message", "notify_outbox", "message_id"),
+)
+
+
+def _m003_hot_path_indexes(conn: Connection) -> None:
+    for name, table, cols in HOT_PATH_INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
+    if conn.dialect.name == "sqlite":
+        # 更新统计信息，帮助查询规划器在多个索引间做出选择
+        conn.execute(text("ANALYZE"))
+
+
+def _m004_outbox_code_index(conn: Connection) -> None:
+    # 合并推送时按码查询待投递/最近已推送的通知
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notify_outbox_code_status ON notify_outbox (code_id, status, sent_at)"))
+
+
+def _m005_code_retention_days(conn: Connection) -> None:
+    _add_column(conn, "codes", "retention_days", "INTEGER NULL")
+
+
+def _m006_user_change_seq(conn: Connection) -> None:
+    _add_column(conn, "users", "change_seq", "INTEGER NOT NULL DEFAULT 0")
+
+
+def _m007_notify_pref_last_test(conn: Connection) -> None:
+    _add_column(conn, "code_notify_pref", "last_test_at", "DATETIME")
+    _add_column(conn, "code_notify_pref", "last_test_ok", "BOOLEAN")
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "app_setting.site_title/footer_html", _m001_app_setting_site_fields),
+    Migration(2, "messages.thumb_path", _m002_message_thumb_path),
+    Migration(3, "hot-path indexes", _m003_hot_path_indexes),
+    Migration(4, "notify_outbox(code_id, status, sent_at)", _m004_outbox_code_index),
+    Migration(5, "codes.retention_days", _m005_code_retention_days),
+    Migration(6, "users.change_seq", _m006_user_change_seq),
+    Migration(7, "code_notify_pref.last_test_at/last_test_ok", _m007_notify_pref_last_test),
+)
+
+
+def _ensure_version_table(engine: Engine) -> None:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_version ("
+            "version INTEGER PRIMARY KEY, name VARCHAR(120) NOT NULL, applied_at DATETIME NOT NULL)"
+        ))
+
+
+def current_version(engine: Engine) -> int:
+    """当前已应用的最高版本号（无记录时为 0）。"""
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar() or 0
+
+
+def run_migrations(engine: Engine, migrations: tuple[Migration, ...] = MIGRATIONS) -> list[int]:
+    """执行尚未应用的迁移，返回本次应用的版本号列表。
+
+    任一迁移失败时其事务回滚并抛出异常，后续迁移不再执行（已成功的版本保留）。
+    """
+    _ensure_version_table(engine)
+    applied: list[int] = []
+    for m in sorted(migrations, key=lambda m: m.version):
+        with engine.begin() as conn:
+            done = conn.execute(
+                text("SELECT 1 FROM schema_version WHERE version = :v"), {"v": m.version}
+            ).first()
+            if done:
+                continue
+            m.apply(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": m.version, "n": m.name, "t": datetime.utcnow()},
+            )
+        applied.append(m.version)
+    return applied
+
+
+# 热点查询（与路由/服务中的实际查询形状一致），用于索引覆盖检查
+HOT_QUERIES = {
+    "scan_blacklist": (
+        "SELECT id FROM blacklist WHERE code_id = :code_id AND ip_hash IN (:h1, :h2) LIMIT 1",
+        {"code_id": 1, "h1": "a", "h2": "b"},
+    ),
+    "code_notify_pref": (
+        "SELECT id FROM code_notify_pref WHERE code_id = :code_id LIMIT 1",
+        {"code_id": 1},
+    ),
+    "owner_codes": (
+        "SELECT id FROM codes WHERE owner_id = :owner_id ORDER BY created_at DESC",
+        {"owner_id": 1},
+    ),
+    "code_messages": (
+        "SELECT id FROM messages WHERE code_id = :code_id ORDER BY created_at DESC LIMIT 50",
+        {"code_id": 1},
+    ),
+    "owner_feed": (
+        "SELECT messages.id FROM messages JOIN codes ON codes.id = messages.code_id "
+        "LEFT OUTER JOIN notify_outbox ON notify_outbox.message_id = messages.id "
+        "WHERE codes.owner_id = :owner_id ORDER BY messages.created_at DESC, messages.id DESC LIMIT 51",
+        {"owner_id": 1},
+    ),
+    "owner_since": (
+        "SELECT messages.id FROM messages JOIN codes ON codes.id = messages.code_id "
+        "LEFT OUTER JOIN notify_outbox ON notify_outbox.message_id = messages.id "
+        "WHERE codes.owner_id = :owner_id AND messages.id > :since ORDER BY messages.id LIMIT 101",
+        {"owner_id": 1, "since": 0},
+    ),
+    "outbox_coalesce": (
+        "SELECT sent_at FROM notify_outbox WHERE code_id = :code_id AND status = 'SENT' AND sent_at >= :since "
+        "ORDER BY sent_at DESC LIMIT 1",
+        {"code_id": 1, "since": "2000-01-01 00:00:00"},
+    ),
+    "outbox_due": (
+        "SELECT id FROM notify_outbox WHERE status IN ('PENDING', 'SENDING') AND next_attempt_at <= :now "
+        "ORDER BY next_attempt_at LIMIT 50",
+        {"now": "2100-01-01 00:00:00"},
+    ),
+}
+
+
+def explain(conn: Connection, sql: str, params: dict) -> list[str]:
+    """返回 SQLite `EXPLAIN QUERY PLAN` 的各行说明。"""
+    return [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+
+
+def check_query_plans(engine: Engine) -> dict[str, list[str]]:
+    """检查热点查询是否走索引，返回 {查询名: 全表扫描的计划行}；全部命中索引时返回空字典。
+
+    仅支持 SQLite，其他数据库直接返回空字典。
+    """
+    if engine.dialect.name != "sqlite":
+        return {}
+    problems: dict[str, list[str]] = {}
+    with engine.connect() as conn:
+        for name, (sql, params) in HOT_QUERIES.items():
+            scans = [
+                line for line in explain(conn, sql, params)
+                if line.startswith("SCAN ") and " USING " not in line
+            ]
+            if scans:
+                problems[name] = scans
+    return problems
+
+
+if __name__ == "__main__":
+    from . import database
+
+    database.init_db()
+    _engine = database.engine  # 只读文件系统时 init_db 会切换到内存库，需在其后读取
+
+    print(f"schema version: {current_version(_engine)}")
+    with _engine.connect() as _conn:
+        for _name, (_sql, _params) in HOT_QUERIES.items():
+            print(f"[{_name}]")
+            for _line in explain(_conn, _sql, _params):
+                print(f"  {_line}")
+    _problems = check_query_plans(_engine)
+    print("全部热点查询命中索引" if not _problems else f"未命中索引: {', '.join(_problems)}")
+    raise SystemExit(1 if _problems else 0)
@@ -1,11 +1,12 @@
 """ORM 模型定义。
 
-包含用户、挪车码、留言、黑名单以及码级通知偏好等表结构。
+包含用户、挪车码、留言、黑名单、码级通知偏好以及通知发件箱等表结构。
 字段命名尽量语义化，便于后台检索与导出。
+热点查询所用索引在 `__table_args__` 中声明，存量库由 `app/migrations.py` 补建（索引名需保持一致）。
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Text, Index
 from sqlalchemy.orm import relationship
 
 from .database import Base
@@ -19,6 +20,7 @@ class User(Base):
     - email: 邮箱（可选）
     - password_hash: 密码哈希（salt$sha256）
     - status: 账户状态（ACTIVE/…）
+    - change_seq: 留言变更计数（新增/处理/删除时递增，用于增量接口的 ETag）
     """
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
@@ -27,6 +29,7 @@ class User(Base):
     password_hash = Column(String(256), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     status = Column(String(16), default="ACTIVE")
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")
 
     codes = relationship("Code", back_populates="owner")
 
@@ -39,13 +42,18 @@ class Code(Base):
     - owner_id: 归属用户
     - display_name: 备注/昵称（用于打印展示）
     - status: ACTIVE/PAUSED/DELETED
+    - retention_days: 留言保留天数（空则使用全局 `RETENTION_DAYS`，0 表示永久保留）
     """
     __tablename__ = "codes"
+    __table_args__ = (
+        Index("ix_codes_owner_created", "owner_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True)
     public_code = Column(String(64), unique=True, nullable=False)
     owner_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     display_name = Column(String(120), nullable=True)
     status = Column(String(16), default="ACTIVE")
+    retention_days = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     owner = relationship("User", back_populates="codes")
@@ -59,20 +67,29 @@ class Message(Base):
     - sender: 发送方（SCANNER/OWNER 保留）
     - content_text: 文本内容
     - image_path: 图片存储相对路径
+    - thumb_path: 缩略图相对路径（图片处理完成后写入）
     - ip_hash: 基于密钥的 IP 哈希（用于风控/审计）
     - processed: 车主是否标记已处理
     """
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_code_created", "code_id", "created_at"),
+        Index("ix_messages_created", "created_at", "id"),
+    )
     id = Column(Integer, primary_key=True)
     code_id = Column(Integer, ForeignKey("codes.id"), nullable=False)
     sender = Column(String(16), default="SCANNER")  # SCANNER / OWNER (reserved)
     content_text = Column(Text, nullable=True)
     image_path = Column(String(256), nullable=True)
+    thumb_path = Column(String(256), nullable=True)
     ip_hash = Column(String(64), nullable=True)
     processed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     code = relationship("Code", back_populates="messages")
+    notification = relationship(
+        "NotifyOutbox", back_populates="message", uselist=False, cascade="all, delete-orphan"
+    )
 
 
 class Blacklist(Base):
@@ -84,6 +101,9 @@ class Blacklist(Base):
     - until: 过期时间（可为空）
     """
     __tablename__ = "blacklist"
+    __table_args__ = (
+        Index("ix_blacklist_code_ip", "code_id", "ip_hash"),
+    )
     id = Column(Integer, primary_key=True)
     code_id = Column(Integer, ForeignKey("codes.id"), nullable=True)
     ip_hash = Column(String(64), nullable=False)
@@ -99,14 +119,59 @@ class CodeNotifyPref(Base):
     - channel: NONE/BARK（后续可扩展）
     - bark_base_url/bark_token: Bark 所需配置
     - updated_at: 更新时间
+    - last_test_at/last_test_ok: 最近一次测试通知的时间与结果
     """
     __tablename__ = "code_notify_pref"
+    __table_args__ = (
+        Index("ix_code_notify_pref_code", "code_id"),
+    )
     id = Column(Integer, primary_key=True)
     code_id = Column(Integer, ForeignKey("codes.id"), nullable=False)
     channel = Column(String(16), default="NONE")  # NONE / BARK
     bark_base_url = Column(String(256), nullable=True)
     bark_token = Column(String(256), nullable=True)
     updated_at = Column(DateTime, default=datetime.utcnow)
+    # 最近一次测试通知的时间与结果（在发送完成后的独立短事务中写入）
+    last_test_at = Column(DateTime, nullable=True)
+    last_test_ok = Column(Boolean, nullable=True)
+
+
+class NotifyOutbox(Base):
+    """通知发件箱（与留言同事务写入，由后台投递器异步发送）。
+
+    字段：
+    - message_id: 关联留言（每条留言至多一条通知）
+    - channel/target_base_url/target_token: 入队时的渠道与配置快照
+    - title/body/url: 推送内容
+    - status: PENDING/SENDING/SENT/DEAD（超过最大重试次数后进入死信）
+    - attempts/next_attempt_at: 已尝试次数与下次可投递时间（SENDING 时为租约到期时间）
+    - claim_token: 领取批次标记（多个投递器并发领取时区分归属）
+    - last_error: 最近一次失败原因
+    """
+    __tablename__ = "notify_outbox"
+    __table_args__ = (
+        Index("ix_notify_outbox_status_due", "status", "next_attempt_at"),
+        Index("ix_notify_outbox_message", "message_id"),
+        Index("ix_notify_outbox_code_status", "code_id", "status", "sent_at"),
+    )
+    id = Column(Integer, primary_key=True)
+    message_id = Column(Integer, ForeignKey("messages.id"), nullable=True)
+    code_id = Column(Integer, nullable=True)
+    channel = Column(String(16), default="BARK")
+    target_base_url = Column(String(256), nullable=True)
+    target_token = Column(String(256), nullable=True)
+    title = Column(String(120), nullable=True)
+    body = Column(Text, nullable=True)
+    url = Column(String(512), nullable=True)
+    status = Column(String(16), default="PENDING")
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claim_token = Column(String(32), nullable=True)
+    last_error = Column(String(256), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+
+    message = relationship("Message", back_populates="notification")
 
 
 class AppSetting(Base):
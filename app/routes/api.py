@@ -1,14 +1,31 @@
 """简易后台 API 路由。
 
-当前仅提供码级黑名单维护示例接口。
+提供码级黑名单、码管理、留言标记等写接口，以及增量留言读取接口 `GET /api/v1/messages`。
 """
 
+from datetime import datetime, timedelta, timezone
+
 from fastapi import APIRouter, Depends, HTTPException, Request, Form
+from fastapi.responses import JSONResponse, Response
 from sqlalchemy.orm import Session
 
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models import User, Code, Blacklist
-from ..utils import hash_ip
+from ..utils import normalize_ip
+from ..services.codes import invalidate_code
+from ..services.blacklist import blacklist_index
+from ..services.iphash import ip_hasher
+from ..services.retention import code_media_paths, remove_media_files
+from ..services.provision import bulk_create_codes
+from ..services.events import event_broker
+from ..services.feed import (
+    bump_change_seq,
+    change_seq,
+    feed_etag,
+    fetch_messages_since,
+    unprocessed_counts,
+)
+from ..services.qr import etag_matches
 
 
 router = APIRouter(prefix="/api/v1")
@@ -28,21 +45,54 @@ def add_blocklist(
     code_id: int = Form(...),
     ip: str = Form(...),
     reason: str = Form(""),
+    ttl_minutes: int | None = Form(None),
     db: Session = Depends(get_db),
 ):
-    """添加码级黑名单（IP）。需要已登录且对该码有权限。"""
+    """添加码级黑名单（IP）。需要已登录且对该码有权限。
+
+    `ttl_minutes` 可选：设置后条目在该时长后自动失效，否则永久有效。
+    """
     user = current_user(request, db)
     if not user:
         raise HTTPException(status_code=401)
     code = db.query(Code).filter(Code.id == code_id, Code.owner_id == user.id).first()
     if not code:
         raise HTTPException(status_code=404, detail="Code not found")
-    bl = Blacklist(code_id=code.id, ip_hash=hash_ip(ip), reason=reason or None)
+    until = datetime.utcnow() + timedelta(minutes=ttl_minutes) if ttl_minutes and ttl_minutes > 0 else None
+    bl = Blacklist(code_id=code.id, ip_hash=ip_hasher.hash(normalize_ip(ip.strip())), reason=reason or None, until=until)
     db.add(bl)
     db.commit()
+    blacklist_index.add(bl.code_id, bl.ip_hash, until)
     return {"ok": True}
 
 
+@router.post("/codes/bulk")
+def api_bulk_create_codes(
+    request: Request,
+    count: int = Form(...),
+    name_prefix: str = Form(""),
+    db: Session = Depends(get_db),
+):
+    """批量新建挪车码（单事务）。
+
+    返回 JSON：{"ok": true, "count": n, "codes": [{"id", "public_code", "display_name"}], "sheet_url": "..."}
+    `sheet_url` 为该批次的 A4 多联 PDF 打印文件（同一区间可将后缀改为 .svg）。
+    """
+    user = current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401)
+    try:
+        codes = bulk_create_codes(db, user.id, count, name_prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "ok": True,
+        "count": len(codes),
+        "codes": [{"id": c.id, "public_code": c.public_code, "display_name": c.display_name} for c in codes],
+        "sheet_url": f"/codes/sheet.pdf?from_id={codes[0].id}&to_id={codes[-1].id}",
+    }
+
+
 @router.post("/codes/{code_id}/toggle")
 def api_toggle_code(
     request: Request,
@@ -60,8 +110,10 @@ def api_toggle_code(
     code = db.query(Code).filter(Code.id == code_id, Code.owner_id == user.id).first()
     if not code:
         raise HTTPException(status_code=404, detail="Code not found")
+    public_code = code.public_code
     code.status = "PAUSED" if code.status == "ACTIVE" else "ACTIVE"
     db.commit()
+    invalidate_code(public_code)
     return {"ok": True, "code_id": code.id, "status": code.status}
 
 
@@ -74,7 +126,7 @@ def api_delete_code(
     """删除挪车码（AJAX）。
 
     返回 JSON：{"ok": true, "code_id": id}
-    同步删除相关黑名单与消息（与页面路由保持一致的行为）。
+    同步删除相关黑名单、消息与图片文件（与页面路由保持一致的行为）。
     """
     user = current_user(request, db)
     if not user:
@@ -84,11 +136,88 @@ def api_delete_code(
         raise HTTPException(status_code=404, detail="Code not found")
     # 删除黑名单并删除该码（消息通过 ORM 关系配置通常会级联，若未配置则依靠外键约束/手动清理）
     db.query(Blacklist).filter(Blacklist.code_id == code.id).delete(synchronize_session=False)
+    public_code = code.public_code
+    media = code_media_paths(db, code.id)
+    bump_change_seq(db, user.id)
     db.delete(code)
     db.commit()
+    invalidate_code(public_code)
+    blacklist_index.drop_code(code_id)
+    remove_media_files(media)
     return {"ok": True, "code_id": code_id}
 
 
+@router.post("/codes/{code_id}/retention")
+def api_code_retention(
+    request: Request,
+    code_id: int,
+    days: str = Form(""),
+    db: Session = Depends(get_db),
+):
+    """设置码级留言保留天数（AJAX）。
+
+    `days` 为空表示使用全局 `RETENTION_DAYS`，0 表示永久保留。
+    过期清理由保留期任务执行（`RETENTION_ENABLED=1` 或设置了全局 `RETENTION_DAYS` 时运行）。
+    返回 JSON：{"ok": true, "code_id": id, "retention_days": n|null}
+    """
+    user = current_user(request, db)
+    if not user:
+        raise HTTPException(status_code=401)
+    code = db.query(Code).filter(Code.id == code_id, Code.owner_id == user.id).first()
+    if not code:
+        raise HTTPException(status_code=404, detail="Code not found")
+    value = days.strip()
+    if value and (not value.isdigit() or int(value) > 36500):
+        raise HTTPException(status_code=400, detail="Invalid days")
+    code.retention_days = int(value) if value else None
+    db.commit()
+    return {"ok": True, "code_id": code_id, "retention_days": code.retention_days}
+
+
+@router.get("/messages")
+def api_list_messages(
+    request: Request,
+    since: int = 0,
+    limit: int = 100,
+    code_id: int | None = None,
+    db: Session = Depends(get_read_db),
+):
+    """增量读取留言（id 大于 `since` 的行，旧 -> 新；最多 `limit` 条，上限 500）。
+
+    返回 JSON：{"items": [...], "next_since": id, "has_more": bool, "unprocessed": {code_id: n}}
+    下次轮询以 `next_since` 作为 `since`；`has_more` 为 true 时应立即继续拉取。
+    响应带 ETag（由车主的留言变更计数生成）；携带 `If-None-Match` 且期间无新增/处理/删除时返回 304，
+    此时只做一次按主键的计数查询。
+    """
+    uid = request.session.get("user_id")
+    seq = change_seq(db, uid) if uid else None
+    if seq is None:
+        raise HTTPException(status_code=401)
+    etag = feed_etag(uid, seq, since, limit, code_id)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    rows, has_more = fetch_messages_since(db, uid, since, limit, code_id)
+    return JSONResponse({
+        "items": [
+            {
+                "id": r.id,
+                "code_id": r.code_id,
+                "code_label": r.code_label,
+                "content_text": r.content_text,
+                "image_path": r.image_path,
+                "thumb_path": r.thumb_path,
+                "processed": r.processed,
+                "created_at": r.created_at.replace(tzinfo=timezone.utc).isoformat() if r.created_at else None,
+            }
+            for r in rows
+        ],
+        "next_since": rows[-1].id if rows else max(0, since),
+        "has_more": has_more,
+        "unprocessed": {str(k): v for k, v in unprocessed_counts(db, uid).items()},
+    }, headers=headers)
+
+
 @router.post("/messages/{msg_id}/mark")
 def api_mark_message(
     request: Request,
@@ -113,6 +242,11 @@ def api_mark_message(
     )
     if not msg:
         raise HTTPException(status_code=404, detail="Message not found")
+    was_processed, code_id = msg.processed, msg.code_id
     msg.processed = True
+    if not was_processed:
+        bump_change_seq(db, user.id)
     db.commit()
+    if not was_processed:
+        event_broker.publish(user.id, "processed", {"id": msg_id, "code_id": code_id})
     return {"ok": True, "msg_id": msg_id}
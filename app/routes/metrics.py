@@ -0,0 +1,55 @@
+"""指标路由：`GET /metrics`（Prometheus 文本格式）。
+
+访问控制（满足其一即可）：
+- 来自本机回环地址（`METRICS_ALLOW_LOCAL`，默认开启；经同机反向代理转发时所有请求都来自本机，
+  此时应关闭该项或在代理层屏蔽 `/metrics`）；
+- `Authorization: Bearer <METRICS_TOKEN>`（设置了 `METRICS_TOKEN` 时）；
+- 已登录的管理员（用户名为 `ADMIN_USERNAME`，默认 admin）。
+"""
+
+import hmac
+import os
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+
+from ..services.metrics import metrics_enabled, registry
+
+
+router = APIRouter()
+LOOPBACK = {"127.0.0.1", "::1", "localhost"}
+
+
+def _is_admin(uid: int) -> bool:
+    from ..database import ReadSessionLocal
+    from ..models import User
+
+    db = ReadSessionLocal()
+    try:
+        row = db.query(User.username).filter(User.id == uid).first()
+    finally:
+        db.close()
+    return row is not None and row[0] == os.getenv("ADMIN_USERNAME", "admin")
+
+
+async def _allowed(request: Request) -> bool:
+    host = request.client.host if request.client else ""
+    if host in LOOPBACK and os.getenv("METRICS_ALLOW_LOCAL", "1") != "0":
+        return True
+    token = os.getenv("METRICS_TOKEN", "")
+    auth = request.headers.get("authorization", "")
+    if token and auth.startswith("Bearer ") and hmac.compare_digest(auth[7:].strip(), token):
+        return True
+    uid = request.session.get("user_id")
+    return bool(uid) and await run_in_threadpool(_is_admin, uid)
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(request: Request):
+    """输出进程内指标（在事件循环内渲染，线程池排队数不受抓取本身影响）。"""
+    if not metrics_enabled():
+        raise HTTPException(status_code=404)
+    if not await _allowed(request):
+        raise HTTPException(status_code=403)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
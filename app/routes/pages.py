@@ -1,23 +1,41 @@
-import os
 """页面路由。
 
 包含：登录/退出、仪表盘、挪车码 CRUD、打印页、扫码落地页、留言提交、
 通知设置（保存/测试）以及二维码 PNG 生成等。
 """
 
+import math
+import os
+from datetime import datetime
+
+import anyio
 from fastapi import APIRouter, Depends, Form, HTTPException, Request, UploadFile, File
-from fastapi.responses import HTMLResponse, RedirectResponse, Response
+from fastapi.responses import HTMLResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from starlette import status
 
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models import User, Code, Message, Blacklist, CodeNotifyPref, AppSetting
-from ..utils import verify_password, ensure_dirs, generate_public_code, hash_ip
+from ..utils import verify_password, ensure_dirs, generate_public_code, normalize_ip
 from ..services.rate_limit import RateLimiter
-from ..services.notify import send_bark, allow_notify
-import io
-import segno
+from ..services.notify import send_bark_async
+from ..services.outbox import enqueue_notification, outbox_dispatcher
+from ..services.site import get_site_context, invalidate_site_context, peek_site_context
+from ..services.qr import qr_cache, etag_matches
+from ..services.codes import claim_active_code, code_cache, resolve_code, invalidate_code
+from ..services.uploads import incoming_dir, stage_upload, max_image_bytes, UploadTooLarge
+from ..services.images import image_pipeline, sniff_image_type, EXTENSIONS as IMAGE_EXTENSIONS
+from ..services.feed import bump_change_seq, fetch_message_page, owner_codes_with_counts
+from ..services.events import event_broker
+from ..services.chat import chat_enabled
+from ..services.blacklist import blacklist_index
+from ..services.iphash import ip_hasher
+from ..services.retention import code_media_paths, remove_media_files
+from ..services.provision import bulk_create_codes, owner_stickers
+from ..services.sheet import sheet_renderer, MEDIA_TYPES as SHEET_MEDIA_TYPES
 
 
 templates = Jinja2Templates(directory="app/templates")
@@ -43,35 +61,42 @@ def _fmt_dt(value):
 
 # 注册模板过滤器
 templates.env.filters["fmt_dt"] = _fmt_dt
-router = APIRouter()
-rate_limiter = RateLimiter()
+# 生产环境不在每次渲染时检查模板文件是否变更；开发时设置 TEMPLATE_AUTO_RELOAD=1
+templates.env.auto_reload = os.getenv("TEMPLATE_AUTO_RELOAD", "0") == "1"
 
 
-def _default_footer_html() -> str:
-    """默认页脚 HTML（更生动）。
+def precompile_templates(cache_dir: str | None = None) -> int:
+    """预编译全部模板（启动阶段调用），返回模板数量。
 
-    说明：
-    - 更友好的文案与表情，突出“文明挪车 / 隐私友好 / 开源”。
-    - 管理员可在“系统配置”中自定义（支持 HTML），此处仅为默认兜底。
+    `cache_dir` 非空时启用 Jinja 字节码缓存：后续进程与 worker 直接加载编译结果，无需重新解析模板。
     """
-    return (
-        '<div class="muted">'
-        '🚗 文明挪车 · 守护隐私 <span class="sep">|</span> '
-        '<a class="link" href="https://github.com/skyjt/MoveCar" target="_blank" rel="noopener">GitHub: skyjt/MoveCar</a> '
-        '<span class="sep">|</span> <span>Made with ❤️</span>'
-        "</div>"
-    )
+    env = templates.env
+    if cache_dir and env.bytecode_cache is None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+        except OSError:
+            pass
+    names = [n for n in env.list_templates() if n.endswith(".html")]
+    for name in names:
+        env.get_template(name)
+    return len(names)
 
 
-def _site_footer(db: Session) -> str:
-    """从数据库读取页脚 HTML，若为空则返回默认内容。"""
-    try:
-        setting = db.query(AppSetting).first()
-        if setting and setting.footer_html:
-            return setting.footer_html
-    except Exception:
-        pass
-    return _default_footer_html()
+router = APIRouter()
+rate_limiter = RateLimiter()
+DASHBOARD_PAGE_SIZE = int(os.getenv("DASHBOARD_PAGE_SIZE", "50"))
+
+
+def _site_vars(db: Session) -> dict:
+    """页面公共变量：站点标题、页脚 HTML 与对外地址（来自进程内缓存）。"""
+    site = get_site_context(db)
+    return {
+        "site": site,
+        "site_title": site.title,
+        "site_footer_html": site.footer_html,
+        "site_base_url": site.base_url,
+    }
 
 
 def current_user(request: Request, db: Session) -> User | None:
@@ -83,14 +108,12 @@ def current_user(request: Request, db: Session) -> User | None:
 
 
 @router.get("/login", response_class=HTMLResponse)
-def login_page(request: Request, db: Session = Depends(get_db)):
+def login_page(request: Request, db: Session = Depends(get_read_db)):
     """登录页（GET）。"""
-    setting = db.query(AppSetting).first()
-    site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
     return templates.TemplateResponse(
         request,
         "login.html",
-        {"session": request.session, "error": None, "site_title": site_title, "site_footer_html": _site_footer(db)},
+        {"session": request.session, "error": None, **_site_vars(db)},
     )
 
 
@@ -106,7 +129,7 @@ def login(request: Request, db: Session = Depends(get_db), username: str = Form(
         return templates.TemplateResponse(
             request,
             "login.html",
-            {"session": request.session, "error": "用户名或密码错误"},
+            {"session": request.session, "error": "用户名或密码错误", **_site_vars(db)},
             status_code=400,
         )
     request.session["user_id"] = user.id
@@ -114,19 +137,17 @@ def login(request: Request, db: Session = Depends(get_db), username: str = Form(
 
 
 @router.get("/", response_class=HTMLResponse)
-def home(request: Request, db: Session = Depends(get_db)):
+def home(request: Request, db: Session = Depends(get_read_db)):
     """首页：展示标题与进入控制台按钮。"""
-    setting = db.query(AppSetting).first()
-    site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
+    site = get_site_context(db)
     return templates.TemplateResponse(
         request,
         "home.html",
         {
             "session": request.session,
-            "title": site_title,
-            "header": site_title,
-            "site_title": site_title,
-            "site_footer_html": _site_footer(db),
+            "title": site.title,
+            "header": site.title,
+            **_site_vars(db),
         },
     )
 
@@ -139,17 +160,26 @@ def logout(request: Request):
 
 
 @router.get("/dashboard", response_class=HTMLResponse)
-def dashboard(request: Request, db: Session = Depends(get_db)):
-    """仪表盘：展示我的挪车码与最新留言。"""
+def dashboard(
+    request: Request,
+    cursor: str | None = None,
+    processed: str | None = None,
+    code: int | None = None,
+    db: Session = Depends(get_read_db),
+):
+    """仪表盘：展示我的挪车码与留言（游标分页，可按处理状态/码筛选）。
+
+    渲染固定为两次查询（码列表连同各码未处理数 + 一页留言），与码数、每页条数无关；
+    之后的新留言与处理状态由 `/dashboard/events`（SSE）实时推送，无需刷新。
+    """
     user = current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-    codes = db.query(Code).filter(Code.owner_id == user.id).order_by(Code.created_at.desc()).all()
-    messages = (
-        db.query(Message).join(Code).filter(Code.owner_id == user.id).order_by(Message.created_at.desc()).limit(50).all()
+    codes, unprocessed = owner_codes_with_counts(db, user.id)
+    processed_filter = {"1": True, "0": False}.get(processed or "")
+    messages, next_cursor = fetch_message_page(
+        db, user.id, cursor=cursor, limit=DASHBOARD_PAGE_SIZE, processed=processed_filter, code_id=code
     )
-    setting = db.query(AppSetting).first()
-    site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
     return templates.TemplateResponse(
         request,
         "dashboard.html",
@@ -157,27 +187,59 @@ def dashboard(request: Request, db: Session = Depends(get_db)):
             "session": request.session,
             "user": user,
             "codes": codes,
+            "unprocessed": unprocessed,
             "messages": messages,
-            "site_base_url": (setting.site_base_url if setting else ""),
-            "site_title": site_title,
-            "site_footer_html": _site_footer(db),
+            "next_cursor": next_cursor,
+            "cursor": cursor,
+            "filter_processed": processed if processed in ("0", "1") else "",
+            "filter_code": code,
+            "chat_enabled": chat_enabled(),
+            **_site_vars(db),
             "saved": request.query_params.get("saved"),
         },
     )
 
 
+@router.get("/dashboard/events")
+async def dashboard_events(request: Request):
+    """仪表盘实时事件流（SSE）：新留言（`message`）、留言已处理（`processed`）。
+
+    仅校验会话中的用户 id，不访问数据库；连接全程运行在事件循环上，不占用线程池。
+    """
+    uid = request.session.get("user_id")
+    if not uid:
+        raise HTTPException(status_code=401)
+    if event_broker.full():
+        raise HTTPException(status_code=503, detail="Too many connections", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        event_broker.stream(uid),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _message_event(msg: Message, code) -> dict:
+    """新留言事件数据（字段与仪表盘留言行一致）。"""
+    return {
+        "id": msg.id,
+        "code_id": code.id,
+        "code_label": code.display_name or code.public_code,
+        "content_text": msg.content_text,
+        "image_path": msg.image_path,
+        "created_at": _fmt_dt(msg.created_at),
+    }
+
+
 @router.get("/codes/new", response_class=HTMLResponse)
-def code_new(request: Request, db: Session = Depends(get_db)):
+def code_new(request: Request, db: Session = Depends(get_read_db)):
     """新建挪车码表单页。"""
     user = current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-    setting = db.query(AppSetting).first()
-    site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
     return templates.TemplateResponse(
         request,
         "code_new.html",
-        {"session": request.session, "site_title": site_title, "site_footer_html": _site_footer(db)},
+        {"session": request.session, **_site_vars(db)},
     )
 
 
@@ -194,6 +256,51 @@ def code_create(request: Request, display_name: str = Form(""), db: Session = De
     return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
 
 
+@router.post("/codes/bulk")
+def code_bulk_create(
+    request: Request,
+    count: int = Form(...),
+    name_prefix: str = Form(""),
+    db: Session = Depends(get_db),
+):
+    """批量新建挪车码（POST），完成后跳转下载该批次的 PDF 打印文件。"""
+    user = current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
+    try:
+        codes = bulk_create_codes(db, user.id, count, name_prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return RedirectResponse(
+        url=f"/codes/sheet.pdf?from_id={codes[0].id}&to_id={codes[-1].id}",
+        status_code=status.HTTP_302_FOUND,
+    )
+
+
+@router.get("/codes/sheet.{fmt}")
+def code_sheet(
+    request: Request,
+    fmt: str,
+    from_id: int | None = None,
+    to_id: int | None = None,
+    db: Session = Depends(get_read_db),
+):
+    """A4 多联打印文件（PDF/SVG，矢量二维码），可按 id 区间选择挪车码；逐页渲染并流式返回。"""
+    if fmt not in SHEET_MEDIA_TYPES:
+        raise HTTPException(status_code=404)
+    user = current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
+    stickers = owner_stickers(db, user.id, _get_base_url(request, db), from_id, to_id)
+    if not stickers:
+        raise HTTPException(status_code=404, detail="No codes")
+    return StreamingResponse(
+        sheet_renderer.iter_sheet(fmt, stickers),
+        media_type=SHEET_MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f"attachment; filename=movecar-sheet.{fmt}"},
+    )
+
+
 @router.post("/codes/{code_id}/toggle")
 def code_toggle(request: Request, code_id: int, db: Session = Depends(get_db)):
     """切换挪车码启用/暂停状态。"""
@@ -203,14 +310,16 @@ def code_toggle(request: Request, code_id: int, db: Session = Depends(get_db)):
     code = db.query(Code).filter(Code.id == code_id, Code.owner_id == user.id).first()
     if not code:
         raise HTTPException(status_code=404)
+    public_code = code.public_code
     code.status = "PAUSED" if code.status == "ACTIVE" else "ACTIVE"
     db.commit()
+    invalidate_code(public_code)
     return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
 
 
 @router.post("/codes/{code_id}/delete")
 def code_delete(request: Request, code_id: int, db: Session = Depends(get_db)):
-    """删除挪车码及其关联数据（留言、黑名单）。"""
+    """删除挪车码及其关联数据（留言、黑名单、留言图片文件）。"""
     user = current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
@@ -219,13 +328,20 @@ def code_delete(request: Request, code_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404)
     # 删除该码下的黑名单记录与消息（消息已通过 ORM 级联，黑名单显式删除）
     db.query(Blacklist).filter(Blacklist.code_id == code.id).delete(synchronize_session=False)
+    public_code = code.public_code
+    media = code_media_paths(db, code.id)
+    bump_change_seq(db, user.id)
     db.delete(code)
     db.commit()
+    invalidate_code(public_code)
+    blacklist_index.drop_code(code_id)
+    # 提交成功后再删除该码留言引用的图片文件
+    remove_media_files(media)
     return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
 
 
 @router.get("/codes/{code_id}/notify", response_class=HTMLResponse)
-def code_notify_page(request: Request, code_id: int, db: Session = Depends(get_db)):
+def code_notify_page(request: Request, code_id: int, db: Session = Depends(get_read_db)):
     """通知设置页面（Bark/无）。"""
     user = current_user(request, db)
     if not user:
@@ -234,8 +350,6 @@ def code_notify_page(request: Request, code_id: int, db: Session = Depends(get_d
     if not code:
         raise HTTPException(status_code=404)
     pref = db.query(CodeNotifyPref).filter(CodeNotifyPref.code_id == code.id).first()
-    setting = db.query(AppSetting).first()
-    site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
     return templates.TemplateResponse(
         request,
         "notify.html",
@@ -248,8 +362,9 @@ def code_notify_page(request: Request, code_id: int, db: Session = Depends(get_d
             "saved": request.query_params.get("saved"),
             "test": request.query_params.get("test"),
             "test_msg": request.query_params.get("msg"),
-            "site_title": site_title,
-            "site_footer_html": _site_footer(db),
+            "last_test_at": pref.last_test_at if pref else None,
+            "last_test_ok": pref.last_test_ok if pref else None,
+            **_site_vars(db),
         },
     )
 
@@ -281,7 +396,9 @@ def code_notify_save(
     else:
         pref.bark_base_url = None
         pref.bark_token = None
+    public_code = code.public_code
     db.commit()
+    invalidate_code(public_code)
     return RedirectResponse(url=f"/codes/{code_id}/notify?saved=1", status_code=status.HTTP_302_FOUND)
 
 
@@ -292,75 +409,153 @@ def code_notify_test(
     channel: str = Form(None),
     bark_base_url: str = Form(None),
     bark_token: str = Form(None),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    """发送测试通知：优先使用页面填写的配置，未填写则使用已保存配置。"""
+    """发送测试通知：优先使用页面填写的配置，未填写则使用已保存配置。
+
+    查询走只读会话，并在发起网络请求前关闭；测试结果在发送完成后的独立短事务中写入，
+    Bark 响应慢时不会占用写连接。
+    """
     user = current_user(request, db)
     if not user:
         return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
-    code = db.query(Code).filter(Code.id == code_id, Code.owner_id == user.id).first()
+    code = db.query(Code.id).filter(Code.id == code_id, Code.owner_id == user.id).first()
     if not code:
         raise HTTPException(status_code=404)
+    pref = db.query(CodeNotifyPref).filter(CodeNotifyPref.code_id == code_id).first()
+    pref_id = pref.id if pref else None
     # 优先使用表单中传来的配置进行临时测试；否则回退到已保存的配置
     if (channel or "").upper() == "BARK" and (bark_base_url and bark_token):
         base = bark_base_url.strip() or "https://api.day.app"
         token = bark_token.strip()
     else:
-        pref = db.query(CodeNotifyPref).filter(CodeNotifyPref.code_id == code.id).first()
         if not pref or pref.channel != "BARK":
             return RedirectResponse(url=f"/codes/{code_id}/notify?test=0&msg=未配置Bark", status_code=status.HTTP_302_FOUND)
         base = (pref.bark_base_url or "https://api.day.app").strip()
         token = (pref.bark_token or "").strip()
+    db.close()
     dashboard_url = str(request.base_url).rstrip("/") + "/dashboard"
-    ok, msg = send_bark(base, token, "测试通知", "这是一条测试通知", dashboard_url)
+    # 在事件循环上执行异步发送，复用共享连接池（当前函数运行于线程池）
+    ok, msg = anyio.from_thread.run(send_bark_async, base, token, "测试通知", "这是一条测试通知", dashboard_url)
+    if pref_id is not None:
+        _record_notify_test(pref_id, ok)
     flag = "1" if ok else "0"
     return RedirectResponse(url=f"/codes/{code_id}/notify?test={flag}&msg={msg}", status_code=status.HTTP_302_FOUND)
 
 
+def _record_notify_test(pref_id: int, ok: bool) -> None:
+    """记录最近一次测试通知的结果（独立短事务）。"""
+    from ..database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        db.query(CodeNotifyPref).filter(CodeNotifyPref.id == pref_id).update(
+            {CodeNotifyPref.last_test_at: datetime.utcnow(), CodeNotifyPref.last_test_ok: ok},
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+@router.get("/codes/{code_id}/chat", response_class=HTMLResponse)
+def code_chat_page(request: Request, code_id: int, db: Session = Depends(get_read_db)):
+    """车主聊天页（`ANON_CHAT_ENABLED` 开启时可用）：与正在扫码的访客实时对话。"""
+    user = current_user(request, db)
+    if not user:
+        return RedirectResponse(url="/login", status_code=status.HTTP_302_FOUND)
+    if not chat_enabled():
+        raise HTTPException(status_code=404)
+    code = db.query(Code).filter(Code.id == code_id, Code.owner_id == user.id).first()
+    if not code:
+        raise HTTPException(status_code=404)
+    return templates.TemplateResponse(
+        request,
+        "chat.html",
+        {"session": request.session, "code": code, **_site_vars(db)},
+    )
+
+
 @router.get("/print/{public_code}", response_class=HTMLResponse)
-def print_page(request: Request, public_code: str, db: Session = Depends(get_db)):
+def print_page(request: Request, public_code: str, db: Session = Depends(get_read_db)):
     """打印页：展示二维码与下载按钮、备用链接与打印按钮。"""
     code = db.query(Code).filter(Code.public_code == public_code).first()
     if not code:
         raise HTTPException(status_code=404)
     base = _get_base_url(request, db)
     url = f"{base}/c/{public_code}"
-    setting = db.query(AppSetting).first()
-    site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
     return templates.TemplateResponse(
         request,
         "print.html",
-        {"session": request.session, "code": code, "url": url, "site_title": site_title, "site_footer_html": _site_footer(db)},
+        {"session": request.session, "code": code, "url": url, **_site_vars(db)},
     )
 
 
-@router.get("/qr/{public_code}.png")
-def qr_png(
-    request: Request,
-    public_code: str,
-    scale: int = 8,
-    border: int = 2,
-    db: Session = Depends(get_db),
-):
-    """生成二维码 PNG（即使 DB 无记录也生成，扫描时再校验）。"""
-    # 若数据库中不存在该 code，也允许生成二维码（扫描时再校验）
-    # 这样避免打印页或直链因为 DB 差异导致 404
-    try:
-        _ = db.query(Code).filter(Code.public_code == public_code).first()
-    except Exception:
-        _ = None
-    # 优先使用路由反解获得落地页绝对 URL
+def _qr_target(public_code: str, site_base: str, request_base: str) -> tuple[str, bool]:
+    """返回 (二维码内容 URL, 地址是否来自配置)。
+
+    站点地址顺序与打印页一致：后台配置 -> APP_BASE_URL -> 请求来源。
+    仅当地址来自配置（与请求 Host 无关）时允许写入磁盘缓存并长期缓存。
+    """
+    base = site_base or os.getenv("APP_BASE_URL", "").strip().rstrip("/")
+    return f"{base or request_base}/c/{public_code}", bool(base)
+
+
+def _qr_source(public_code: str, request_base: str) -> tuple[str, bool] | None:
+    """校验码存在并返回 `_qr_target` 的结果；不存在返回 None（访问数据库，运行于线程池）。"""
+    from ..database import ReadSessionLocal
+
+    db = ReadSessionLocal()
     try:
-        url = str(request.url_for("landing", public_code=public_code))
-    except Exception:
-        base = os.getenv("APP_BASE_URL", str(request.base_url).rstrip("/"))
-        url = f"{base}/c/{public_code}"
-    qr = segno.make(url, error="m")
-    buf = io.BytesIO()
-    qr.save(buf, kind="png", scale=max(2, min(scale, 20)), border=max(0, min(border, 8)))
-    data = buf.getvalue()
-    headers = {"Content-Disposition": f"inline; filename=movecar-{public_code}.png"}
-    return Response(content=data, media_type="image/png", headers=headers)
+        if resolve_code(db, public_code) is None:
+            return None
+        site_base = get_site_context(db).base_url
+    finally:
+        db.close()
+    return _qr_target(public_code, site_base, request_base)
+
+
+async def _qr_response(request: Request, public_code: str, kind: str, scale: int, border: int) -> Response:
+    """返回（缓存的）二维码，支持 ETag / If-None-Match 条件请求。
+
+    只为已存在的码生成（未知码 404），避免任意请求填满渲染缓存。
+    码与站点上下文均命中进程内缓存时直接在事件循环内解析，否则（需查库）与渲染一样进入线程池。
+    地址取自请求 Host 时响应随 Host 变化：附加 `Vary: Host` 并只短期缓存。
+    """
+    request_base = str(request.base_url).rstrip("/")
+    site = peek_site_context()
+    if site is not None and code_cache.get(public_code) is not None:
+        source = _qr_target(public_code, site.base_url, request_base)
+    else:
+        source = await run_in_threadpool(_qr_source, public_code, request_base)
+    if source is None:
+        raise HTTPException(status_code=404)
+    url, persist = source
+    scale = max(2, min(scale, 20))
+    border = max(0, min(border, 8))
+    img = qr_cache.peek(url, kind, scale, border)
+    if img is None:
+        img = await run_in_threadpool(qr_cache.get, url, kind, scale, border, persist)
+    max_age = os.getenv("QR_CACHE_MAX_AGE", "2592000") if persist else os.getenv("QR_CACHE_HOST_MAX_AGE", "300")
+    headers = {"ETag": img.etag, "Cache-Control": f"public, max-age={int(max_age)}"}
+    if not persist:
+        headers["Vary"] = "Host"
+    if etag_matches(request.headers.get("if-none-match"), img.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    headers["Content-Disposition"] = f"inline; filename=movecar-{public_code}.{kind}"
+    return Response(content=img.data, media_type=img.media_type, headers=headers)
+
+
+@router.get("/qr/{public_code}.png")
+async def qr_png(request: Request, public_code: str, scale: int = 8, border: int = 2):
+    """生成二维码 PNG（带缓存与 ETag）。"""
+    return await _qr_response(request, public_code, "png", scale, border)
+
+
+@router.get("/qr/{public_code}.svg")
+async def qr_svg(request: Request, public_code: str, scale: int = 8, border: int = 2):
+    """生成二维码 SVG（矢量，适合高质量打印）。"""
+    return await _qr_response(request, public_code, "svg", scale, border)
 
 
 @router.post("/settings/site")
@@ -387,6 +582,7 @@ def save_site_base_url(
         setting.site_title = title or None
         setting.footer_html = footer or None
     db.commit()
+    invalidate_site_context()
     return RedirectResponse(url="/dashboard?saved=1", status_code=status.HTTP_302_FOUND)
 
 
@@ -395,12 +591,9 @@ def _get_base_url(request: Request, db: Session) -> str:
 
     顺序：AppSetting.site_base_url -> APP_BASE_URL -> request.base_url
     """
-    try:
-        setting = db.query(AppSetting).first()
-        if setting and setting.site_base_url:
-            return setting.site_base_url.rstrip("/")
-    except Exception:
-        pass
+    site = get_site_context(db)
+    if site.base_url:
+        return site.base_url
     base_env = os.getenv("APP_BASE_URL", "").strip().rstrip("/")
     if base_env:
         return base_env
@@ -408,12 +601,10 @@ def _get_base_url(request: Request, db: Session) -> str:
 
 
 @router.get("/c/{public_code}", response_class=HTMLResponse)
-def landing(request: Request, public_code: str, db: Session = Depends(get_db)):
+def landing(request: Request, public_code: str, db: Session = Depends(get_read_db)):
     """扫码落地页：展示留言表单（免登录）。"""
-    code = db.query(Code).filter(Code.public_code == public_code, Code.status == "ACTIVE").first()
-    if not code:
-        setting = db.query(AppSetting).first()
-        site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
+    code = resolve_code(db, public_code)
+    if not code or not code.active:
         return templates.TemplateResponse(
             request,
             "landing.html",
@@ -421,12 +612,9 @@ def landing(request: Request, public_code: str, db: Session = Depends(get_db)):
                 "session": request.session,
                 "error": "Code not found or inactive",
                 "code": None,
-                "site_title": site_title,
-                "site_footer_html": _site_footer(db),
+                **_site_vars(db),
             },
         )
-    setting = db.query(AppSetting).first()
-    site_title = (setting.site_title if setting and setting.site_title else "Move Car 挪车码")
     return templates.TemplateResponse(
         request,
         "landing.html",
@@ -434,8 +622,8 @@ def landing(request: Request, public_code: str, db: Session = Depends(get_db)):
             "session": request.session,
             "error": None,
             "code": code,
-            "site_title": site_title,
-            "site_footer_html": _site_footer(db),
+            "chat_enabled": chat_enabled(),
+            **_site_vars(db),
         },
     )
 
@@ -449,59 +637,90 @@ def submit_message(
     db: Session = Depends(get_db),
 ):
     """提交留言（文本 + 可选图片）。带黑名单/频控校验，并在成功后触发通知。"""
-    code = db.query(Code).filter(Code.public_code == public_code, Code.status == "ACTIVE").first()
-    if not code:
+    code = resolve_code(db, public_code)
+    if not code or not code.active:
         raise HTTPException(status_code=404, detail="Code not found or inactive")
-    client_ip = request.client.host if request.client else "0.0.0.0"
-    if client_ip in ("testclient", "localhost"):
-        client_ip = "127.0.0.1"
-    # blacklist check (support common local aliases for tests)
-    ip_hashes = {hash_ip(client_ip), hash_ip("127.0.0.1"), hash_ip("localhost"), hash_ip("testclient")}
-    if db.query(Blacklist).filter(Blacklist.code_id == code.id, Blacklist.ip_hash.in_(ip_hashes)).first():
+    client_ip = normalize_ip(request.client.host if request.client else None)
+    ip_hash = ip_hasher.hash(client_ip)
+    # 黑名单：查进程内索引（码级 + 全局，含过期判断），不访问数据库；
+    # 候选哈希包含轮换过渡期的旧密钥与旧格式，升级/换密钥前的条目继续生效
+    if blacklist_index.is_blocked_any(code.id, ip_hasher.candidates(client_ip)):
         raise HTTPException(status_code=403, detail="Forbidden")
     # rate limit
-    if not rate_limiter.allow((client_ip, code.public_code)):
-        raise HTTPException(status_code=429, detail="Too Many Requests")
-    # save image if any
-    image_path = None
+    decision = rate_limiter.check((client_ip, code.public_code))
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too Many Requests",
+            headers={"Retry-After": str(max(1, math.ceil(decision.retry_after)))},
+        )
+    # save image if any：分块写入私有暂存目录，超限立即中止；留言提交成功后交给图片流水线，
+    # 去除元数据后才发布到 /media 并回写 image_path（原图从不对外提供）
+    staged = None
     if uploaded and uploaded.filename:
         content_type = uploaded.content_type or ""
         if content_type not in ("image/jpeg", "image/png", "image/webp"):
             raise HTTPException(status_code=400, detail="Unsupported image type")
-        data_dir, uploads_dir = ensure_dirs()
+        # 以文件头魔数为准，不信任客户端声明的类型
+        kind = sniff_image_type(uploaded.file.read(16))
+        uploaded.file.seek(0)
+        if kind is None:
+            raise HTTPException(status_code=400, detail="Unsupported image type")
         import secrets
 
-        fname = f"{code.id}_{secrets.token_hex(8)}"
-        ext = ".jpg" if content_type == "image/jpeg" else ".png" if content_type == "image/png" else ".webp"
-        full = os.path.join(uploads_dir, fname + ext)
-        content = uploaded.file.read()
-        max_mb = int(os.getenv("MAX_IMAGE_MB", "5"))
-        if len(content) > max_mb * 1024 * 1024:
+        fname = secrets.token_hex(8) + IMAGE_EXTENSIONS[kind]
+        try:
+            staged = stage_upload(uploaded.file, os.path.join(incoming_dir(), fname), max_image_bytes())
+        except UploadTooLarge:
             raise HTTPException(status_code=400, detail="Image too large")
-        with open(full, "wb") as f:
-            f.write(content)
-        image_path = f"/media/{fname}{ext}"  # 通过 /media 挂载对外可访问
 
     msg = Message(
         code_id=code.id,
         sender="SCANNER",
         content_text=(content_text or "").strip() or None,
-        image_path=image_path,
-        ip_hash=hash_ip(client_ip),
+        ip_hash=ip_hash,
     )
+    # 缓存的码记录可能滞后于其它 worker 的停用/删除：写事务内以数据库为准复核（兼递增变更计数）
+    if not claim_active_code(db, code):
+        db.rollback()
+        if staged:
+            staged.discard()
+        invalidate_code(public_code)
+        raise HTTPException(status_code=404, detail="Code not found or inactive")
     db.add(msg)
-    db.commit()
-    # 触发通知（可选）
-    pref = db.query(CodeNotifyPref).filter(CodeNotifyPref.code_id == code.id).first()
-    if pref and pref.channel == "BARK" and pref.bark_token:
-        try:
-            dash_url = str(request.base_url).rstrip("/") + "/dashboard"
-            preview = (content_text or "(图片留言)")[:60]
-            # 通知流控：前 3 次不限制，之后每 30 秒最多 1 次
-            if allow_notify(("BARK", code.id)):
-                send_bark(pref.bark_base_url or "https://api.day.app", pref.bark_token, "挪车提醒", preview, dash_url)
-        except Exception:
-            pass
+    # 通知（可选）：写入发件箱，与留言同事务提交；由后台投递器异步发送，不阻塞扫码者
+    queued = False
+    if code.notify_channel == "BARK" and code.bark_token:
+        # 同一码短时间内的多条留言由发件箱合并为一条摘要推送
+        dash_url = str(request.base_url).rstrip("/") + "/dashboard"
+        preview = (content_text or "(图片留言)")[:60]
+        enqueue_notification(
+            db, msg, "BARK", code.bark_base_url or "https://api.day.app", code.bark_token, "挪车提醒", preview, dash_url
+        )
+        queued = True
+    # 仅当车主开着仪表盘时才构造实时事件（flush 取得 id/时间，仍与提交同一事务）
+    live = event_broker.has_subscribers(code.owner_id)
+    try:
+        if live or staged:
+            db.flush()
+            msg_id = msg.id
+        if live:
+            event = _message_event(msg, code)
+        db.commit()
+    except Exception:
+        if staged:
+            staged.discard()
+        raise
+    if staged:
+        # 暂存文件名带上留言 id：进程退出时未处理完的原图在下次启动时可重新处理
+        staged.commit(os.path.join(os.path.dirname(staged.final_path), f"{msg_id}_{os.path.basename(staged.final_path)}"))
+        # 后台进程池：去除 EXIF、缩放重编码并生成缩略图，发布到 /media 后回写留言。
+        # 提交后不再访问 msg（避免过期刷新重新占用写连接），回写在流水线自己的短事务中进行
+        image_pipeline.submit(msg_id, staged.final_path, ensure_dirs()[1])
+    if queued:
+        outbox_dispatcher.wake()
+    if live:
+        event_broker.publish(code.owner_id, "message", event)
     return RedirectResponse(url=f"/c/{public_code}?ok=1", status_code=status.HTTP_302_FOUND)
 
 
@@ -518,6 +737,11 @@ def mark_processed(request: Request, msg_id: int, db: Session = Depends(get_db))
     )
     if not msg:
         raise HTTPException(status_code=404)
+    was_processed, code_id = msg.processed, msg.code_id
     msg.processed = True
+    if not was_processed:
+        bump_change_seq(db, user.id)
     db.commit()
+    if not was_processed:
+        event_broker.publish(user.id, "processed", {"id": msg_id, "code_id": code_id})
     return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
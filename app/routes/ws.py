@@ -0,0 +1,141 @@
+"""WebSocket 路由：匿名聊天（`ANON_CHAT_ENABLED` 开启时可用）。
+
+- `WS /ws/chat/{public_code}`：扫码者，免登录；连接前校验码状态与黑名单，发送受聊天限流约束；
+- `WS /ws/owner/{code_id}`：车主，依据会话登录态并校验码归属。
+
+协议（JSON 文本帧）：客户端发送 `{"text": "..."}`；服务端推送
+`{"type": "message", "sender": "SCANNER"|"OWNER", "text", "ts"}`、`{"type": "presence", "owner_online"}`、
+`{"type": "error", "detail", "retry_after"?, "text"?}`（`text` 为落库失败、未保存的那条消息）。空闲超过 `CHAT_IDLE_SEC`（默认 600 秒）自动断开。
+"""
+
+import asyncio
+import json
+import math
+import os
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from starlette.concurrency import run_in_threadpool
+
+from ..services.blacklist import blacklist_index
+from ..services.chat import OWNER, SCANNER, ChatConnection, chat_enabled, chat_hub, max_text_len
+from ..services.codes import code_cache, resolve_code
+from ..services.iphash import ip_hasher
+from ..services.rate_limit import MemoryBackend, RateLimiter, make_backend
+from ..utils import normalize_ip
+
+
+router = APIRouter()
+# 聊天限流：复用留言限流器实现（GCRA，可选 sqlite 共享后端），配额单独配置
+chat_limiter = RateLimiter(make_backend(
+    window=int(os.getenv("CHAT_RATE_WINDOW", "10")),
+    count=int(os.getenv("CHAT_RATE_COUNT", "5")),
+), name="chat")
+# 1008：策略拒绝；1013：服务端繁忙，稍后重试
+POLICY_VIOLATION = 1008
+TRY_AGAIN_LATER = 1013
+
+
+def _load_code(public_code: str):
+    from ..database import ReadSessionLocal
+
+    db = ReadSessionLocal()
+    try:
+        return resolve_code(db, public_code)
+    finally:
+        db.close()
+
+
+def _load_owner_code(owner_id: int, code_id: int):
+    from ..database import ReadSessionLocal
+    from ..models import Code
+
+    db = ReadSessionLocal()
+    try:
+        row = db.query(Code.public_code).filter(Code.id == code_id, Code.owner_id == owner_id).first()
+        return resolve_code(db, row[0]) if row else None
+    finally:
+        db.close()
+
+
+async def _pump(websocket: WebSocket, conn: ChatConnection, rate_key=None, ip_hash: str | None = None) -> None:
+    """读取客户端消息并交给中枢，直到断开或空闲超时。"""
+    idle = float(os.getenv("CHAT_IDLE_SEC", "600"))
+    limit = max_text_len()
+    while not conn.closed:
+        try:
+            async with asyncio.timeout(idle):
+                raw = await websocket.receive_text()
+        except (TimeoutError, WebSocketDisconnect):
+            return
+        try:
+            text = str(json.loads(raw).get("text", ""))
+        except (ValueError, AttributeError):
+            text = raw
+        text = text.strip()
+        if not text:
+            continue
+        if len(text) > limit:
+            conn.offer(json.dumps({"type": "error", "detail": f"消息过长（最多 {limit} 字）"}, ensure_ascii=False))
+            continue
+        if rate_key is not None:
+            # memory 后端为进程内 O(1) 判定；其他后端（sqlite）会阻塞，放到线程池
+            if isinstance(chat_limiter.backend, MemoryBackend):
+                decision = chat_limiter.check(rate_key)
+            else:
+                decision = await run_in_threadpool(chat_limiter.check, rate_key)
+            if not decision.allowed:
+                conn.offer(json.dumps({
+                    "type": "error",
+                    "detail": "发送过于频繁",
+                    "retry_after": max(1, math.ceil(decision.retry_after)),
+                }, ensure_ascii=False))
+                continue
+        if not chat_hub.post(conn, text, ip_hash):
+            conn.offer(json.dumps({"type": "error", "detail": "服务繁忙，请稍后再试"}, ensure_ascii=False))
+
+
+@router.websocket("/ws/chat/{public_code}")
+async def scanner_chat(websocket: WebSocket, public_code: str):
+    """扫码者聊天连接。"""
+    if not chat_enabled():
+        await websocket.close(POLICY_VIOLATION)
+        return
+    code = code_cache.get(public_code) or await run_in_threadpool(_load_code, public_code)
+    if not code or not code.active:
+        await websocket.close(POLICY_VIOLATION)
+        return
+    client_ip = normalize_ip(websocket.client.host if websocket.client else None)
+    if blacklist_index.is_blocked_any(code.id, ip_hasher.candidates(client_ip)):
+        await websocket.close(POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    conn = chat_hub.join(websocket, SCANNER, code)
+    if conn is None:
+        await websocket.close(TRY_AGAIN_LATER)
+        return
+    try:
+        await _pump(websocket, conn, (client_ip, code.public_code, "chat"), ip_hasher.hash(client_ip))
+    finally:
+        await chat_hub.leave(conn)
+
+
+@router.websocket("/ws/owner/{code_id}")
+async def owner_chat(websocket: WebSocket, code_id: int):
+    """车主聊天连接（需登录且为该码所有者）。"""
+    uid = websocket.session.get("user_id") if "session" in websocket.scope else None
+    if not chat_enabled() or not uid:
+        await websocket.close(POLICY_VIOLATION)
+        return
+    code = await run_in_threadpool(_load_owner_code, uid, code_id)
+    if code is None:
+        await websocket.close(POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    conn = chat_hub.join(websocket, OWNER, code)
+    if conn is None:
+        await websocket.close(TRY_AGAIN_LATER)
+        return
+    try:
+        await _pump(websocket, conn)
+    finally:
+        await chat_hub.leave(conn)
@@ -0,0 +1,160 @@
+"""黑名单内存索引（扫码热路径）。
+
+留言提交时的黑名单校验不再查询数据库，而是查进程内索引：
+- 键为 (code_id, ip_hash)，`code_id` 为 None 表示全局条目，对所有码生效；
+- 值为过期时间（`Blacklist.until`，None 表示永久），查询时过期条目视为不存在；
+- 启动时全量加载；`/api/v1/blocklist` 写入、删除码后增量更新；
+- lifespan 中的后台任务每 `BLACKLIST_RELOAD_SEC`（默认 60 秒）压缩过期条目并全量重载，
+  多 worker 部署时其他进程写入的条目在该间隔内生效。
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections.abc import Iterable
+from contextlib import suppress
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from .metrics import blacklist_checks
+
+
+def _epoch(dt: datetime | None) -> float | None:
+    """naive UTC 时间（与 `datetime.utcnow()` 一致）转为时间戳。"""
+    if dt is None:
+        return None
+    return (dt - datetime(1970, 1, 1)).total_seconds()
+
+
+class BlacklistIndex:
+    """(code_id | None, ip_hash) -> 过期时间戳（None 为永久）。"""
+
+    def __init__(self, reload_interval: float = 60.0):
+        self.reload_interval = reload_interval
+        self._entries: dict[tuple[int | None, str], float | None] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+        # 全量加载期间的增量写入，加载完成时合并，避免被旧快照覆盖
+        self._recent: dict[tuple[int | None, str], float | None] | None = None
+        self._task: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def load(self, db: Session | None = None) -> int:
+        """从数据库全量加载（跳过已过期条目），返回条目数。"""
+        from ..models import Blacklist
+
+        with self._lock:
+            self._recent = {}
+        own = db is None
+        if own:
+            from ..database import ReadSessionLocal
+
+            db = ReadSessionLocal()
+        try:
+            now = time.time()
+            entries: dict[tuple[int | None, str], float | None] = {}
+            for code_id, ip_hash, until in db.query(Blacklist.code_id, Blacklist.ip_hash, Blacklist.until):
+                exp = _epoch(until)
+                if exp is not None and exp <= now:
+                    continue
+                key = (code_id, ip_hash)
+                if key in entries:
+                    # 同一键多条记录：取最长的有效期
+                    prev = entries[key]
+                    exp = None if prev is None or exp is None else max(prev, exp)
+                entries[key] = exp
+        except BaseException:
+            with self._lock:
+                self._recent = None
+            raise
+        finally:
+            if own:
+                db.close()
+        with self._lock:
+            entries.update(self._recent or {})
+            self._recent = None
+            self._entries = entries
+            self._loaded = True
+        return len(entries)
+
+    def ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def is_blocked(self, code_id: int, ip_hash: str, now: float | None = None) -> bool:
+        """该 IP 哈希是否被此码或全局拉黑（未过期）。"""
+        self.ensure_loaded()
+        now = time.time() if now is None else now
+        entries = self._entries
+        for key in ((code_id, ip_hash), (None, ip_hash)):
+            if key in entries:
+                exp = entries[key]
+                if exp is None or exp > now:
+                    return True
+        return False
+
+    def is_blocked_any(self, code_id: int, ip_hashes: Iterable[str], now: float | None = None) -> bool:
+        """任一候选哈希（当前密钥/旧密钥/旧格式）被拉黑即视为拉黑。"""
+        now = time.time() if now is None else now
+        blocked = any(self.is_blocked(code_id, h, now) for h in ip_hashes)
+        blacklist_checks.inc(("hit" if blocked else "miss",))
+        return blocked
+
+    def add(self, code_id: int | None, ip_hash: str, until: datetime | None = None) -> None:
+        """增量添加（数据库提交成功后调用）。"""
+        exp = _epoch(until)
+        with self._lock:
+            key = (code_id, ip_hash)
+            if key in self._entries:
+                prev = self._entries[key]
+                exp = None if prev is None or exp is None else max(prev, exp)
+            self._entries[key] = exp
+            if self._recent is not None:
+                self._recent[key] = exp
+
+    def drop_code(self, code_id: int) -> None:
+        """删除某码的全部条目（码被删除后调用）。"""
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if k[0] != code_id}
+
+    def compact(self, now: float | None = None) -> int:
+        """移除已过期条目，返回移除数量。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            before = len(self._entries)
+            self._entries = {k: v for k, v in self._entries.items() if v is None or v > now}
+            return before - len(self._entries)
+
+    def clear(self) -> None:
+        """清空并标记为未加载（数据库重建后调用，下次查询时重新加载）。"""
+        with self._lock:
+            self._entries = {}
+            self._loaded = False
+
+    # ---- 后台压缩与重载（lifespan） ----
+
+    async def start(self) -> None:
+        if self._task is None and self.reload_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.compact()
+            with suppress(Exception):
+                await asyncio.to_thread(self.load)
+
+
+blacklist_index = BlacklistIndex(reload_interval=float(os.getenv("BLACKLIST_RELOAD_SEC", "60")))
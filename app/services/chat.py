@@ -0,0 +1,368 @@
+"""匿名聊天（WebSocket）：按挪车码分房间的异步消息中枢。
+
+开关 `ANON_CHAT_ENABLED`（默认关闭）。每个码一个房间，房间内有车主与若干扫码者：
+- 扫码者的消息只发给车主（及其本人回显），扫码者之间互不可见；车主的回复发给房间内全部扫码者；
+- 每个连接一个有界发送队列（`CHAT_SEND_QUEUE`，默认 32 条）与一个发送协程，广播只做非阻塞入队；
+  队列满（客户端读得太慢）时断开该连接（1013），不拖慢房间内其他人，每连接内存有上限；
+- 连接总数上限 `CHAT_MAX_CONNECTIONS`（默认 5000），单房间上限 `CHAT_ROOM_MAX`（默认 16）；
+- 消息落库（`messages`，`sender` 为 SCANNER/OWNER）由 `ChatWriter` 批量写入：
+  累积到 `CHAT_BATCH`（默认 100）条或等待 `CHAT_FLUSH_MS`（默认 200 毫秒）后一次事务提交；
+  写入队列有界（`CHAT_WRITE_QUEUE`，默认 10000），满时拒绝新消息；整批写入失败时重试一次，
+  仍失败则记录日志与指标（`movecar_chat_write_failures_total`），并向仍在线的发送者推送 error 帧告知消息未保存。
+  扫码者消息在车主不在线时写入通知发件箱（按码合并推送），并推送到仪表盘实时事件流。
+"""
+
+import asyncio
+import json
+import logging
+import os
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from starlette.websockets import WebSocket
+
+from .metrics import chat_write_failures
+
+
+logger = logging.getLogger(__name__)
+SCANNER = "SCANNER"
+OWNER = "OWNER"
+
+
+def chat_enabled() -> bool:
+    return os.getenv("ANON_CHAT_ENABLED", "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+def max_text_len() -> int:
+    return int(os.getenv("CHAT_MAX_LEN", "500"))
+
+
+class ChatConnection:
+    """单个 WebSocket 连接：有界发送队列 + 发送协程。"""
+
+    __slots__ = ("ws", "role", "room", "queue", "task", "closed")
+
+    def __init__(self, ws: WebSocket, role: str, queue_size: int):
+        self.ws = ws
+        self.role = role
+        self.room: "Room | None" = None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: asyncio.Task | None = None
+        self.closed = False
+
+    def offer(self, text: str) -> bool:
+        """非阻塞入队；队列满返回 False（调用方断开该连接）。"""
+        if self.closed:
+            return True
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _sender(self) -> None:
+        try:
+            while True:
+                text = await self.queue.get()
+                if text is None:
+                    return
+                await self.ws.send_text(text)
+        except Exception:
+            self.closed = True
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._sender())
+
+    async def close(self, code: int = 1000) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        if self.task is not None:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await self.task
+        with suppress(Exception):
+            await self.ws.close(code)
+
+
+@dataclass(slots=True)
+class Room:
+    """某码的聊天房间。"""
+    code_id: int
+    owner_id: int
+    label: str
+    notify_channel: str
+    bark_base_url: str | None
+    bark_token: str | None
+    owners: set
+    scanners: set
+
+    @property
+    def owner_online(self) -> bool:
+        return bool(self.owners)
+
+    def __len__(self) -> int:
+        return len(self.owners) + len(self.scanners)
+
+
+@dataclass(slots=True)
+class PendingMessage:
+    """待落库的聊天消息。"""
+    code_id: int
+    owner_id: int
+    label: str
+    sender: str
+    text: str
+    ip_hash: str | None
+    created_at: datetime
+    notify: tuple | None = None  # (channel, base_url, token) 车主不在线时推送
+    conn: ChatConnection | None = None  # 发送者连接，写入失败时通知
+
+
+class ChatWriter:
+    """聊天消息批量落库（单后台协程，按条数或时间窗口合并为一个事务）。"""
+
+    RETRY_DELAY = 0.5
+
+    def __init__(self, batch_size: int = 100, flush_ms: float = 200.0, max_pending: int = 10000):
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_ms) / 1000
+        self.max_pending = max_pending
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self.written = 0
+
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._task = asyncio.create_task(self._run())
+
+    async def start(self) -> None:
+        self._ensure_started()
+
+    def submit(self, item: PendingMessage) -> bool:
+        """入队等待批量写入；队列已满返回 False。"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def flush(self) -> None:
+        """等待已入队的消息全部写入。"""
+        if self._queue is not None and self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        await self.flush()
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    async def _run(self) -> None:
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    async with asyncio.timeout(timeout):
+                        batch.append(await queue.get())
+                except TimeoutError:
+                    break
+            try:
+                await self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _write_batch(self, batch: list[PendingMessage]) -> None:
+        """写入一批；失败重试一次，仍失败时告知发送者消息未保存。"""
+        for attempt in range(2):
+            try:
+                rows = await asyncio.to_thread(self._write, batch)
+            except Exception:
+                if attempt == 0:
+                    chat_write_failures.inc(("retried",), len(batch))
+                    await asyncio.sleep(self.RETRY_DELAY)
+                    continue
+                logger.exception("chat batch write failed, dropping %d messages", len(batch))
+                chat_write_failures.inc(("dropped",), len(batch))
+                for p in batch:
+                    if p.conn is not None:
+                        p.conn.offer(_frame("error", detail="消息保存失败，请重新发送", text=p.text))
+                return
+            self.written += len(batch)
+            _publish_rows(rows)
+            return
+
+    @staticmethod
+    def _write(batch: list[PendingMessage]) -> list[tuple[PendingMessage, int]]:
+        """一个事务写入整批消息，返回 [(消息, id)]。"""
+        from ..database import SessionLocal
+        from ..models import Message
+        from .feed import bump_change_seq
+        from .outbox import enqueue_notification
+
+        db = SessionLocal()
+        try:
+            msgs = [
+                Message(
+                    code_id=p.code_id,
+                    sender=p.sender,
+                    content_text=p.text,
+                    ip_hash=p.ip_hash,
+                    # 车主回复无需“标记处理”
+                    processed=p.sender == OWNER,
+                    created_at=p.created_at,
+                )
+                for p in batch
+            ]
+            db.add_all(msgs)
+            # 车主回复不出现在留言列表中，不影响其变更计数
+            bump_change_seq(db, *{p.owner_id for p in batch if p.sender == SCANNER})
+            for p, m in zip(batch, msgs):
+                if p.notify:
+                    channel, base_url, token = p.notify
+                    enqueue_notification(db, m, channel, base_url, token, "挪车提醒", f"[聊天] {p.text[:60]}", None)
+            db.flush()
+            rows = [(p, m.id) for p, m in zip(batch, msgs)]
+            db.commit()
+            return rows
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+def _publish_rows(rows: list[tuple[PendingMessage, int]]) -> None:
+    """扫码者消息推送到车主的仪表盘实时事件流；有待推送通知时唤醒投递器。"""
+    from .events import event_broker
+    from .outbox import outbox_dispatcher
+
+    wake = False
+    for p, msg_id in rows:
+        if p.sender != SCANNER:
+            continue
+        wake = wake or p.notify is not None
+        if event_broker.has_subscribers(p.owner_id):
+            local = p.created_at.replace(tzinfo=timezone.utc).astimezone()
+            event_broker.publish(p.owner_id, "message", {
+                "id": msg_id,
+                "code_id": p.code_id,
+                "code_label": p.label,
+                "content_text": p.text,
+                "image_path": None,
+                "created_at": local.strftime("%Y-%m-%d %H:%M"),
+            })
+    if wake:
+        outbox_dispatcher.wake()
+
+
+class ChatHub:
+    """房间管理与消息扇出（全部运行在同一个事件循环上，无需加锁）。"""
+
+    def __init__(self, send_queue: int = 32, max_connections: int = 5000, room_max: int = 16,
+                 writer: ChatWriter | None = None):
+        self.send_queue = max(1, send_queue)
+        self.max_connections = max_connections
+        self.room_max = room_max
+        self.writer = writer or ChatWriter()
+        self.rooms: dict[int, Room] = {}
+        self.connections = 0
+
+    @classmethod
+    def from_env(cls) -> "ChatHub":
+        return cls(
+            send_queue=int(os.getenv("CHAT_SEND_QUEUE", "32")),
+            max_connections=int(os.getenv("CHAT_MAX_CONNECTIONS", "5000")),
+            room_max=int(os.getenv("CHAT_ROOM_MAX", "16")),
+            writer=ChatWriter(
+                batch_size=int(os.getenv("CHAT_BATCH", "100")),
+                flush_ms=float(os.getenv("CHAT_FLUSH_MS", "200")),
+                max_pending=int(os.getenv("CHAT_WRITE_QUEUE", "10000")),
+            ),
+        )
+
+    def join(self, ws: WebSocket, role: str, code) -> ChatConnection | None:
+        """加入房间（`code` 为 `CodeRecord`）；超过连接或房间上限返回 None。"""
+        room = self.rooms.get(code.id)
+        if self.connections >= self.max_connections or (room is not None and len(room) >= self.room_max):
+            return None
+        if room is None:
+            room = self.rooms[code.id] = Room(
+                code.id, code.owner_id, code.display_name or code.public_code, code.notify_channel,
+                code.bark_base_url, code.bark_token, set(), set(),
+            )
+        conn = ChatConnection(ws, role, self.send_queue)
+        conn.room = room
+        (room.owners if role == OWNER else room.scanners).add(conn)
+        self.connections += 1
+        conn.start()
+        if role == OWNER and len(room.owners) == 1:
+            self._presence(room)
+        elif role == SCANNER:
+            conn.offer(_frame("presence", owner_online=room.owner_online))
+        return conn
+
+    def _detach(self, conn: ChatConnection) -> None:
+        room = conn.room
+        if room is None:
+            return
+        members = room.owners if conn.role == OWNER else room.scanners
+        if conn in members:
+            members.discard(conn)
+            self.connections -= 1
+            if conn.role == OWNER and not room.owners:
+                self._presence(room)
+        if not len(room):
+            self.rooms.pop(room.code_id, None)
+
+    async def leave(self, conn: ChatConnection, code: int = 1000) -> None:
+        self._detach(conn)
+        await conn.close(code)
+
+    def _presence(self, room: Room) -> None:
+        self._fanout(list(room.scanners), _frame("presence", owner_online=room.owner_online))
+
+    def _fanout(self, targets, text: str) -> None:
+        for c in targets:
+            if not c.offer(text):
+                # 慢消费者：断开，释放其队列
+                asyncio.create_task(self.leave(c, 1013))
+
+    def post(self, conn: ChatConnection, text: str, ip_hash: str | None = None) -> bool:
+        """发送一条消息：扇出并提交批量落库；写入队列已满时返回 False（消息未发送）。"""
+        room = conn.room
+        now = datetime.utcnow()
+        notify = None
+        if conn.role == SCANNER and not room.owner_online and room.notify_channel == "BARK" and room.bark_token:
+            notify = ("BARK", room.bark_base_url or "https://api.day.app", room.bark_token)
+        pending = PendingMessage(room.code_id, room.owner_id, room.label, conn.role, text, ip_hash, now, notify, conn)
+        if not self.writer.submit(pending):
+            return False
+        frame = _frame("message", sender=conn.role, text=text, ts=now.isoformat() + "Z")
+        if conn.role == SCANNER:
+            self._fanout([conn, *room.owners], frame)
+        else:
+            self._fanout([*room.owners, *room.scanners], frame)
+        return True
+
+
+def _frame(kind: str, **data) -> str:
+    return json.dumps({"type": kind, **data}, ensure_ascii=False, separators=(",", ":"))
+
+
+chat_hub = ChatHub.from_env()
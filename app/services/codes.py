@@ -0,0 +1,177 @@
+"""挪车码解析缓存（扫码热路径）。
+
+落地页与留言提交都需要按 `public_code` 查询 `Code`，留言提交还需读取 `CodeNotifyPref`。
+此处将二者合并为不可变的 `CodeRecord` 并在进程内缓存：
+- 启动时预热（`warm_code_cache`），热门码的扫码请求无需任何读查询；
+- 码的启用/暂停、删除、通知设置保存后调用 `invalidate_code()` 失效；
+- 有界 LRU（`CODE_CACHE_SIZE`，默认 10000）+ 条目有效期（`CODE_CACHE_TTL_SEC`，默认 60 秒），
+  多 worker 部署时其他进程的缓存在有效期内最终一致；
+- 缓存只服务于读（落地页、二维码）；留言提交在写事务内用 `claim_active_code` 以数据库为准复核。
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from sqlalchemy import exists, func, or_
+from sqlalchemy.orm import Session
+
+
+@dataclass(frozen=True, slots=True)
+class CodeRecord:
+    """挪车码精简快照（含通知偏好）。"""
+    id: int
+    public_code: str
+    owner_id: int
+    status: str
+    display_name: str | None
+    notify_channel: str
+    bark_base_url: str | None
+    bark_token: str | None
+
+    @property
+    def active(self) -> bool:
+        return self.status == "ACTIVE"
+
+
+class CodeCache:
+    """`public_code -> CodeRecord` 的有界 LRU，条目带过期时间。"""
+
+    def __init__(self, max_items: int = 10000, ttl: float = 60.0):
+        self.max_items = max(1, max_items)
+        self.ttl = ttl
+        self._items: "OrderedDict[str, tuple[float, CodeRecord]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, public_code: str) -> CodeRecord | None:
+        with self._lock:
+            item = self._items.get(public_code)
+            if item is None:
+                return None
+            expires, rec = item
+            if self.ttl > 0 and time.monotonic() >= expires:
+                del self._items[public_code]
+                return None
+            self._items.move_to_end(public_code)
+            return rec
+
+    def put(self, rec: CodeRecord) -> None:
+        with self._lock:
+            self._items[rec.public_code] = (time.monotonic() + self.ttl, rec)
+            self._items.move_to_end(rec.public_code)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, public_code: str) -> None:
+        with self._lock:
+            self._items.pop(public_code, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+code_cache = CodeCache(
+    max_items=int(os.getenv("CODE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("CODE_CACHE_TTL_SEC", "60")),
+)
+
+
+def _records_query(db: Session):
+    """码 + 通知偏好的联合查询（一次往返）。"""
+    from ..models import Code, CodeNotifyPref
+
+    return (
+        db.query(
+            Code.id,
+            Code.public_code,
+            Code.owner_id,
+            Code.status,
+            Code.display_name,
+            CodeNotifyPref.channel,
+            CodeNotifyPref.bark_base_url,
+            CodeNotifyPref.bark_token,
+        )
+        .outerjoin(CodeNotifyPref, CodeNotifyPref.code_id == Code.id)
+    )
+
+
+def _to_record(row) -> CodeRecord:
+    return CodeRecord(
+        id=row[0],
+        public_code=row[1],
+        owner_id=row[2],
+        status=row[3] or "ACTIVE",
+        display_name=row[4],
+        notify_channel=(row[5] or "NONE"),
+        bark_base_url=row[6],
+        bark_token=row[7],
+    )
+
+
+def resolve_code(db: Session, public_code: str) -> CodeRecord | None:
+    """按 `public_code` 解析挪车码（任意状态）；不存在返回 None（不缓存未命中）。"""
+    rec = code_cache.get(public_code)
+    if rec is not None:
+        return rec
+    from ..models import Code
+
+    row = _records_query(db).filter(Code.public_code == public_code).first()
+    if row is None:
+        return None
+    rec = _to_record(row)
+    code_cache.put(rec)
+    return rec
+
+
+def invalidate_code(public_code: str) -> None:
+    """使单个码的缓存失效（状态、删除或通知设置变更后调用）。"""
+    code_cache.invalidate(public_code)
+
+
+def warm_code_cache(db: Session | None = None) -> int:
+    """预热缓存：按创建时间倒序载入最多 `max_items` 个启用中的码，返回载入数量。"""
+    from ..database import ReadSessionLocal
+    from ..models import Code
+
+    own = db is None
+    if own:
+        db = ReadSessionLocal()
+    try:
+        rows = (
+            _records_query(db)
+            .filter(Code.status == "ACTIVE")
+            .order_by(Code.created_at.desc())
+            .limit(code_cache.max_items)
+            .all()
+        )
+        for row in reversed(rows):
+            code_cache.put(_to_record(row))
+        return len(rows)
+    except Exception:
+        # 预热失败不影响启动，未命中时按需加载
+        return 0
+    finally:
+        if own:
+            db.close()
+
+
+def claim_active_code(db: Session, rec: CodeRecord) -> bool:
+    """写路径复核：在当前事务内确认码仍存在且启用，同时递增车主的变更计数（一条 UPDATE）。
+
+    其它 worker 的停用/删除可能尚未反映到本进程缓存；这里以数据库为准。UPDATE 取得写锁后直到
+    提交，其它连接无法停用或删除该码。返回 False 时调用方应回滚并按“码不存在或已停用”处理。
+    """
+    from ..models import Code, User
+
+    active = exists().where(
+        Code.id == rec.id,
+        Code.owner_id == User.id,
+        or_(Code.status == "ACTIVE", Code.status.is_(None)),
+    )
+    updated = db.query(User).filter(User.id == rec.owner_id, active).update(
+        {User.change_seq: func.coalesce(User.change_seq, 0) + 1}, synchronize_session=False
+    )
+    return updated == 1
@@ -0,0 +1,182 @@
+"""仪表盘实时事件（进程内发布/订阅 + Server-Sent Events）。
+
+- 留言提交、标记处理成功后按车主 `publish()`；没有订阅者时只有一次字典查找；
+- 每个订阅者一个有界队列（`SSE_QUEUE_SIZE`，默认 100）。消费过慢导致队列满时清空队列并只投递一条
+  `resync` 事件，由前端整页刷新，不会无限堆积内存，也不会阻塞发布方；
+- `publish()` 可在线程池（同步路由）中调用，经 `call_soon_threadsafe` 切回事件循环投递；
+- SSE 连接完全运行在事件循环上（不占用线程池），空闲时每 `SSE_HEARTBEAT_SEC`（默认 15 秒）发送注释心跳，
+  便于代理保持连接并及时发现断开；连接总数上限 `SSE_MAX_CONNECTIONS`（默认 10000）；
+- 单个连接最长保持 `SSE_MAX_AGE_SEC`（默认 600 秒）后主动结束，浏览器 EventSource 自动重连；
+  服务器平滑退出时无需等待长连接。
+
+仅在同一进程内投递：多 worker 部署时，落在其他进程的留言在页面刷新后可见。
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections.abc import AsyncIterator
+from contextlib import suppress
+
+
+class Subscriber:
+    """单个 SSE 连接的有界事件队列。"""
+
+    __slots__ = ("owner_id", "queue", "loop", "lagged")
+
+    def __init__(self, owner_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.owner_id = owner_id
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.lagged = False
+
+    def deliver(self, item) -> None:
+        """在事件循环线程内调用：入队，队列满时降级为 resync。"""
+        if item is None:
+            # 关闭信号：确保能入队
+            while self.queue.full():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            return
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.lagged = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(("resync", format_sse("resync", {})))
+
+
+class EventBroker:
+    """按车主分组的进程内事件代理。"""
+
+    def __init__(self, queue_size: int = 100, heartbeat: float = 15.0, max_connections: int = 10000,
+                 max_age: float = 600.0):
+        self.queue_size = max(1, queue_size)
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.max_connections = max_connections
+        self._subs: dict[int, set[Subscriber]] = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "EventBroker":
+        return cls(
+            queue_size=int(os.getenv("SSE_QUEUE_SIZE", "100")),
+            heartbeat=float(os.getenv("SSE_HEARTBEAT_SEC", "15")),
+            max_connections=int(os.getenv("SSE_MAX_CONNECTIONS", "10000")),
+            max_age=float(os.getenv("SSE_MAX_AGE_SEC", "600")),
+        )
+
+    def __len__(self) -> int:
+        return self._count
+
+    def has_subscribers(self, owner_id: int) -> bool:
+        return bool(self._subs.get(owner_id))
+
+    def subscribe(self, owner_id: int) -> Subscriber | None:
+        """在事件循环中调用；超过连接上限时返回 None。"""
+        with self._lock:
+            if self._count >= self.max_connections:
+                return None
+            sub = Subscriber(owner_id, asyncio.get_running_loop(), self.queue_size)
+            self._subs.setdefault(owner_id, set()).add(sub)
+            self._count += 1
+            return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.owner_id)
+            if subs and sub in subs:
+                subs.discard(sub)
+                self._count -= 1
+                if not subs:
+                    del self._subs[sub.owner_id]
+
+    def publish(self, owner_id: int, event: str, data: dict) -> int:
+        """向某车主的全部连接投递事件（线程安全），返回投递的连接数。"""
+        subs = self._subs.get(owner_id)
+        if not subs:
+            return 0
+        with self._lock:
+            targets = list(self._subs.get(owner_id, ()))
+        # 只编码一次，所有连接共享同一字符串
+        self._dispatch(targets, (event, format_sse(event, data)))
+        return len(targets)
+
+    def close(self) -> None:
+        """通知全部连接结束（应用关闭时调用，避免长连接拖住退出）。"""
+        with self._lock:
+            targets = [s for subs in self._subs.values() for s in subs]
+        self._dispatch(targets, None)
+
+    @staticmethod
+    def _dispatch(targets: list[Subscriber], item) -> None:
+        """按事件循环分组投递：每个循环只唤醒一次（而不是每个连接一次）。"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        by_loop: dict[asyncio.AbstractEventLoop, list[Subscriber]] = {}
+        for sub in targets:
+            by_loop.setdefault(sub.loop, []).append(sub)
+        for loop, subs in by_loop.items():
+            if loop is running:
+                _deliver_all(subs, item)
+            else:
+                with suppress(RuntimeError):  # 事件循环已关闭
+                    loop.call_soon_threadsafe(_deliver_all, subs, item)
+
+    def full(self) -> bool:
+        return self._count >= self.max_connections
+
+    async def stream(self, owner_id: int) -> AsyncIterator[str]:
+        """SSE 文本流：事件、心跳；收到关闭信号或客户端断开时结束并退订。
+
+        在生成器内订阅：响应未开始发送即断开的连接不会留下订阅者。
+        """
+        sub = self.subscribe(owner_id)
+        if sub is None:
+            # 连接数已满：让浏览器稍后再重连
+            yield "retry: 30000\n\n"
+            return
+        try:
+            yield "retry: 5000\n: connected\n\n"
+            deadline = time.monotonic() + self.max_age
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                try:
+                    # asyncio.timeout 不像 wait_for 那样为每次等待创建任务，空闲连接开销更小
+                    async with asyncio.timeout(min(self.heartbeat, remaining)):
+                        item = await sub.queue.get()
+                except TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    return
+                event, text = item
+                yield text
+                if event == "resync":
+                    return
+        finally:
+            self.unsubscribe(sub)
+
+
+def _deliver_all(subs: list[Subscriber], item) -> None:
+    for sub in subs:
+        sub.deliver(item)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """编码为一条 SSE 消息（JSON 数据单行，无需拆分多行 data 字段）。"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+event_broker = EventBroker.from_env()
@@ -0,0 +1,207 @@
+"""仪表盘留言流（游标分页）。
+
+- 按 (created_at, id) 倒序的键集分页：翻页成本与页码无关，不使用 OFFSET；
+- 单条查询联表取出码名称与通知状态，返回精简的 `MessageRow`，模板渲染不再触发懒加载（N+1）；
+- 支持按处理状态与单个码筛选；车主的聊天回复（`sender=OWNER`）不计入留言列表；
+- `unprocessed_counts` 单条分组查询给出各码未处理留言数（仪表盘徽标，之后由实时事件增减）；
+  仪表盘用 `owner_codes_with_counts` 在同一条查询中取出码列表与各码未处理数，渲染共两次查询（码 + 一页留言）；
+- 增量拉取（`/api/v1/messages?since=`）：`fetch_messages_since` 按 id 升序返回游标之后新增的留言；
+  每个车主有一个变更计数 `users.change_seq`，留言新增/处理/删除/图片回写时在同一事务内递增，
+  据此生成 ETag，轮询方在无变化时只需一次主键查询即可得到 304。
+"""
+
+import base64
+import hashlib
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+
+@dataclass(frozen=True, slots=True)
+class MessageRow:
+    """留言列表行（只读快照）。"""
+    id: int
+    code_id: int
+    code_label: str
+    content_text: str | None
+    image_path: str | None
+    thumb_path: str | None
+    processed: bool
+    created_at: datetime | None
+    notify_status: str | None
+    notify_attempts: int
+    notify_error: str | None
+
+
+def encode_cursor(created_at: datetime, msg_id: int) -> str:
+    """将 (created_at, id) 编码为 URL 安全的游标字符串。"""
+    raw = f"{created_at.isoformat()}|{msg_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str | None) -> tuple[datetime, int] | None:
+    """解析游标；格式非法时返回 None（视为第一页）。"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        ts, msg_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(msg_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def _feed_query(db: Session, owner_id: int):
+    """留言列表的基础查询：联表取码名称与通知状态，排除车主的聊天回复。"""
+    from ..models import Code, Message, NotifyOutbox
+
+    return (
+        db.query(
+            Message.id,
+            Message.code_id,
+            Code.display_name,
+            Code.public_code,
+            Message.content_text,
+            Message.image_path,
+            Message.thumb_path,
+            Message.processed,
+            Message.created_at,
+            NotifyOutbox.status,
+            NotifyOutbox.attempts,
+            NotifyOutbox.last_error,
+        )
+        .join(Code, Code.id == Message.code_id)
+        .outerjoin(NotifyOutbox, NotifyOutbox.message_id == Message.id)
+        .filter(Code.owner_id == owner_id, func.coalesce(Message.sender, "SCANNER") != "OWNER")
+    )
+
+
+def _row(r) -> MessageRow:
+    return MessageRow(
+        id=r[0],
+        code_id=r[1],
+        code_label=r[2] or r[3],
+        content_text=r[4],
+        image_path=r[5],
+        thumb_path=r[6],
+        processed=bool(r[7]),
+        created_at=r[8],
+        notify_status=r[9],
+        notify_attempts=r[10] or 0,
+        notify_error=r[11],
+    )
+
+
+def fetch_message_page(
+    db: Session,
+    owner_id: int,
+    cursor: str | None = None,
+    limit: int = 50,
+    processed: bool | None = None,
+    code_id: int | None = None,
+) -> tuple[list[MessageRow], str | None]:
+    """查询某车主的一页留言（新 -> 旧），返回 (行列表, 下一页游标或 None)。"""
+    from ..models import Message
+
+    q = _feed_query(db, owner_id)
+    if processed is not None:
+        q = q.filter(Message.processed == processed)
+    if code_id is not None:
+        q = q.filter(Message.code_id == code_id)
+    after = decode_cursor(cursor)
+    if after is not None:
+        ts, last_id = after
+        q = q.filter(or_(Message.created_at < ts, and_(Message.created_at == ts, Message.id < last_id)))
+    limit = max(1, min(limit, 200))
+    rows = q.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = [_row(r) for r in rows]
+    next_cursor = encode_cursor(items[-1].created_at, items[-1].id) if has_more and items else None
+    return items, next_cursor
+
+
+def unprocessed_counts(db: Session, owner_id: int) -> dict[int, int]:
+    """某车主各码的未处理留言数（仅包含数量大于 0 的码）。"""
+    from ..models import Code, Message
+
+    rows = (
+        db.query(Message.code_id, func.count(Message.id))
+        .join(Code, Code.id == Message.code_id)
+        .filter(Code.owner_id == owner_id, Message.processed.is_(False))
+        .group_by(Message.code_id)
+    )
+    return {code_id: n for code_id, n in rows}
+
+
+def owner_codes_with_counts(db: Session, owner_id: int) -> tuple[list, dict[int, int]]:
+    """某车主的码（新 -> 旧）与各码未处理留言数，单条外连接分组查询。"""
+    from ..models import Code, Message
+
+    rows = (
+        db.query(Code, func.count(Message.id))
+        .outerjoin(Message, and_(Message.code_id == Code.id, Message.processed.is_(False)))
+        .filter(Code.owner_id == owner_id)
+        .group_by(Code.id)
+        .order_by(Code.created_at.desc())
+        .all()
+    )
+    return [code for code, _ in rows], {code.id: n for code, n in rows if n}
+
+
+def fetch_messages_since(
+    db: Session,
+    owner_id: int,
+    since: int = 0,
+    limit: int = 100,
+    code_id: int | None = None,
+) -> tuple[list[MessageRow], bool]:
+    """查询 id 大于 `since` 的留言（旧 -> 新），返回 (行列表, 是否还有更多)。
+
+    以自增 id 而非 created_at 作为游标：聊天消息批量落库时 created_at 早于实际写入时间，
+    按时间游标可能漏掉晚写入的行。
+    """
+    from ..models import Message
+
+    q = _feed_query(db, owner_id).filter(Message.id > max(0, since))
+    if code_id is not None:
+        q = q.filter(Message.code_id == code_id)
+    limit = max(1, min(limit, 500))
+    rows = q.order_by(Message.id).limit(limit + 1).all()
+    return [_row(r) for r in rows[:limit]], len(rows) > limit
+
+
+def change_seq(db: Session, owner_id: int) -> int | None:
+    """车主当前的留言变更计数；用户不存在时返回 None。"""
+    from ..models import User
+
+    row = db.query(User.change_seq).filter(User.id == owner_id).first()
+    return None if row is None else (row[0] or 0)
+
+
+def bump_change_seq(db: Session, *owner_ids: int) -> None:
+    """在当前事务内递增车主的变更计数（随调用方的提交生效，回滚则一并撤销）。"""
+    from ..models import User
+
+    ids = {i for i in owner_ids if i is not None}
+    if ids:
+        db.query(User).filter(User.id.in_(ids)).update(
+            {User.change_seq: func.coalesce(User.change_seq, 0) + 1}, synchronize_session=False
+        )
+
+
+def owners_of_codes(db: Session, code_ids) -> set[int]:
+    from ..models import Code
+
+    ids = set(code_ids)
+    if not ids:
+        return set()
+    return {owner_id for (owner_id,) in db.query(Code.owner_id).filter(Code.id.in_(ids)).distinct()}
+
+
+def feed_etag(owner_id: int, seq: int, *params) -> str:
+    """由车主、变更计数与查询参数生成强 ETag（同一计数与参数下响应内容不变）。"""
+    digest = hashlib.sha1(repr(params).encode("utf-8")).hexdigest()[:12]
+    return f'"m{owner_id}.{seq}.{digest}"'
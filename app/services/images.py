@@ -0,0 +1,314 @@
+"""留言图片处理流水线。
+
+- 魔数识别（`sniff_image_type`）：按文件头判断 JPEG/PNG/WebP，不信任客户端 `content_type`；
+- 原图只暂存在不对外提供的 `DATA_DIR/incoming`（见 `uploads.incoming_dir`），
+  `Message.image_path` 只会指向去除元数据后发布到 `/media` 的文件；
+- 后台处理（需安装 Pillow）：
+  - 按 EXIF 方向摆正后丢弃全部元数据（含 GPS）；
+  - 长边缩放至 `IMAGE_MAX_DIM`（默认 1600），重新编码为 WebP（`IMAGE_QUALITY`，默认 80）；
+  - 生成仪表盘缩略图（长边 `IMAGE_THUMB_DIM`，默认 240）；
+- 处理在独立进程池（`IMAGE_WORKERS`，默认 2）中运行，不占用请求线程；
+  完成后回写 `Message.image_path/thumb_path` 并删除原图。设置 `IMAGE_PIPELINE=0` 可关闭；
+- 未安装 Pillow、已关闭或处理失败时，按文件结构剔除元数据段（`strip_metadata`，不解码像素）后发布原格式；
+  连剔除也失败时删除原图，留言不带图片；
+- 关闭时取消的任务会在暂存目录留下原图：启动时由 `recover` 重新提交（留言仍无图片）或删除。
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+)
+EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+_INCOMING_NAME = re.compile(r"^(\d+)_[0-9a-f]+\.(?:jpg|png|webp)$")
+
+
+def sniff_image_type(head: bytes) -> str | None:
+    """根据文件头（至少 12 字节）识别图片类型，返回 jpeg/png/webp 或 None。"""
+    for sig, kind in _SIGNATURES:
+        if head.startswith(sig):
+            return kind
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def pillow_available() -> bool:
+    try:
+        import PIL  # type: ignore  # noqa: F401
+    except Exception:
+        return False
+    return True
+
+
+def process_image(src_path: str, max_dim: int, quality: int, thumb_dim: int, out_dir: str | None = None) -> tuple[str, str]:
+    """（在子进程中运行）重新编码图片并生成缩略图，返回 (正图路径, 缩略图路径)。
+
+    输出到 `out_dir`（默认与原图同一目录）：`<stem>_p.webp` 与 `<stem>_t.webp`。
+    保存时不携带 EXIF 等元数据，因此 GPS、设备信息等被丢弃。
+    """
+    from PIL import Image, ImageOps  # type: ignore
+
+    # 防止解压炸弹：超大像素数直接报错
+    Image.MAX_IMAGE_PIXELS = 64_000_000
+    stem = os.path.splitext(src_path)[0]
+    if out_dir:
+        stem = os.path.join(out_dir, os.path.basename(stem))
+    out_path, thumb_path = f"{stem}_p.webp", f"{stem}_t.webp"
+    with Image.open(src_path) as im:
+        # JPEG 可在解码阶段按比例缩小，显著降低大图的解码开销
+        im.draft("RGB", (max_dim, max_dim))
+        im = ImageOps.exif_transpose(im)
+        if im.mode not in ("RGB", "RGBA"):
+            im = im.convert("RGBA" if "A" in im.getbands() or im.mode == "P" else "RGB")
+        im.thumbnail((max_dim, max_dim), Image.Resampling.LANCZOS)
+        im.save(out_path + ".part", format="WEBP", quality=quality, method=4)
+        thumb = im.copy()
+        thumb.thumbnail((thumb_dim, thumb_dim), Image.Resampling.LANCZOS)
+        thumb.save(thumb_path + ".part", format="WEBP", quality=max(50, quality - 10), method=4)
+    os.replace(out_path + ".part", out_path)
+    os.replace(thumb_path + ".part", thumb_path)
+    return out_path, thumb_path
+
+
+# JPEG 中保留的 APPn 段：APP0（JFIF）、APP2（ICC 色彩配置）、APP14（Adobe 颜色变换）；其余 APPn 与注释段丢弃
+_JPEG_KEEP_APP = {0xE0, 0xE2, 0xEE}
+_PNG_DROP = {b"eXIf", b"tEXt", b"iTXt", b"zTXt", b"tIME"}
+_WEBP_DROP = {b"EXIF", b"XMP "}
+
+
+def _strip_jpeg(data: bytes) -> bytes:
+    out = [data[:2]]
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            raise ValueError("bad jpeg marker")
+        marker = data[i + 1]
+        if marker == 0xFF:  # 填充字节
+            i += 1
+            continue
+        if marker == 0xDA:  # SOS：其后为熵编码数据，原样保留
+            out.append(data[i:])
+            return b"".join(out)
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            out.append(data[i:i + 2])
+            i += 2
+            continue
+        end = i + 2 + int.from_bytes(data[i + 2:i + 4], "big")
+        if end > len(data):
+            raise ValueError("truncated jpeg")
+        if not ((0xE1 <= marker <= 0xEF and marker not in _JPEG_KEEP_APP) or marker == 0xFE):
+            out.append(data[i:end])
+        i = end
+    raise ValueError("jpeg without scan data")
+
+
+def _strip_png(data: bytes) -> bytes:
+    out = [data[:8]]
+    i = 8
+    while i + 12 <= len(data):
+        size = int.from_bytes(data[i:i + 4], "big")
+        ctype = data[i + 4:i + 8]
+        end = i + 12 + size
+        if end > len(data):
+            raise ValueError("truncated png")
+        if ctype not in _PNG_DROP:
+            out.append(data[i:end])
+        i = end
+        if ctype == b"IEND":
+            return b"".join(out)
+    raise ValueError("png without IEND")
+
+
+def _strip_webp(data: bytes) -> bytes:
+    chunks = []
+    i = 12
+    while i + 8 <= len(data):
+        ctype = data[i:i + 4]
+        size = int.from_bytes(data[i + 4:i + 8], "little")
+        end = i + 8 + size + (size & 1)
+        if i + 8 + size > len(data):
+            raise ValueError("truncated webp")
+        chunk = data[i:end]
+        if ctype == b"VP8X":
+            # 清除扩展头中的 EXIF（0x08）与 XMP（0x04）标志位
+            chunk = chunk[:8] + bytes([chunk[8] & ~0x0C]) + chunk[9:]
+        if ctype not in _WEBP_DROP:
+            chunks.append(chunk)
+        i = end
+    body = b"WEBP" + b"".join(chunks)
+    return b"RIFF" + len(body).to_bytes(4, "little") + body
+
+
+_STRIPPERS = {"jpeg": _strip_jpeg, "png": _strip_png, "webp": _strip_webp}
+
+
+def strip_metadata(src_path: str, dst_path: str) -> None:
+    """不解码像素，按文件结构剔除 EXIF/XMP/文本等元数据段后写入 `dst_path`（原子替换）。
+
+    不依赖 Pillow，作为未启用或处理失败时的兜底；EXIF 方向信息随之丢弃。
+    """
+    with open(src_path, "rb") as f:
+        data = f.read()
+    kind = sniff_image_type(data[:16])
+    if kind is None:
+        raise ValueError("unsupported image")
+    clean = _STRIPPERS[kind](data)
+    with open(dst_path + ".part", "wb") as f:
+        f.write(clean)
+    os.replace(dst_path + ".part", dst_path)
+
+
+class ImagePipeline:
+    """图片后台处理：进程池执行 `process_image`，完成后回写留言记录。"""
+
+    def __init__(self, workers: int = 2, max_dim: int = 1600, quality: int = 80, thumb_dim: int = 240,
+                 enabled: bool = True):
+        self.workers = max(1, workers)
+        self.max_dim = max_dim
+        self.quality = quality
+        self.thumb_dim = thumb_dim
+        self.enabled = enabled and pillow_available()
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "ImagePipeline":
+        return cls(
+            workers=int(os.getenv("IMAGE_WORKERS", "2")),
+            max_dim=int(os.getenv("IMAGE_MAX_DIM", "1600")),
+            quality=int(os.getenv("IMAGE_QUALITY", "80")),
+            thumb_dim=int(os.getenv("IMAGE_THUMB_DIM", "240")),
+            enabled=os.getenv("IMAGE_PIPELINE", "1") != "0",
+        )
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn：避免在多线程的服务进程中 fork
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def submit(self, message_id: int, src_path: str, public_dir: str, public_prefix: str = "/media/") -> Future | None:
+        """处理暂存原图并在完成后发布到 `public_dir`。
+
+        已启用时提交到进程池并返回 Future；未启用时在当前线程剔除元数据后直接发布，返回 None。
+        """
+        if not self.enabled:
+            self._publish_stripped(message_id, src_path, public_dir, public_prefix)
+            return None
+        fut = self._executor().submit(process_image, src_path, self.max_dim, self.quality, self.thumb_dim, public_dir)
+        fut.add_done_callback(lambda f: self._on_done(f, message_id, src_path, public_dir, public_prefix))
+        return fut
+
+    def _on_done(self, fut: Future, message_id: int, src_path: str, public_dir: str, public_prefix: str) -> None:
+        """处理完成：回写留言的图片/缩略图路径；失败时退回为剔除元数据后发布。原图总会被删除。"""
+        try:
+            out_path, thumb_path = fut.result()
+        except Exception:
+            self._publish_stripped(message_id, src_path, public_dir, public_prefix)
+            return
+        self._record(message_id, (out_path, thumb_path), public_prefix)
+        _remove_quietly(src_path)
+
+    def _publish_stripped(self, message_id: int, src_path: str, public_dir: str, public_prefix: str) -> None:
+        out_path = os.path.join(public_dir, os.path.basename(src_path))
+        try:
+            strip_metadata(src_path, out_path)
+        except Exception:
+            _remove_quietly(out_path + ".part")
+        else:
+            self._record(message_id, (out_path, None), public_prefix)
+        _remove_quietly(src_path)
+
+    def _record(self, message_id: int, paths: tuple[str, str | None], public_prefix: str) -> None:
+        """在新的短事务内回写留言图片路径；留言已删除或写入失败时清理已发布的文件。"""
+        from ..database import SessionLocal
+        from ..models import Code, Message
+        from .feed import bump_change_seq
+
+        out_path, thumb_path = paths
+        db = SessionLocal()
+        try:
+            msg = db.get(Message, message_id)
+            if msg is None:
+                # 留言已被删除：清理产物
+                for p in paths:
+                    _remove_quietly(p)
+                return
+            msg.image_path = public_prefix + os.path.basename(out_path)
+            msg.thumb_path = public_prefix + os.path.basename(thumb_path) if thumb_path else None
+            owner_id = db.query(Code.owner_id).filter(Code.id == msg.code_id).scalar()
+            bump_change_seq(db, owner_id)
+            db.commit()
+        except Exception:
+            db.rollback()
+            for p in paths:
+                _remove_quietly(p)
+        finally:
+            db.close()
+
+    def recover(self, incoming: str, public_dir: str, before: float | None = None) -> tuple[int, int]:
+        """处理上次运行遗留在暂存目录中的原图，返回 (重新提交数, 删除数)。
+
+        只看 `before`（默认当前时间）之前写入的文件：留言仍存在且尚无图片时重新提交，
+        其余（留言已删除/已有图片、未提交的临时文件、无法识别的文件名）直接删除。
+        """
+        from ..database import ReadSessionLocal
+        from ..models import Message
+
+        before = time.time() if before is None else before
+        pending: dict[int, str] = {}
+        resubmitted = removed = 0
+        with os.scandir(incoming) as it:
+            for entry in it:
+                if not entry.is_file() or entry.stat().st_mtime >= before:
+                    continue
+                m = _INCOMING_NAME.match(entry.name)
+                if m:
+                    pending[int(m.group(1))] = entry.path
+                else:
+                    _remove_quietly(entry.path)
+                    removed += 1
+        if not pending:
+            return resubmitted, removed
+        db = ReadSessionLocal()
+        try:
+            waiting = {
+                mid for (mid,) in db.query(Message.id).filter(Message.id.in_(list(pending)), Message.image_path.is_(None))
+            }
+        finally:
+            db.close()
+        for mid, path in pending.items():
+            if mid in waiting:
+                self.submit(mid, path, public_dir)
+                resubmitted += 1
+            else:
+                _remove_quietly(path)
+                removed += 1
+        return resubmitted, removed
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+def _remove_quietly(path: str | None) -> None:
+    if not path:
+        return
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+image_pipeline = ImagePipeline.from_env()
@@ -0,0 +1,64 @@
+"""客户端 IP 的带密钥哈希（HMAC-SHA256）。
+
+- 由 `APP_SECRET` 预先构造 HMAC 对象，每次哈希只需 `copy()` + `update()`，不再读取环境变量与拼接字符串；
+- 最近出现的 IP 结果缓存在有界 LRU 中（`IP_HASH_CACHE_SIZE`，默认 4096）；
+- 密钥轮换：`APP_SECRET_PREVIOUS`（逗号分隔）中的旧密钥在过渡期内继续参与匹配，
+  黑名单校验时使用 `candidates()` 返回的全部候选哈希，旧哈希在运维移除旧密钥前保持可比对；
+- 兼容旧格式：`IP_HASH_LEGACY=1`（默认）时候选中同时包含旧版 `sha256(secret|ip)`，
+  升级前写入的黑名单条目继续生效。新写入的数据只使用当前密钥的 HMAC。
+"""
+
+import hashlib
+import hmac
+import os
+from functools import lru_cache
+
+
+def legacy_hash_ip(ip: str, secret: str) -> str:
+    """旧版 IP 哈希：`sha256(secret + "|" + ip)`。"""
+    return hashlib.sha256((secret + "|" + ip).encode("utf-8")).hexdigest()
+
+
+class IPHasher:
+    """带密钥的 IP 哈希器（支持旧密钥过渡与结果缓存）。"""
+
+    def __init__(self, secret: str, previous: tuple[str, ...] = (), cache_size: int = 4096, legacy: bool = True):
+        self._mac = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+        self._previous = tuple(hmac.new(s.encode("utf-8"), digestmod=hashlib.sha256) for s in previous)
+        self._legacy_secrets = (secret, *previous) if legacy else ()
+        self.hash = lru_cache(maxsize=cache_size)(self._hash)
+        self.candidates = lru_cache(maxsize=cache_size)(self._candidates)
+
+    @classmethod
+    def from_env(cls) -> "IPHasher":
+        previous = tuple(s for s in (p.strip() for p in os.getenv("APP_SECRET_PREVIOUS", "").split(",")) if s)
+        return cls(
+            os.getenv("APP_SECRET", ""),
+            previous=previous,
+            cache_size=int(os.getenv("IP_HASH_CACHE_SIZE", "4096")),
+            legacy=os.getenv("IP_HASH_LEGACY", "1") != "0",
+        )
+
+    @staticmethod
+    def _digest(mac, ip: str) -> str:
+        h = mac.copy()
+        h.update(ip.encode("utf-8"))
+        return h.hexdigest()
+
+    def _hash(self, ip: str) -> str:
+        """当前密钥下的 IP 哈希（用于写入）。"""
+        return self._digest(self._mac, ip)
+
+    def _candidates(self, ip: str) -> tuple[str, ...]:
+        """用于匹配的全部候选哈希：当前密钥、过渡期旧密钥、旧版格式。"""
+        out = [self.hash(ip)]
+        out.extend(self._digest(m, ip) for m in self._previous)
+        out.extend(legacy_hash_ip(ip, s) for s in self._legacy_secrets)
+        return tuple(out)
+
+    def cache_clear(self) -> None:
+        self.hash.cache_clear()
+        self.candidates.cache_clear()
+
+
+ip_hasher = IPHasher.from_env()
@@ -0,0 +1,328 @@
+"""进程内指标（Prometheus 文本格式，`GET /metrics`）。
+
+不依赖 prometheus_client，只实现用到的三种类型：
+- `Counter`：带标签的累加计数；
+- `Histogram`：固定分桶的耗时分布（`_bucket`/`_sum`/`_count`）；
+- `GaugeFunc`：抓取时回调求值（线程池排队、长连接数等瞬时量，平时零开销）。
+
+采集开销：每次计数/观测为一次加锁的字典更新；请求级 DB 耗时通过 SQLAlchemy 游标事件累加到
+contextvar 中的请求对象（同步路由在线程池执行时 contextvar 随上下文复制，累加对象共享）。
+`METRICS_ENABLED=0` 时不记录指标，`/metrics` 返回 404。
+
+同一套请求级统计还用于：
+- `Server-Timing` 响应头（`SERVER_TIMING=1`）：`db;dur=..;desc="N queries", app;dur=..`，浏览器开发者工具可直接查看；
+- N+1 检测（`SQL_DEBUG=1`，测试中默认开启）：同一请求内相同语句执行达到 `SQL_N_PLUS_ONE_THRESHOLD`（默认 3）次时
+  记录警告日志并列出调用位置；测试可用 `capture_requests` 断言各路由的查询数上限。
+多 worker 部署时各进程分别计数，需逐个抓取或在前端聚合。
+"""
+
+import bisect
+import math
+import os
+import sys
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def metrics_enabled() -> bool:
+    return os.getenv("METRICS_ENABLED", "1") != "0"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """带标签的计数器。"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple = (), amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: tuple = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for labels, v in sorted(items):
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}"
+
+
+class Histogram:
+    """固定分桶的直方图（桶计数在输出时累加为 Prometheus 的累积形式）。"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [各桶计数..., +Inf 桶计数, 总和]
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            s[i] += 1
+            s[-1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        s = self._series.get(labels)
+        return sum(s[:-1]) if s else 0
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        for labels, s in sorted(items):
+            acc = 0
+            for bound, n in zip(self.buckets + (math.inf,), s[:-1]):
+                acc += n
+                le = 'le="' + _num(bound) + '"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {acc}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(s[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {acc}"
+
+
+class GaugeFunc:
+    """抓取时回调求值的仪表；回调返回 [(标签值元组, 数值)]。"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn: Callable[[], Iterable[tuple[tuple, float]]],
+                 labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def samples(self) -> Iterable[str]:
+        try:
+            items = list(self.fn())
+        except Exception:
+            return
+        for labels, v in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (),
+                  buckets: tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn, labelnames: tuple[str, ...] = ()) -> GaugeFunc:
+        return self.register(GaugeFunc(name, help, fn, labelnames))
+
+    def render(self) -> str:
+        """输出 Prometheus 文本格式（0.0.4）。"""
+        lines: list[str] = []
+        for m in self._metrics:
+            lines.append(f"# HELP {m.name} {m.help}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            lines.extend(m.samples())
+        return "\n".join(lines) + "\n"
+
+
+# ---- 请求级数据库耗时与 N+1 检测 ----
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_THIS_FILE = os.path.abspath(__file__)
+
+
+def server_timing_enabled() -> bool:
+    """是否输出 `Server-Timing` 响应头（`SERVER_TIMING`，默认关闭；`SQL_DEBUG` 开启时同时开启）。"""
+    return os.getenv("SERVER_TIMING", "0") == "1" or sql_debug_enabled()
+
+
+def sql_debug_enabled() -> bool:
+    """调试/测试模式（`SQL_DEBUG=1`）：记录每条语句的调用位置并报告重复语句（N+1）。"""
+    return os.getenv("SQL_DEBUG", "0") == "1"
+
+
+def n_plus_one_threshold() -> int:
+    return int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "3"))
+
+
+def _call_site() -> str:
+    """最近的项目代码栈帧（含 Jinja 模板，其编译代码的文件名为模板路径）。"""
+    f = sys._getframe(2)
+    while f is not None:
+        name = f.f_code.co_filename
+        if name.startswith(_ROOT_DIR) and name != _THIS_FILE and "site-packages" not in name:
+            return f"{os.path.relpath(name, _ROOT_DIR)}:{f.f_lineno}"
+        f = f.f_back
+    return "?"
+
+
+class RequestStats:
+    """单个请求内的数据库耗时与语句数（由游标事件累加）。
+
+    `statements` 仅在调试模式下记录：{参数化 SQL: [执行次数, {调用位置}]}。
+    参数不同但语句相同的多次执行（典型为循环内的懒加载）即 N+1 的特征。
+    """
+
+    __slots__ = ("db_seconds", "db_queries", "statements")
+
+    def __init__(self, track_statements: bool = False):
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.statements: dict[str, list] | None = {} if track_statements else None
+
+    def duplicates(self, threshold: int | None = None) -> list[tuple[str, int, list[str]]]:
+        """执行次数达到阈值的语句：[(SQL, 次数, 调用位置)]，按次数倒序。"""
+        if not self.statements:
+            return []
+        threshold = n_plus_one_threshold() if threshold is None else threshold
+        found = [(sql, n, sorted(sites)) for sql, (n, sites) in self.statements.items() if n >= threshold]
+        return sorted(found, key=lambda x: -x[1])
+
+    def report(self) -> str:
+        lines = [f"{self.db_queries} queries, {self.db_seconds * 1000:.1f}ms"]
+        for sql, n, sites in self.duplicates():
+            lines.append(f"  x{n} {' '.join(sql.split())[:200]}")
+            lines.extend(f"      at {site}" for site in sites)
+        return "\n".join(lines)
+
+
+request_stats: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+_db_events_installed = False
+_observers: list[Callable[[str, str, RequestStats], None]] = []
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if request_stats.get() is not None:
+        context._metrics_t0 = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = request_stats.get()
+    t0 = getattr(context, "_metrics_t0", None)
+    if stats is not None and t0 is not None:
+        stats.db_seconds += time.perf_counter() - t0
+        stats.db_queries += 1
+        if stats.statements is not None:
+            entry = stats.statements.get(statement)
+            if entry is None:
+                entry = stats.statements[statement] = [0, set()]
+            entry[0] += 1
+            entry[1].add(_call_site())
+
+
+def track_statements() -> bool:
+    """新请求是否记录语句明细（调试模式或有测试观察者时）。"""
+    return bool(_observers) or sql_debug_enabled()
+
+
+def notify_observers(method: str, route: str, stats: RequestStats) -> None:
+    for fn in list(_observers):
+        fn(method, route, stats)
+
+
+@contextmanager
+def capture_requests() -> Iterator[list[tuple[str, str, RequestStats]]]:
+    """收集期间完成的 HTTP 请求 [(method, 路由模板, RequestStats)]（测试用，需已安装指标中间件）。"""
+    captured: list[tuple[str, str, RequestStats]] = []
+    observer = lambda method, route, stats: captured.append((method, route, stats))  # noqa: E731
+    install_db_events()
+    _observers.append(observer)
+    try:
+        yield captured
+    finally:
+        _observers.remove(observer)
+
+
+def install_db_events() -> None:
+    """在 `Engine` 类上注册游标事件（对之后重建的引擎同样生效，重复调用无副作用）。"""
+    global _db_events_installed
+    if _db_events_installed:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _db_events_installed = True
+
+
+# ---- 瞬时量 ----
+
+def _threadpool_stats():
+    """anyio 默认线程池（同步路由与依赖在此执行）：占用数、上限与排队等待的任务数。"""
+    from anyio import to_thread
+
+    s = to_thread.current_default_thread_limiter().statistics()
+    return [(("busy",), s.borrowed_tokens), (("limit",), s.total_tokens), (("waiting",), s.tasks_waiting)]
+
+
+def _connection_stats():
+    from .chat import chat_hub
+    from .events import event_broker
+
+    return [(("sse",), len(event_broker)), (("websocket",), chat_hub.connections)]
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "movecar_http_requests_total", "HTTP requests by route template and status.", ("method", "route", "status"))
+http_latency = registry.histogram(
+    "movecar_http_request_duration_seconds", "HTTP request latency by route template.", ("method", "route"))
+http_db_time = registry.histogram(
+    "movecar_http_db_seconds", "Database time spent per HTTP request.", ("route",), DB_BUCKETS)
+rate_limit_decisions = registry.counter(
+    "movecar_rate_limit_total", "Rate limiter decisions.", ("limiter", "result"))
+blacklist_checks = registry.counter(
+    "movecar_blacklist_checks_total", "Blacklist index lookups.", ("result",))
+notify_send = registry.histogram(
+    "movecar_notify_send_seconds", "Notification delivery latency.", ("channel", "outcome"))
+chat_write_failures = registry.counter(
+    "movecar_chat_write_failures_total", "Chat messages in failed batch writes.", ("result",))
+qr_render = registry.histogram(
+    "movecar_qr_render_seconds", "QR code render time on cache miss.", ("kind",), DB_BUCKETS + (2.5,))
+registry.gauge("movecar_threadpool_tokens", "Worker threadpool usage.", _threadpool_stats, ("state",))
+registry.gauge("movecar_open_connections", "Open streaming connections.", _connection_stats, ("kind",))
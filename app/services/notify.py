@@ -1,72 +1,192 @@
-"""通知发送与通知级限流。
+"""通知发送。
 
 当前实现：
 - Bark 通知（基于 https://bark.day.app/ 生态）；
-- 通知流控：每个码前 3 次放行，之后默认每 30 秒最多 1 次（可通过 `NOTIFY_MIN_INTERVAL_SEC` 调整）。
+- 共享长连接 `httpx.AsyncClient`（lifespan 持有）与按基础 URL 的熔断器；
+- 通知流控由发件箱完成：同一码在合并窗口内的留言合并为一条摘要推送（见 `app/services/outbox.py`）。
 """
 
+import asyncio
 import httpx
-from typing import Tuple, Dict, Any
+import threading
+from typing import Tuple, Dict
 import time
 import os
 
 
-def send_bark(base_url: str, token: str, title: str, body: str, url: str | None = None) -> Tuple[bool, str]:
-    """发送 Bark 通知。
+DEFAULT_TIMEOUT = 5.0
 
-    参数：
-        base_url: Bark 服务基础 URL（默认 https://api.day.app）。
-        token: 设备 Token（在 Bark App 中复制）。
-        title/body: 通知标题与正文。
-        url: 可选跳转链接。
-    返回：
-        (ok, msg) 二元组，ok 为是否成功，msg 为简要说明。
+
+class CircuitBreaker:
+    """按 Bark 基础 URL 维度的熔断器。
+
+    - 连续失败达到 `failure_threshold` 次后熔断（OPEN），期间直接快速失败；
+    - 熔断 `reset_timeout` 秒后进入半开（HALF_OPEN），仅放行一次探测请求；
+    - 探测成功则恢复（CLOSED），失败则重新熔断；探测被取消（未得到结果）时 `release` 释放探测名额。
     """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._state: Dict[str, list] = {}  # key -> [failures, opened_at, probing]
+        self._lock = threading.Lock()
+
+    def allow(self, key: str) -> bool:
+        """是否允许向该目标发起请求。"""
+        with self._lock:
+            st = self._state.get(key)
+            if st is None or st[0] < self.failure_threshold:
+                return True
+            if time.monotonic() - st[1] < self.reset_timeout or st[2]:
+                return False
+            st[2] = True  # 半开：放行一次探测
+            return True
+
+    def record_success(self, key: str) -> None:
+        with self._lock:
+            self._state.pop(key, None)
+
+    def release(self, key: str) -> None:
+        """请求未完成（如被取消）：不计成败，仅清除半开探测标记，允许下一次探测。"""
+        with self._lock:
+            st = self._state.get(key)
+            if st is not None:
+                st[2] = False
+
+    def record_failure(self, key: str) -> None:
+        with self._lock:
+            st = self._state.setdefault(key, [0, 0.0, False])
+            st[0] += 1
+            st[2] = False
+            if st[0] >= self.failure_threshold:
+                st[1] = time.monotonic()
+
+    def is_open(self, key: str) -> bool:
+        with self._lock:
+            st = self._state.get(key)
+            return bool(st and st[0] >= self.failure_threshold)
+
+
+breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("NOTIFY_CB_FAILURES", "5")),
+    reset_timeout=float(os.getenv("NOTIFY_CB_RESET_SEC", "60")),
+)
+
+
+class NotifyHTTP:
+    """通知渠道共享的长连接 `httpx.AsyncClient`（由应用 lifespan 持有）。
+
+    连接池复用 TCP/TLS 连接（keep-alive）；安装 `h2` 且设置 `NOTIFY_HTTP2=1` 时启用 HTTP/2。
+    客户端绑定创建它的事件循环；在其他事件循环（或 lifespan 未启动）中调用时回退为一次性客户端。
+    """
+
+    def __init__(self):
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    @staticmethod
+    def _http2_enabled() -> bool:
+        if os.getenv("NOTIFY_HTTP2", "0") != "1":
+            return False
+        try:
+            import h2  # type: ignore  # noqa: F401
+        except Exception:
+            return False
+        return True
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+        max_conn = int(os.getenv("NOTIFY_MAX_CONNECTIONS", "20"))
+        self._client = httpx.AsyncClient(
+            timeout=DEFAULT_TIMEOUT,
+            limits=httpx.Limits(max_connections=max_conn, max_keepalive_connections=max_conn),
+            http2=self._http2_enabled(),
+        )
+        self._loop = asyncio.get_running_loop()
+
+    async def aclose(self) -> None:
+        client, self._client, self._loop = self._client, None, None
+        if client is not None:
+            await client.aclose()
+
+    async def post_json(self, url: str, payload: dict) -> httpx.Response:
+        """POST JSON；优先复用连接池。"""
+        client = self._client
+        if client is not None and self._loop is asyncio.get_running_loop():
+            return await client.post(url, json=payload)
+        async with httpx.AsyncClient(timeout=DEFAULT_TIMEOUT) as tmp:
+            return await tmp.post(url, json=payload)
+
+
+notify_http = NotifyHTTP()
+
+
+def _bark_request(base_url: str, token: str, title: str, body: str, url: str | None):
+    """构造 Bark 请求，返回 (base, endpoint, payload)；配置缺失时 endpoint 为 None。"""
     base = (base_url or "").strip().rstrip("/")
     if not base or not token:
-        return False, "缺少 Bark 基础 URL 或 Token"
-    endpoint = f"{base}/{token}"
+        return base, None, None
     payload = {"title": title or "通知", "body": body or ""}
     if url:
         payload["url"] = url
-    try:
-        with httpx.Client(timeout=5.0) as client:
-            resp = client.post(endpoint, json=payload)
-            if resp.status_code == 200:
-                return True, "发送成功"
-            return False, f"HTTP {resp.status_code}: {resp.text[:200]}"
-    except Exception as e:
-        return False, f"异常: {e}" 
+    return base, f"{base}/{token}", payload
 
 
-# 通知流控：前 3 次不限制；之后每 30 秒最多 1 次（可通过环境变量调整）
-_STATE: Dict[Any, Dict[str, Any]] = {}
+def _bark_result(base: str, resp: httpx.Response) -> Tuple[bool, str]:
+    """解析 Bark 响应并更新熔断器。仅服务端错误计入失败；4xx 通常是 Token 等配置问题。"""
+    if resp.status_code == 200:
+        breaker.record_success(base)
+        return True, "发送成功"
+    if resp.status_code >= 500:
+        breaker.record_failure(base)
+    else:
+        breaker.record_success(base)
+    return False, f"HTTP {resp.status_code}: {resp.text[:200]}"
 
 
-def allow_notify(key: Any) -> bool:
-    """通知速率限制判定。
+async def send_bark_async(base_url: str, token: str, title: str, body: str, url: str | None = None) -> Tuple[bool, str]:
+    """异步发送 Bark 通知（复用连接池，带熔断）。返回值同 `send_bark`。"""
+    base, endpoint, payload = _bark_request(base_url, token, title, body, url)
+    if endpoint is None:
+        return False, "缺少 Bark 基础 URL 或 Token"
+    if not breaker.allow(base):
+        return False, f"熔断中：{base} 近期连续失败，暂停发送"
+    try:
+        resp = await notify_http.post_json(endpoint, payload)
+    except Exception as e:
+        breaker.record_failure(base)
+        return False, f"异常: {e}"
+    except BaseException:
+        # 取消（关闭时的 CancelledError、发件箱任务超时）：释放半开探测，避免该地址一直被熔断
+        breaker.release(base)
+        raise
+    return _bark_result(base, resp)
+
+
+def send_bark(base_url: str, token: str, title: str, body: str, url: str | None = None) -> Tuple[bool, str]:
+    """发送 Bark 通知（同步版本，供脚本等无事件循环场景使用）。
 
-    规则：
-    - 前 3 次直接放行；
-    - 第 4 次开始，需要距离上次成功发送 >= NOTIFY_MIN_INTERVAL_SEC（默认 30s）。
     参数：
-        key: (channel, code_id) 或其他可哈希对象。
+        base_url: Bark 服务基础 URL（默认 https://api.day.app）。
+        token: 设备 Token（在 Bark App 中复制）。
+        title/body: 通知标题与正文。
+        url: 可选跳转链接。
     返回：
-        True/False。
+        (ok, msg) 二元组，ok 为是否成功，msg 为简要说明。
     """
-    now = time.time()
-    min_gap = int(os.getenv("NOTIFY_MIN_INTERVAL_SEC", "30"))
-    s = _STATE.get(key)
-    if s is None:
-        _STATE[key] = {"count": 1, "last_ts": now}
-        return True
-    # 前三次放行
-    if s.get("count", 0) < 3:
-        s["count"] = s.get("count", 0) + 1
-        s["last_ts"] = now
-        return True
-    last = float(s.get("last_ts", 0))
-    if now - last >= min_gap:
-        s["last_ts"] = now
-        return True
-    return False
+    base, endpoint, payload = _bark_request(base_url, token, title, body, url)
+    if endpoint is None:
+        return False, "缺少 Bark 基础 URL 或 Token"
+    if not breaker.allow(base):
+        return False, f"熔断中：{base} 近期连续失败，暂停发送"
+    try:
+        with httpx.Client(timeout=DEFAULT_TIMEOUT) as client:
+            resp = client.post(endpoint, json=payload)
+    except Exception as e:
+        breaker.record_failure(base)
+        return False, f"异常: {e}"
+    except BaseException:
+        breaker.release(base)
+        raise
+    return _bark_result(base, resp)
@@ -0,0 +1,356 @@
+"""通知发件箱与后台投递器。
+
+留言提交时仅在同一事务内写入 `NotifyOutbox`，不在请求线程里调用推送服务；
+由应用 lifespan 中启动的 `OutboxDispatcher` 异步投递：
+- 有界并发（`NOTIFY_WORKERS`，默认 4）；
+- 失败按指数退避重试（`NOTIFY_RETRY_BASE_SEC` 起步，封顶 `NOTIFY_RETRY_MAX_SEC`）；
+- 超过 `NOTIFY_MAX_ATTEMPTS` 次后进入死信（DEAD），保留最后一次错误；
+- 领取时写入租约（SENDING + 到期时间），进程崩溃或重启后租约到期即可被重新领取，
+  多个 worker 同时运行投递器也不会重复领取同一条通知；
+- 合并推送：某码刚推送过（或正在推送）时，新通知的投递时间顺延到合并窗口
+ （`NOTIFY_COALESCE_SEC`，默认 30 秒）结束；窗口内累积的通知在投递时合并为一条摘要
+ （“3 条新留言，最新：…”），每条留言都保留各自的通知状态，不再丢弃。
+"""
+
+import asyncio
+import os
+import random
+import time
+import uuid
+from contextlib import suppress
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import Session
+
+from .metrics import notify_send
+from .notify import send_bark_async
+
+
+@dataclass(frozen=True)
+class OutboxJob:
+    """已领取的投递任务（脱离 ORM 会话的快照）。
+
+    合并后的摘要任务中，`merged_ids` 为一并投递的其余发件箱行。
+    """
+    id: int
+    channel: str
+    base_url: str | None
+    token: str | None
+    title: str
+    body: str
+    url: str | None
+    attempts: int
+    code_id: int | None = None
+    merged_ids: tuple[int, ...] = ()
+
+
+def coalesce_window() -> float:
+    """合并窗口（秒）：`NOTIFY_COALESCE_SEC`，兼容旧的 `NOTIFY_MIN_INTERVAL_SEC`。"""
+    return float(os.getenv("NOTIFY_COALESCE_SEC", os.getenv("NOTIFY_MIN_INTERVAL_SEC", "30")))
+
+
+def coalesce_jobs(jobs: list[OutboxJob]) -> list[OutboxJob]:
+    """将同一码、同一推送目标的任务合并为一条摘要（保持首次出现的顺序）。"""
+    groups: dict[tuple, list[OutboxJob]] = {}
+    for job in jobs:
+        if job.code_id is None:
+            groups[("id", job.id)] = [job]
+        else:
+            groups.setdefault((job.code_id, job.channel, job.base_url, job.token), []).append(job)
+    out = []
+    for group in groups.values():
+        if len(group) == 1:
+            out.append(group[0])
+            continue
+        latest = max(group, key=lambda j: j.id)
+        out.append(
+            OutboxJob(
+                id=latest.id,
+                channel=latest.channel,
+                base_url=latest.base_url,
+                token=latest.token,
+                title=latest.title,
+                body=f"{len(group)} 条新留言，最新：{latest.body}",
+                url=latest.url,
+                attempts=max(j.attempts for j in group),
+                code_id=latest.code_id,
+                merged_ids=tuple(j.id for j in group if j is not latest),
+            )
+        )
+    return out
+
+
+def _due_time(db: Session, code_id: int, now: datetime) -> datetime:
+    """新通知的投递时间：该码在合并窗口内推送过（或正在推送）则顺延到窗口结束，否则立即。"""
+    from ..models import NotifyOutbox
+
+    window = timedelta(seconds=coalesce_window())
+    if window.total_seconds() <= 0:
+        return now
+    # 已有未领取的通知：与其同批投递
+    pending = (
+        db.query(NotifyOutbox.next_attempt_at)
+        .filter(NotifyOutbox.code_id == code_id, NotifyOutbox.status == "PENDING", NotifyOutbox.attempts == 0)
+        .order_by(NotifyOutbox.next_attempt_at)
+        .first()
+    )
+    if pending is not None and pending[0] is not None:
+        return max(now, pending[0])
+    if db.query(NotifyOutbox.id).filter(NotifyOutbox.code_id == code_id, NotifyOutbox.status == "SENDING").first():
+        return now + window
+    last_sent = (
+        db.query(NotifyOutbox.sent_at)
+        .filter(NotifyOutbox.code_id == code_id, NotifyOutbox.status == "SENT", NotifyOutbox.sent_at >= now - window)
+        .order_by(NotifyOutbox.sent_at.desc())
+        .first()
+    )
+    if last_sent is not None:
+        return last_sent[0] + window
+    return now
+
+
+def enqueue_notification(db: Session, message, channel: str, base_url: str | None, token: str | None,
+                         title: str, body: str, url: str | None = None):
+    """为留言创建一条待投递通知（不提交，随留言同事务写入）。
+
+    投递时间按合并窗口计算（见 `_due_time`），窗口内的多条通知由投递器合并为一条摘要。
+    """
+    from ..models import NotifyOutbox
+
+    now = datetime.utcnow()
+    item = NotifyOutbox(
+        code_id=message.code_id,
+        channel=channel,
+        target_base_url=base_url,
+        target_token=token,
+        title=title,
+        body=body,
+        url=url,
+        status="PENDING",
+        attempts=0,
+        next_attempt_at=_due_time(db, message.code_id, now) if message.code_id else now,
+    )
+    message.notification = item
+    db.add(item)
+    return item
+
+
+async def deliver(job: OutboxJob) -> tuple[bool, str]:
+    """按渠道发送一条通知（复用 lifespan 持有的连接池）。"""
+    if job.channel == "BARK":
+        return await send_bark_async(job.base_url or "https://api.day.app", job.token or "", job.title, job.body, job.url)
+    return False, f"不支持的通知渠道: {job.channel}"
+
+
+class OutboxDispatcher:
+    """发件箱投递器：领取到期通知、有界并发发送、记录结果。"""
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        max_attempts: int = 6,
+        retry_base: float = 5.0,
+        retry_max: float = 3600.0,
+        poll_interval: float = 5.0,
+        batch_size: int = 50,
+        lease: float = 60.0,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.poll_interval = poll_interval
+        self.batch_size = max(1, batch_size)
+        self.lease = lease
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wake: asyncio.Event | None = None
+        self._inflight: set[asyncio.Task] = set()
+
+    @classmethod
+    def from_env(cls) -> "OutboxDispatcher":
+        return cls(
+            concurrency=int(os.getenv("NOTIFY_WORKERS", "4")),
+            max_attempts=int(os.getenv("NOTIFY_MAX_ATTEMPTS", "6")),
+            retry_base=float(os.getenv("NOTIFY_RETRY_BASE_SEC", "5")),
+            retry_max=float(os.getenv("NOTIFY_RETRY_MAX_SEC", "3600")),
+            poll_interval=float(os.getenv("NOTIFY_POLL_SEC", "5")),
+        )
+
+    # ---- 数据库操作（同步，运行在线程池中） ----
+
+    def claim_due(self) -> list[OutboxJob]:
+        """原子领取一批到期通知（PENDING 或租约已过期的 SENDING）。"""
+        from ..database import SessionLocal
+        from ..models import NotifyOutbox
+
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        db = SessionLocal()
+        try:
+            due_ids = (
+                db.query(NotifyOutbox.id)
+                .filter(NotifyOutbox.status.in_(("PENDING", "SENDING")), NotifyOutbox.next_attempt_at <= now)
+                .order_by(NotifyOutbox.next_attempt_at)
+                .limit(self.batch_size)
+                .scalar_subquery()
+            )
+            # 单条 UPDATE 完成领取：并发的投递器只会领取到各自标记的行
+            db.query(NotifyOutbox).filter(
+                NotifyOutbox.id.in_(due_ids),
+                NotifyOutbox.status.in_(("PENDING", "SENDING")),
+                NotifyOutbox.next_attempt_at <= now,
+            ).update(
+                {
+                    NotifyOutbox.status: "SENDING",
+                    NotifyOutbox.claim_token: token,
+                    NotifyOutbox.next_attempt_at: now + timedelta(seconds=self.lease),
+                },
+                synchronize_session=False,
+            )
+            db.commit()
+            rows = (
+                db.query(NotifyOutbox)
+                .filter(NotifyOutbox.status == "SENDING", NotifyOutbox.claim_token == token)
+                .all()
+            )
+            return [
+                OutboxJob(
+                    id=r.id,
+                    channel=r.channel or "BARK",
+                    base_url=r.target_base_url,
+                    token=r.target_token,
+                    title=r.title or "通知",
+                    body=r.body or "",
+                    url=r.url,
+                    attempts=r.attempts or 0,
+                    code_id=r.code_id,
+                )
+                for r in rows
+            ]
+        finally:
+            db.close()
+
+    def retry_delay(self, attempts: int) -> float:
+        """第 `attempts` 次失败后的退避时长（指数增长 + 少量抖动）。"""
+        delay = min(self.retry_max, self.retry_base * (2 ** max(0, attempts - 1)))
+        return delay * random.uniform(0.9, 1.1)
+
+    def record_result(self, job: OutboxJob, ok: bool, detail: str) -> str:
+        """记录投递结果（摘要任务同时更新被合并的行），返回新状态。"""
+        from ..database import SessionLocal
+        from ..models import NotifyOutbox
+
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(NotifyOutbox)
+                .filter(NotifyOutbox.id.in_((job.id, *job.merged_ids)))
+                .all()
+            )
+            if not rows:
+                # 留言或码已被删除
+                return "GONE"
+            now = datetime.utcnow()
+            attempts = job.attempts + 1
+            if ok:
+                status, next_at, error = "SENT", None, None
+            elif attempts >= self.max_attempts:
+                status, next_at, error = "DEAD", None, (detail or "")[:256]
+            else:
+                status, error = "PENDING", (detail or "")[:256]
+                next_at = now + timedelta(seconds=self.retry_delay(attempts))
+            for row in rows:
+                row.claim_token = None
+                row.attempts = attempts
+                row.status = status
+                row.last_error = error
+                if ok:
+                    row.sent_at = now
+                if next_at is not None:
+                    row.next_attempt_at = next_at
+            db.commit()
+            return status
+        finally:
+            db.close()
+
+    def drain_once(self) -> int:
+        """同步投递一批到期通知（用于脚本/测试，不可在事件循环内调用），返回处理条数。"""
+        jobs = coalesce_jobs(self.claim_due())
+
+        async def _send_all():
+            return [await self._send(job) for job in jobs]
+
+        for job, (ok, detail) in zip(jobs, asyncio.run(_send_all())):
+            self.record_result(job, ok, detail)
+        return len(jobs)
+
+    @staticmethod
+    async def _send(job: OutboxJob) -> tuple[bool, str]:
+        t0 = time.perf_counter()
+        try:
+            ok, detail = await deliver(job)
+        except Exception as e:
+            ok, detail = False, f"异常: {e}"
+        notify_send.observe(time.perf_counter() - t0, (job.channel, "ok" if ok else "error"))
+        return ok, detail
+
+    # ---- 事件循环侧 ----
+
+    def wake(self) -> None:
+        """唤醒投递器（线程安全；投递器未运行时忽略）。"""
+        loop, ev = self._loop, self._wake
+        if loop is None or ev is None:
+            return
+        with suppress(RuntimeError):
+            loop.call_soon_threadsafe(ev.set)
+
+    async def start(self) -> None:
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+        if self._inflight:
+            # 给在途投递一个短暂的收尾时间；未完成的在租约到期后由下次启动重新领取
+            await asyncio.wait(self._inflight, timeout=5)
+        self._loop = None
+        self._wake = None
+
+    async def _run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                claimed = await asyncio.to_thread(self.claim_due)
+            except Exception:
+                claimed = []
+            for job in coalesce_jobs(claimed):
+                await self._sem.acquire()
+                t = asyncio.create_task(self._deliver(job))
+                self._inflight.add(t)
+                t.add_done_callback(self._inflight.discard)
+            if len(claimed) >= self.batch_size:
+                continue
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+
+    async def _deliver(self, job: OutboxJob) -> None:
+        try:
+            ok, detail = await self._send(job)
+            with suppress(Exception):
+                await asyncio.to_thread(self.record_result, job, ok, detail)
+        finally:
+            self._sem.release()
+
+
+outbox_dispatcher = OutboxDispatcher.from_env()
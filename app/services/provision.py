@@ -0,0 +1,106 @@
+"""批量发放挪车码。
+
+一次事务内创建 N 个挪车码（`PROVISION_MAX_COUNT` 为单次上限，默认 5000）：
+- 短码由 `generate_public_code` 生成，先在批内去重，再分批 `IN` 查询与已有短码比对，冲突的重新生成；
+- 全部行以 Core `INSERT ... RETURNING` 批量写入并取回 id（多行合并为少数几条语句），一次提交；
+- 备注按 `前缀 + 序号` 生成（序号按数量补零，便于按张核对）；前缀为空时不设置备注。
+
+配合 `app/services/sheet.py` 生成 A4 多联打印文件，见 `/codes/sheet.pdf` 与 `python -m app.cli provision`。
+"""
+
+import os
+from dataclasses import dataclass
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+
+# SQLite 单条语句的变量数上限为 999，分批比对已有短码
+_IN_CHUNK = 500
+_MAX_ROUNDS = 10
+
+
+@dataclass(frozen=True, slots=True)
+class ProvisionedCode:
+    """新建挪车码的快照（提交后 ORM 对象已过期，避免逐个刷新）。"""
+    id: int
+    public_code: str
+    display_name: str | None
+
+
+def max_bulk_count() -> int:
+    return int(os.getenv("PROVISION_MAX_COUNT", "5000"))
+
+
+def unique_public_codes(db: Session, count: int) -> list[str]:
+    """生成 `count` 个互不相同且数据库中不存在的短码。"""
+    from ..models import Code
+    from ..utils import generate_public_code
+
+    result: list[str] = []
+    seen: set[str] = set()
+    for _ in range(_MAX_ROUNDS):
+        need = count - len(result)
+        if need <= 0:
+            return result
+        batch = []
+        while len(batch) < need:
+            pc = generate_public_code()
+            if pc not in seen:
+                seen.add(pc)
+                batch.append(pc)
+        taken: set[str] = set()
+        for i in range(0, len(batch), _IN_CHUNK):
+            chunk = batch[i:i + _IN_CHUNK]
+            taken.update(pc for (pc,) in db.query(Code.public_code).filter(Code.public_code.in_(chunk)))
+        result.extend(pc for pc in batch if pc not in taken)
+    if len(result) < count:
+        raise RuntimeError("could not allocate unique public codes")
+    return result
+
+
+def bulk_create_codes(db: Session, owner_id: int, count: int, name_prefix: str = ""):
+    """在一个事务内为 `owner_id` 创建 `count` 个挪车码，返回按 id 升序的 `ProvisionedCode` 列表。
+
+    数量不在 1..`PROVISION_MAX_COUNT` 范围内时抛出 ValueError。
+    """
+    from ..models import Code
+
+    if count < 1 or count > max_bulk_count():
+        raise ValueError(f"count must be between 1 and {max_bulk_count()}")
+    prefix = (name_prefix or "").strip()
+    width = len(str(count))
+    rows = [
+        {
+            "public_code": pc,
+            "owner_id": owner_id,
+            "display_name": f"{prefix}{i:0{width}d}"[:120] if prefix else None,
+        }
+        for i, pc in enumerate(unique_public_codes(db, count), start=1)
+    ]
+    try:
+        # Core 批量 INSERT ... RETURNING：多行合并为少数几条语句；
+        # ORM flush 在 SQLite 上为取回自增主键会逐行执行 INSERT
+        returned = db.execute(
+            insert(Code).returning(Code.id, Code.public_code, Code.display_name), rows
+        ).all()
+        result = sorted((ProvisionedCode(*r) for r in returned), key=lambda c: c.id)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return result
+
+
+def owner_stickers(db: Session, owner_id: int, base_url: str, from_id: int | None = None, to_id: int | None = None):
+    """查询某用户的挪车码（可按 id 区间）并转换为打印贴纸列表。"""
+    from ..models import Code
+    from .sheet import Sticker
+
+    q = db.query(Code.public_code, Code.display_name).filter(Code.owner_id == owner_id)
+    if from_id is not None:
+        q = q.filter(Code.id >= from_id)
+    if to_id is not None:
+        q = q.filter(Code.id <= to_id)
+    base = base_url.rstrip("/")
+    return [Sticker(pc, name, f"{base}/c/{pc}") for pc, name in q.order_by(Code.id).limit(max_bulk_count())]
@@ -0,0 +1,223 @@
+"""二维码渲染缓存。
+
+打印页与已打印的贴纸会反复请求同一 (url, 格式, scale, border) 的二维码，
+而 `segno.make()` + PNG 编码属于 CPU 密集操作。此处提供：
+- 进程内有界 LRU（`QR_CACHE_SIZE`，默认 256 项）；
+- 可选磁盘缓存（`QR_CACHE_DIR`，默认关闭），进程重启后无需重新渲染；按文件数与总字节数
+  （`QR_CACHE_DIR_MAX_FILES` / `QR_CACHE_DIR_MAX_MB`）以 LRU 淘汰。只有调用方声明可持久化的条目
+  （已存在的码 + 配置的站点地址，不含请求 Host）才会落盘；
+- 单飞（single-flight）：同一键并发未命中时只渲染一次，其余线程等待结果；
+- 基于内容的强 ETag，供路由返回 304。
+"""
+
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import segno
+
+from .metrics import qr_render
+
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+@dataclass(frozen=True)
+class QRImage:
+    """已渲染的二维码（不可变）。"""
+    data: bytes
+    etag: str
+    media_type: str
+
+
+def render_qr(url: str, kind: str, scale: int, border: int) -> bytes:
+    """渲染二维码为 PNG/SVG 字节（不经缓存）。"""
+    qr = segno.make(url, error="m")
+    buf = io.BytesIO()
+    qr.save(buf, kind=kind, scale=scale, border=border)
+    return buf.getvalue()
+
+
+class _Flight:
+    """单飞占位：首个线程负责渲染，其余线程等待 `done`。"""
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: QRImage | None = None
+        self.error: BaseException | None = None
+
+
+class QRCache:
+    """有界 LRU + 可选磁盘缓存 + 单飞去重。"""
+
+    def __init__(
+        self,
+        max_items: int = 256,
+        disk_dir: str | None = None,
+        disk_max_files: int = 5000,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.max_items = max(1, max_items)
+        self.disk_dir = disk_dir or None
+        self.disk_max_files = max(1, disk_max_files)
+        self.disk_max_bytes = max(1, disk_max_bytes)
+        self._items: "OrderedDict[tuple, QRImage]" = OrderedDict()
+        self._flights: dict[tuple, _Flight] = {}
+        self._lock = threading.Lock()
+        # 磁盘文件索引：文件名 -> 字节数，按最近使用排序（各进程各自维护，启动时按 mtime 重建）
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_bytes = 0
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._scan_disk()
+
+    def get(self, url: str, kind: str = "png", scale: int = 8, border: int = 2, persist: bool = False) -> QRImage:
+        """获取二维码；命中内存缓存时仅为一次字典查找。
+
+        `persist=True` 时允许读写磁盘缓存（仅用于内容不受请求方控制的 URL）。
+        """
+        key = (url, kind, scale, border)
+        with self._lock:
+            img = self._items.get(key)
+            if img is not None:
+                self._items.move_to_end(key)
+                return img
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            img = self._load_or_render(key, persist)
+            flight.result = img
+            with self._lock:
+                self._items[key] = img
+                self._items.move_to_end(key)
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+            return img
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def peek(self, url: str, kind: str = "png", scale: int = 8, border: int = 2) -> QRImage | None:
+        """仅查询内存缓存（不渲染），供异步路由在事件循环内走快速路径。"""
+        key = (url, kind, scale, border)
+        with self._lock:
+            img = self._items.get(key)
+            if img is not None:
+                self._items.move_to_end(key)
+            return img
+
+    def clear(self) -> None:
+        """清空内存缓存（磁盘缓存保留）。"""
+        with self._lock:
+            self._items.clear()
+
+    def _scan_disk(self) -> None:
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        entries.sort()
+        for _, name, size in entries:
+            self._disk[name] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        """淘汰最久未使用的文件直至满足上限。"""
+        victims = []
+        with self._lock:
+            while self._disk and (len(self._disk) > self.disk_max_files or self._disk_bytes > self.disk_max_bytes):
+                name, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                victims.append(name)
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+
+    def _disk_name(self, key: tuple) -> str:
+        return f"{hashlib.sha256(repr(key).encode('utf-8')).hexdigest()}.{key[1]}"
+
+    def _load_or_render(self, key: tuple, persist: bool = False) -> QRImage:
+        url, kind, scale, border = key
+        data = None
+        name = self._disk_name(key) if self.disk_dir and persist else None
+        path = os.path.join(self.disk_dir, name) if name else None
+        if path:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                data = None
+            if data is not None:
+                with self._lock:
+                    if name in self._disk:
+                        self._disk.move_to_end(name)
+                try:
+                    os.utime(path)  # 记录最近使用，重启后按 mtime 恢复 LRU 顺序
+                except OSError:
+                    pass
+        if data is None:
+            t0 = time.perf_counter()
+            data = render_qr(url, kind, scale, border)
+            qr_render.observe(time.perf_counter() - t0, (kind,))
+            if path:
+                # 先写临时文件再原子替换，避免并发进程读到半截文件
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                try:
+                    with open(tmp, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp, path)
+                except OSError:
+                    try:
+                        os.remove(tmp)
+                    except OSError:
+                        pass
+                else:
+                    with self._lock:
+                        self._disk_bytes += len(data) - self._disk.pop(name, 0)
+                        self._disk[name] = len(data)
+                    self._evict_disk()
+        etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+        return QRImage(data=data, etag=etag, media_type=MEDIA_TYPES[kind])
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """判断 `If-None-Match` 是否命中给定强 ETag（兼容列表、`*` 与弱校验前缀）。"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+qr_cache = QRCache(
+    max_items=int(os.getenv("QR_CACHE_SIZE", "256")),
+    disk_dir=os.getenv("QR_CACHE_DIR", "").strip() or None,
+    disk_max_files=int(os.getenv("QR_CACHE_DIR_MAX_FILES", "5000")),
+    disk_max_bytes=int(float(os.getenv("QR_CACHE_DIR_MAX_MB", "256")) * 1024 * 1024),
+)
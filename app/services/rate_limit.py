@@ -1,21 +1,196 @@
-"""简单的内存限流器。
+"""留言提交限流器。
 
-算法：滑动窗口计数（每个键保留窗口内时间戳），适合单实例/轻量使用。
-用于限制留言提交频率（按 IP + public_code 维度）。
+用于限制留言提交频率（按 IP + public_code 维度）。算法为 GCRA：每个键仅保存一个时间戳，
+判定 O(1)，并可给出被拒绝请求的重试等待时间。后端可插拔（`RATE_LIMIT_BACKEND`）：
+- memory（默认）：进程内，键数有上限（`RATE_LIMIT_MAX_KEYS`），LRU 淘汰并随请求增量清理空闲键，适合单 worker；
+- sqlite：基于本机 SQLite 文件（`RATE_LIMIT_DB`，默认 `data/ratelimit.db`）的共享状态，
+  同一主机上的多个 worker 进程（如 `uvicorn --workers 4`）共用同一份配额，无需外部服务。
 """
 
 import os
+import sqlite3
+import threading
 import time
-from typing import Dict, Any
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any
+
+from .metrics import rate_limit_decisions
+
+
+class Decision:
+    """限流判定结果：是否放行，以及被拒绝时建议的重试等待秒数。"""
+
+    __slots__ = ("allowed", "retry_after")
+
+    def __init__(self, allowed: bool, retry_after: float = 0.0):
+        self.allowed = allowed
+        self.retry_after = retry_after
+
+    def __bool__(self) -> bool:
+        return self.allowed
+
+
+class MemoryBackend:
+    """进程内 GCRA（通用信元速率算法，等价于令牌桶）。
+
+    配额 `count` 次 / `window` 秒换算为发放间隔 T = window / count、突发容忍 tau = window - T；
+    每个键只保存一个浮点数（理论到达时间 TAT），判定为 O(1)。
+    TAT 已过去的键与“从未出现”等价，可随时删除而不改变判定结果。键按最近放行的先后排列（OrderedDict）：
+    - 键数达到上限 `max_keys` 时按 LRU 淘汰最久未访问的键；
+    - 每次判定最多从队头清理 `sweep_batch` 个已空闲（TAT <= now）的键，遇到仍在限流中的键即停止；
+      队头键最迟在最后一次放行后 `window` 秒变为空闲，清理摊还 O(1)，不会在请求锁内整表扫描。
+    """
+
+    def __init__(self, window: int, count: int, max_keys: int = 100_000, sweep_batch: int = 8):
+        self.window = window
+        self.count = count
+        self.interval = window / max(1, count)
+        self.tolerance = window - self.interval
+        self.max_keys = max(1, max_keys)
+        self.sweep_batch = max(1, sweep_batch)
+        self._tat: OrderedDict[Any, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+    def check(self, key: Any, now: float | None = None) -> Decision:
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire_head_locked(now, self.sweep_batch)
+            tat = self._tat.get(key)
+            tat = now if tat is None or tat < now else tat
+            if tat - now > self.tolerance:
+                return Decision(False, tat - self.tolerance - now)
+            if key in self._tat:
+                self._tat.move_to_end(key)
+            elif len(self._tat) >= self.max_keys:
+                self._tat.popitem(last=False)
+            self._tat[key] = tat + self.interval
+            return Decision(True)
+
+    def allow(self, key: Any, now: float | None = None) -> bool:
+        return self.check(key, now).allowed
+
+    def sweep(self, now: float | None = None) -> int:
+        """删除全部已空闲的键（整表扫描，供维护/测试调用，不在请求路径上），返回删除数量。"""
+        now = time.time() if now is None else now
+        with self._lock:
+            idle = [k for k, tat in self._tat.items() if tat <= now]
+            for k in idle:
+                del self._tat[k]
+            return len(idle)
+
+    def _expire_head_locked(self, now: float, limit: int) -> int:
+        """从队头（最久未放行）删除至多 `limit` 个已空闲的键。"""
+        removed = 0
+        tat_map = self._tat
+        while removed < limit and tat_map:
+            key = next(iter(tat_map))
+            if tat_map[key] > now:
+                break
+            del tat_map[key]
+            removed += 1
+        return removed
+
+
+class SQLiteBackend:
+    """跨进程共享的 GCRA：每个键一行（TAT），单条 upsert 原子判定。
+
+    仅在放行时更新 TAT（`ON CONFLICT ... WHERE`），多个进程并发判定同一键时不会超发；
+    每线程一条连接（WAL + busy_timeout），定期清理已空闲的行。
+    """
+
+    SWEEP_EVERY = 1000
+
+    def __init__(self, path: str, window: int, count: int):
+        self.path = path
+        self.window = window
+        self.count = count
+        self.interval = window / max(1, count)
+        self.tolerance = window - self.interval
+        self._local = threading.local()
+        self._ops = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        # 建表用的一次性连接：`with conn` 只提交事务不关闭连接，须显式关闭
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS rate_limit_gcra (key TEXT PRIMARY KEY, tat REAL NOT NULL) WITHOUT ROWID")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    @staticmethod
+    def _key(key: Any) -> str:
+        if isinstance(key, tuple):
+            return "\x1f".join(str(k) for k in key)
+        return str(key)
+
+    def check(self, key: Any, now: float | None = None) -> Decision:
+        now = time.time() if now is None else now
+        k = self._key(key)
+        conn = self._conn()
+        row = conn.execute(
+            "INSERT INTO rate_limit_gcra (key, tat) VALUES (:k, :now + :t) "
+            "ON CONFLICT(key) DO UPDATE SET tat = max(tat, :now) + :t "
+            "WHERE max(tat, :now) - :now <= :tau RETURNING tat",
+            {"k": k, "now": now, "t": self.interval, "tau": self.tolerance},
+        ).fetchone()
+        self._ops += 1
+        if self._ops % self.SWEEP_EVERY == 0:
+            self.sweep(now)
+        if row is not None:
+            return Decision(True)
+        cur = conn.execute("SELECT tat FROM rate_limit_gcra WHERE key = ?", (k,)).fetchone()
+        tat = cur[0] if cur else now
+        return Decision(False, max(0.0, tat - self.tolerance - now))
+
+    def allow(self, key: Any, now: float | None = None) -> bool:
+        return self.check(key, now).allowed
+
+    def sweep(self, now: float | None = None) -> int:
+        """删除已空闲（TAT 已过去）的行，返回删除条数。"""
+        now = time.time() if now is None else now
+        return self._conn().execute("DELETE FROM rate_limit_gcra WHERE tat <= ?", (now,)).rowcount
+
+
+def make_backend(name: str | None = None, window: int | None = None, count: int | None = None):
+    """按名称（默认取 `RATE_LIMIT_BACKEND`）创建限流后端。"""
+    name = (name or os.getenv("RATE_LIMIT_BACKEND", "memory")).lower()
+    window = window if window is not None else int(os.getenv("RATE_LIMIT_WINDOW", "60"))
+    count = count if count is not None else int(os.getenv("RATE_LIMIT_COUNT", "1"))
+    if name == "memory":
+        return MemoryBackend(
+            window,
+            count,
+            max_keys=int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000")),
+            sweep_batch=int(os.getenv("RATE_LIMIT_SWEEP_BATCH", "8")),
+        )
+    if name == "sqlite":
+        return SQLiteBackend(os.getenv("RATE_LIMIT_DB", "data/ratelimit.db"), window, count)
+    raise ValueError(f"unknown RATE_LIMIT_BACKEND: {name}")
 
 
 class RateLimiter:
-    """基于窗口计数的限流器。"""
+    """限流器门面：委托给具体后端。"""
 
-    def __init__(self):
-        self.window = int(os.getenv("RATE_LIMIT_WINDOW", "60"))
-        self.count = int(os.getenv("RATE_LIMIT_COUNT", "1"))
-        self._hits: Dict[Any, list[float]] = {}
+    def __init__(self, backend=None, name: str = "message"):
+        self.backend = backend if backend is not None else make_backend()
+        self.window = self.backend.window
+        self.count = self.backend.count
+        # 指标标签（`movecar_rate_limit_total{limiter=...}`）
+        self.name = name
 
     def allow(self, key: Any) -> bool:
         """是否允许当前请求。
@@ -25,18 +200,10 @@ class RateLimiter:
         返回：
             True 表示放行；False 表示超出阈值。
         """
-        now = time.time()
-        window_start = now - self.window
-        buf = self._hits.setdefault(key, [])
-        # drop old
-        i = 0
-        for t in buf:
-            if t >= window_start:
-                break
-            i += 1
-        if i:
-            del buf[:i]
-        if len(buf) >= self.count:
-            return False
-        buf.append(now)
-        return True
+        return self.check(key).allowed
+
+    def check(self, key: Any) -> Decision:
+        """判定并返回 `Decision`（被拒绝时携带 `retry_after` 秒数，用于 `Retry-After` 响应头）。"""
+        decision = self.backend.check(key)
+        rate_limit_decisions.inc((self.name, "allow" if decision.allowed else "deny"))
+        return decision
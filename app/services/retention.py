@@ -0,0 +1,355 @@
+"""留言保留期、归档与上传文件清理。
+
+后台任务需显式开启（`RETENTION_ENABLED=1`；设置了全局 `RETENTION_DAYS` 时默认开启），
+lifespan 启动后每 `RETENTION_INTERVAL_SEC` 秒一次（默认 3600），依次执行：
+1. 过期留言归档并删除：保留天数取码级 `codes.retention_days`，未设置时取全局 `RETENTION_DAYS`
+  （0 或未设置表示永久保留）；过期留言先追加写入按月分文件的 gzip NDJSON
+  （`RETENTION_ARCHIVE_DIR`，默认 `data/archive/messages-YYYY-MM.ndjson.gz`），
+   再按 `RETENTION_BATCH`（默认 500）条一批删除，每批独立短事务，不长时间占用写连接；
+2. 仅 `RETENTION_SWEEP_ORPHANS=1` 时：清理上传目录中不再被任何 `Message.image_path/thumb_path` 引用的文件
+  （跳过临时文件与 `RETENTION_ORPHAN_GRACE_SEC` 内新写入的文件，避免误删处理中的图片），
+   并删除暂存目录 `DATA_DIR/incoming` 中超过该时限仍未处理的原图与临时文件；
+3. SQLite 增量回收空闲页（`PRAGMA incremental_vacuum`）；仅当库已是增量 auto_vacuum 模式时执行，
+   切换模式需要一次完整 VACUUM，由部署步骤 `python -m app.cli vacuum` 显式完成。
+
+多 worker 部署时通过文件锁保证同一时刻只有一个进程执行。
+也可手动执行：`python -m app.services.retention`。
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import time
+from contextlib import suppress
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .feed import bump_change_seq, owners_of_codes
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - 非 POSIX 平台
+    fcntl = None
+
+
+MEDIA_PREFIX = "/media/"
+
+
+@dataclass
+class RetentionReport:
+    """单次运行结果。"""
+    archived: int = 0
+    deleted: int = 0
+    files_removed: int = 0
+    bytes_freed: int = 0
+    vacuum_pages: int = 0
+    archives: list[str] = field(default_factory=list)
+
+
+def media_file(uploads_dir: str, public_path: str | None) -> str | None:
+    """`/media/xxx` -> 上传目录下的文件路径；非本地媒体路径返回 None。"""
+    if not public_path or not public_path.startswith(MEDIA_PREFIX):
+        return None
+    name = os.path.basename(public_path)
+    return os.path.join(uploads_dir, name) if name else None
+
+
+def remove_media_files(paths, uploads_dir: str | None = None) -> tuple[int, int]:
+    """删除留言引用的图片文件，返回 (文件数, 字节数)。"""
+    if uploads_dir is None:
+        from ..utils import ensure_dirs
+
+        uploads_dir = ensure_dirs()[1]
+    count = size = 0
+    for p in paths:
+        f = media_file(uploads_dir, p)
+        if f is None:
+            continue
+        with suppress(OSError):
+            st = os.stat(f)
+            os.remove(f)
+            count += 1
+            size += st.st_size
+    return count, size
+
+
+def code_media_paths(db: Session, code_id: int) -> list[str]:
+    """某码全部留言引用的图片路径（删除码前收集，提交后再删除文件）。"""
+    from ..models import Message
+
+    out: list[str] = []
+    for image_path, thumb_path in db.query(Message.image_path, Message.thumb_path).filter(Message.code_id == code_id):
+        out.extend(p for p in (image_path, thumb_path) if p)
+    return out
+
+
+class RetentionJob:
+    """保留期任务：归档删除过期留言、清理孤儿文件、增量 VACUUM。"""
+
+    def __init__(
+        self,
+        default_days: int = 0,
+        interval: float = 3600.0,
+        batch_size: int = 500,
+        archive_dir: str | None = None,
+        orphan_grace: float = 3600.0,
+        vacuum_pages: int = 2000,
+        enabled: bool = False,
+        sweep_orphans: bool = False,
+    ):
+        self.default_days = default_days
+        self.interval = interval
+        self.batch_size = max(1, batch_size)
+        self.archive_dir = archive_dir
+        self.orphan_grace = orphan_grace
+        self.vacuum_pages = vacuum_pages
+        self.enabled = enabled
+        self.sweep_orphans_enabled = sweep_orphans
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def from_env(cls) -> "RetentionJob":
+        days = int(os.getenv("RETENTION_DAYS", "0"))
+        return cls(
+            default_days=days,
+            interval=float(os.getenv("RETENTION_INTERVAL_SEC", "3600")),
+            batch_size=int(os.getenv("RETENTION_BATCH", "500")),
+            archive_dir=os.getenv("RETENTION_ARCHIVE_DIR") or None,
+            orphan_grace=float(os.getenv("RETENTION_ORPHAN_GRACE_SEC", "3600")),
+            vacuum_pages=int(os.getenv("RETENTION_VACUUM_PAGES", "2000")),
+            enabled=os.getenv("RETENTION_ENABLED", "1" if days > 0 else "0") == "1",
+            sweep_orphans=os.getenv("RETENTION_SWEEP_ORPHANS", "0") == "1",
+        )
+
+    # ---- 单次运行（同步，运行在线程中） ----
+
+    def run_once(self, now: datetime | None = None) -> RetentionReport:
+        """执行一次完整的保留期任务；其他进程正在执行时直接返回空结果。"""
+        from ..utils import ensure_dirs
+
+        data_dir, uploads_dir = ensure_dirs()
+        report = RetentionReport()
+        lock = self._acquire_lock(data_dir)
+        if lock is False:
+            return report
+        try:
+            now = now or datetime.utcnow()
+            archive_dir = self.archive_dir or os.path.join(data_dir, "archive")
+            self.expire_messages(now, archive_dir, uploads_dir, report)
+            if self.sweep_orphans_enabled:
+                self.sweep_orphans(uploads_dir, report)
+            self.incremental_vacuum(report)
+        finally:
+            if lock is not None:
+                lock.close()
+        return report
+
+    @staticmethod
+    def _acquire_lock(data_dir: str):
+        """获取进程间文件锁；返回文件对象、None（平台不支持）或 False（被占用）。"""
+        if fcntl is None:
+            return None
+        f = open(os.path.join(data_dir, ".retention.lock"), "w")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        return f
+
+    def _policies(self, db: Session) -> list[tuple[int, list[int] | None]]:
+        """[(保留天数, 适用的码 id 列表；None 表示所有未单独设置的码)]。"""
+        from ..models import Code
+
+        per_code: dict[int, list[int]] = {}
+        for code_id, days in db.query(Code.id, Code.retention_days).filter(Code.retention_days.isnot(None)):
+            if days and days > 0:
+                per_code.setdefault(days, []).append(code_id)
+        policies: list[tuple[int, list[int] | None]] = sorted(per_code.items())
+        if self.default_days > 0:
+            policies.append((self.default_days, None))
+        return policies
+
+    def expire_messages(self, now: datetime, archive_dir: str, uploads_dir: str, report: RetentionReport) -> None:
+        from ..database import SessionLocal
+        from ..models import Code, Message, NotifyOutbox
+
+        db = SessionLocal()
+        try:
+            policies = self._policies(db)
+        finally:
+            db.close()
+        for days, code_ids in policies:
+            cutoff = now - timedelta(days=days)
+            last_id = 0
+            while True:
+                db = SessionLocal()
+                try:
+                    q = db.query(Message).filter(Message.created_at < cutoff, Message.id > last_id)
+                    if code_ids is None:
+                        q = q.join(Code, Code.id == Message.code_id).filter(Code.retention_days.is_(None))
+                    else:
+                        q = q.filter(Message.code_id.in_(code_ids))
+                    batch = q.order_by(Message.id).limit(self.batch_size).all()
+                    if not batch:
+                        break
+                    last_id = batch[-1].id
+                    # 先落盘归档，再在短事务内删除
+                    for path in self._archive(archive_dir, batch):
+                        if path not in report.archives:
+                            report.archives.append(path)
+                    ids = [m.id for m in batch]
+                    media = [p for m in batch for p in (m.image_path, m.thumb_path) if p]
+                    db.query(NotifyOutbox).filter(NotifyOutbox.message_id.in_(ids)).delete(synchronize_session=False)
+                    db.query(Message).filter(Message.id.in_(ids)).delete(synchronize_session=False)
+                    bump_change_seq(db, *owners_of_codes(db, {m.code_id for m in batch}))
+                    db.commit()
+                finally:
+                    db.close()
+                report.archived += len(batch)
+                report.deleted += len(batch)
+                files, size = remove_media_files(media, uploads_dir)
+                report.files_removed += files
+                report.bytes_freed += size
+                if len(batch) < self.batch_size:
+                    break
+
+    @staticmethod
+    def _archive(archive_dir: str, messages) -> list[str]:
+        """按留言创建月份追加写入 gzip NDJSON（每次追加一个 gzip 成员，整体仍是合法的 gzip 文件）。"""
+        os.makedirs(archive_dir, exist_ok=True)
+        by_month: dict[str, list[str]] = {}
+        for m in messages:
+            month = (m.created_at or datetime.utcnow()).strftime("%Y-%m")
+            by_month.setdefault(month, []).append(json.dumps({
+                "id": m.id,
+                "code_id": m.code_id,
+                "sender": m.sender,
+                "content_text": m.content_text,
+                "image_path": m.image_path,
+                "ip_hash": m.ip_hash,
+                "processed": bool(m.processed),
+                "created_at": m.created_at.isoformat() if m.created_at else None,
+            }, ensure_ascii=False))
+        paths = []
+        for month, lines in by_month.items():
+            path = os.path.join(archive_dir, f"messages-{month}.ndjson.gz")
+            with open(path, "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                    gz.write(("\n".join(lines) + "\n").encode("utf-8"))
+                raw.flush()
+                os.fsync(raw.fileno())
+            paths.append(path)
+        return paths
+
+    def sweep_orphans(self, uploads_dir: str, report: RetentionReport) -> None:
+        """删除未被任何留言引用的上传文件，以及暂存目录中滞留的原图。"""
+        from ..database import SessionLocal
+        from ..models import Message
+        from .uploads import incoming_dir
+
+        cutoff = time.time() - self.orphan_grace
+        # 暂存原图正常在数秒内处理完毕；超过时限仍在的是中断的上传或被取消的处理任务
+        with os.scandir(incoming_dir()) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                if st.st_mtime <= cutoff:
+                    with suppress(OSError):
+                        os.remove(entry.path)
+                        report.files_removed += 1
+                        report.bytes_freed += st.st_size
+        candidates = []
+        with os.scandir(uploads_dir) as it:
+            for entry in it:
+                # 跳过临时文件（.xxx.part / *.part）与子目录
+                if entry.name.startswith(".") or entry.name.endswith(".part") or not entry.is_file():
+                    continue
+                st = entry.stat()
+                if st.st_mtime <= cutoff:
+                    candidates.append((entry.name, st.st_size))
+        if not candidates:
+            return
+        db = SessionLocal()
+        try:
+            referenced = set()
+            for image_path, thumb_path in db.query(Message.image_path, Message.thumb_path).filter(
+                (Message.image_path.isnot(None)) | (Message.thumb_path.isnot(None))
+            ):
+                for p in (image_path, thumb_path):
+                    if p:
+                        referenced.add(os.path.basename(p))
+        finally:
+            db.close()
+        for name, size in candidates:
+            if name in referenced:
+                continue
+            with suppress(OSError):
+                os.remove(os.path.join(uploads_dir, name))
+                report.files_removed += 1
+                report.bytes_freed += size
+
+    def incremental_vacuum(self, report: RetentionReport) -> None:
+        """回收空闲页（仅 SQLite 文件库，且已切换为增量 auto_vacuum；否则什么也不做）。"""
+        from .. import database
+
+        eng = database.engine
+        if eng.dialect.name != "sqlite" or database._is_memory_url(database.DB_URL) or self.vacuum_pages <= 0:
+            return
+        with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+                return
+            free_before = conn.execute(text("PRAGMA freelist_count")).scalar() or 0
+            conn.execute(text(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})"))
+            free_after = conn.execute(text("PRAGMA freelist_count")).scalar() or 0
+            report.vacuum_pages += max(0, free_before - free_after)
+
+    # ---- 事件循环侧 ----
+
+    async def start(self) -> None:
+        if self._task is None and self.enabled and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            with suppress(Exception):
+                await asyncio.to_thread(self.run_once)
+
+
+def enable_incremental_vacuum() -> dict:
+    """将 SQLite 文件库切换为增量 auto_vacuum 模式（完整 VACUUM，期间独占写锁；部署步骤中执行）。"""
+    from .. import database
+
+    eng = database.engine
+    if eng.dialect.name != "sqlite" or database._is_memory_url(database.DB_URL):
+        return {"auto_vacuum": None, "converted": False}
+    with eng.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        converted = conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2
+        if converted:
+            conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            conn.execute(text("VACUUM"))
+        return {"auto_vacuum": conn.execute(text("PRAGMA auto_vacuum")).scalar(), "converted": converted}
+
+
+retention_job = RetentionJob.from_env()
+
+
+if __name__ == "__main__":
+    from ..database import init_db
+
+    init_db()
+    print(json.dumps(asdict(retention_job.run_once()), ensure_ascii=False, indent=2))
@@ -0,0 +1,307 @@
+"""批量打印：A4 多联贴纸（SVG / PDF，矢量二维码）。
+
+每页按 `SheetLayout`（默认 3 列 x 4 行）排版，每张贴纸包含标题、二维码、备注与备用链接。
+二维码直接由 `segno` 的模块矩阵生成矢量图形：同一行相邻的深色模块合并为一个矩形，
+SVG 输出为 `<path>`，PDF 输出为 `re` 填充指令，不经过位图编码，打印任意尺寸都清晰。
+
+- 逐页渲染在进程池中并行（`SHEET_WORKERS`，默认 CPU 核数，最多 4），页数较少时直接在当前进程渲染；
+- 结果按页顺序流式输出（`iter_svg` / `iter_pdf` 为生成器），首页渲染完成即可开始下载；
+- PDF 为手写的最小实现（无第三方依赖）：中文使用 PDF 阅读器内置的 `STSong-Light`（Adobe-GB1）
+  CID 字体，不嵌入字体文件；链接使用 Courier 等宽字体。
+"""
+
+import multiprocessing
+import os
+import threading
+import zlib
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from xml.sax.saxutils import escape
+
+import segno
+
+
+MM_TO_PT = 72 / 25.4
+HEADLINE = "挪车请扫码"
+MEDIA_TYPES = {"pdf": "application/pdf", "svg": "image/svg+xml"}
+
+
+@dataclass(frozen=True, slots=True)
+class Sticker:
+    """单张贴纸内容。"""
+    public_code: str
+    display_name: str | None
+    url: str
+
+
+@dataclass(frozen=True, slots=True)
+class SheetLayout:
+    """页面排版（单位：毫米）。"""
+    cols: int = 3
+    rows: int = 4
+    margin: float = 10.0
+    page_w: float = 210.0
+    page_h: float = 297.0
+
+    @property
+    def per_page(self) -> int:
+        return self.cols * self.rows
+
+    @property
+    def cell_w(self) -> float:
+        return (self.page_w - 2 * self.margin) / self.cols
+
+    @property
+    def cell_h(self) -> float:
+        return (self.page_h - 2 * self.margin) / self.rows
+
+    def cells(self) -> Iterator[tuple[float, float]]:
+        """按行优先返回每个格子左上角坐标。"""
+        for r in range(self.rows):
+            for c in range(self.cols):
+                yield self.margin + c * self.cell_w, self.margin + r * self.cell_h
+
+
+def qr_runs(url: str, border: int = 2) -> tuple[int, list[tuple[int, int, int]]]:
+    """二维码模块矩阵 -> (含留白的边长, [(x, y, 宽度)] 深色行程)。"""
+    matrix = segno.make(url, error="m").matrix
+    runs = []
+    for y, row in enumerate(matrix):
+        x, n = 0, len(row)
+        while x < n:
+            if row[x]:
+                start = x
+                while x < n and row[x]:
+                    x += 1
+                runs.append((start + border, y + border, x - start))
+            else:
+                x += 1
+    return len(matrix) + 2 * border, runs
+
+
+def _text_width(text: str, size: float) -> float:
+    """估算 STSong-Light 文本宽度：ASCII 半角，其余全角。"""
+    return sum(0.5 if ord(ch) < 128 else 1.0 for ch in text) * size
+
+
+def _fit(text: str, size: float, max_w: float, em: float | None = None) -> float:
+    """缩小字号使文本不超过 `max_w`（`em` 为等宽字体的字宽比例）。"""
+    width = len(text) * em * size if em else _text_width(text, size)
+    return size if width <= max_w else size * max_w / width
+
+
+def _sticker_geometry(layout: SheetLayout, x0: float, y0: float, url: str, name: str | None):
+    """贴纸内各元素位置（y 轴向下）：标题、二维码、备注、链接。"""
+    cw, ch = layout.cell_w, layout.cell_h
+    cx = x0 + cw / 2
+    qr = min(cw - 14, ch - 26)
+    head_size = min(5.0, ch * 0.07)
+    qr_y = y0 + 4 + head_size * 1.6
+    name_size = _fit(name, 3.5, cw - 6) if name else 0.0
+    url_size = _fit(url, 2.4, cw - 4, em=0.6)
+    return {
+        "cx": cx,
+        "head": (y0 + 3 + head_size, head_size),
+        "qr": (cx - qr / 2, qr_y, qr),
+        "name": (qr_y + qr + 1.5 + name_size, name_size),
+        "url": (y0 + ch - 3, url_size),
+    }
+
+
+# ---- SVG ----
+
+def render_svg_page(stickers: list[Sticker], layout: SheetLayout) -> str:
+    """渲染一页的 SVG 片段（`<g>`，坐标单位为毫米）。"""
+    out = ['<g font-family="sans-serif" text-anchor="middle">']
+    for (x0, y0), s in zip(layout.cells(), stickers):
+        g = _sticker_geometry(layout, x0, y0, s.url, s.display_name)
+        cx = g["cx"]
+        out.append(
+            f'<rect x="{x0:.2f}" y="{y0:.2f}" width="{layout.cell_w:.2f}" height="{layout.cell_h:.2f}" '
+            'fill="none" stroke="#bbb" stroke-width="0.2" stroke-dasharray="1 1"/>'
+        )
+        y, size = g["head"]
+        out.append(f'<text x="{cx:.2f}" y="{y:.2f}" font-size="{size:.2f}" font-weight="bold">{HEADLINE}</text>')
+        qx, qy, qs = g["qr"]
+        n, runs = qr_runs(s.url)
+        d = "".join(f"M{x} {yy}h{w}v1h-{w}z" for x, yy, w in runs)
+        out.append(f'<path transform="translate({qx:.3f} {qy:.3f}) scale({qs / n:.5f})" d="{d}"/>')
+        if s.display_name:
+            y, size = g["name"]
+            out.append(f'<text x="{cx:.2f}" y="{y:.2f}" font-size="{size:.2f}">{escape(s.display_name)}</text>')
+        y, size = g["url"]
+        out.append(f'<text x="{cx:.2f}" y="{y:.2f}" font-size="{size:.2f}" font-family="monospace">{escape(s.url)}</text>')
+    out.append("</g>")
+    return "".join(out)
+
+
+# ---- PDF ----
+
+def _pdf_text(font: str, size: float, x: float, y: float, data: str) -> str:
+    return f"BT /{font} {size:.2f} Tf 1 0 0 1 {x:.2f} {y:.2f} Tm <{data}> Tj ET\n"
+
+
+def _ucs2(text: str) -> str:
+    """UniGB-UCS2-H 编码（十六进制）；BMP 以外的字符替换为问号。"""
+    return "".join(ch if ord(ch) <= 0xFFFF else "?" for ch in text).encode("utf-16-be").hex()
+
+
+def render_pdf_page(stickers: list[Sticker], layout: SheetLayout) -> bytes:
+    """渲染一页的 PDF 内容流（已 Flate 压缩；坐标先缩放为毫米，y 轴向上）。"""
+    H = layout.page_h
+    ops = [f"{MM_TO_PT:.6f} 0 0 {MM_TO_PT:.6f} 0 0 cm\n"]
+    for (x0, y0), s in zip(layout.cells(), stickers):
+        g = _sticker_geometry(layout, x0, y0, s.url, s.display_name)
+        cx = g["cx"]
+        ops.append(
+            f"q 0.73 G 0.2 w [1 1] 0 d {x0:.2f} {H - y0 - layout.cell_h:.2f} "
+            f"{layout.cell_w:.2f} {layout.cell_h:.2f} re S Q\n"
+        )
+        y, size = g["head"]
+        ops.append(_pdf_text("F1", size, cx - _text_width(HEADLINE, size) / 2, H - y, _ucs2(HEADLINE)))
+        qx, qy, qs = g["qr"]
+        n, runs = qr_runs(s.url)
+        m = qs / n
+        # 模块坐标系：原点为二维码左上角，y 轴向下
+        ops.append(f"q {m:.5f} 0 0 {-m:.5f} {qx:.3f} {H - qy:.3f} cm\n")
+        ops.append("".join(f"{x} {yy} {w} 1 re\n" for x, yy, w in runs))
+        ops.append("f Q\n")
+        if s.display_name:
+            y, size = g["name"]
+            name = s.display_name
+            ops.append(_pdf_text("F1", size, cx - _text_width(name, size) / 2, H - y, _ucs2(name)))
+        y, size = g["url"]
+        url = s.url.encode("latin-1", "replace")
+        ops.append(_pdf_text("F2", size, cx - len(url) * 0.6 * size / 2, H - y, url.hex()))
+    return zlib.compress("".join(ops).encode("ascii"), 6)
+
+
+class _PDFWriter:
+    """顺序写出 PDF 对象并记录偏移（用于 xref），每次返回可直接发送的字节块。"""
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets: dict[int, int] = {}
+
+    def raw(self, data: bytes) -> bytes:
+        self.offset += len(data)
+        return data
+
+    def obj(self, num: int, body: str, stream: bytes | None = None) -> bytes:
+        self.offsets[num] = self.offset
+        head = f"{num} 0 obj\n{body}\n".encode("ascii")
+        if stream is None:
+            return self.raw(head + b"endobj\n")
+        return self.raw(head + b"stream\n" + stream + b"\nendstream\nendobj\n")
+
+    def trailer(self, root: int) -> bytes:
+        size = max(self.offsets) + 1
+        xref = self.offset
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        lines.extend(f"{self.offsets.get(i, 0):010d} 00000 n \n" for i in range(1, size))
+        lines.append(f"trailer\n<< /Size {size} /Root {root} 0 R >>\nstartxref\n{xref}\n%%EOF\n")
+        return self.raw("".join(lines).encode("ascii"))
+
+
+# 固定对象：1 目录、2 页树、3-5 中文字体、6 Courier；之后每页占两个对象（页面 + 内容流）
+_FIXED_OBJECTS = {
+    3: "<< /Type /Font /Subtype /Type0 /BaseFont /STSong-Light /Encoding /UniGB-UCS2-H /DescendantFonts [4 0 R] >>",
+    4: (
+        "<< /Type /Font /Subtype /CIDFontType0 /BaseFont /STSong-Light "
+        "/CIDSystemInfo << /Registry (Adobe) /Ordering (GB1) /Supplement 2 >> "
+        "/FontDescriptor 5 0 R /DW 1000 /W [1 95 500] >>"
+    ),
+    5: (
+        "<< /Type /FontDescriptor /FontName /STSong-Light /Flags 6 /FontBBox [-25 -254 1000 880] "
+        "/ItalicAngle 0 /Ascent 880 /Descent -120 /CapHeight 880 /StemV 93 >>"
+    ),
+    6: "<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>",
+}
+
+
+def paginate(stickers: list[Sticker], layout: SheetLayout) -> list[list[Sticker]]:
+    n = layout.per_page
+    return [stickers[i:i + n] for i in range(0, len(stickers), n)] or [[]]
+
+
+class SheetRenderer:
+    """按页并行渲染并流式输出整份打印文件。"""
+
+    def __init__(self, workers: int = 2, parallel_min_pages: int = 4):
+        self.workers = max(1, workers)
+        self.parallel_min_pages = parallel_min_pages
+        self._pool: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "SheetRenderer":
+        return cls(
+            workers=int(os.getenv("SHEET_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            parallel_min_pages=int(os.getenv("SHEET_PARALLEL_MIN_PAGES", "4")),
+        )
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn：避免在多线程的服务进程中 fork
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def _map(self, fn, pages: list[list[Sticker]], layout: SheetLayout) -> Iterable:
+        """按页顺序返回渲染结果；页数少或单 worker 时在当前进程渲染（省去进程间传输开销）。"""
+        if self.workers <= 1 or len(pages) < self.parallel_min_pages:
+            return (fn(p, layout) for p in pages)
+        return self._executor().map(fn, pages, [layout] * len(pages))
+
+    def iter_svg(self, stickers: list[Sticker], layout: SheetLayout = SheetLayout()) -> Iterator[bytes]:
+        """整份 SVG：多页纵向排列（便于导入排版软件；单页时即为标准 A4）。"""
+        pages = paginate(stickers, layout)
+        w, h = layout.page_w, layout.page_h
+        total = h * len(pages)
+        yield (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{w:g}mm" height="{total:g}mm" '
+            f'viewBox="0 0 {w:g} {total:g}">\n'
+        ).encode("utf-8")
+        for i, body in enumerate(self._map(render_svg_page, pages, layout)):
+            yield f'<g transform="translate(0 {h * i:g})">{body}</g>\n'.encode("utf-8")
+        yield b"</svg>\n"
+
+    def iter_pdf(self, stickers: list[Sticker], layout: SheetLayout = SheetLayout()) -> Iterator[bytes]:
+        """整份 PDF：每页渲染完成即输出对应的页面对象。"""
+        pages = paginate(stickers, layout)
+        w = layout.page_w * MM_TO_PT
+        h = layout.page_h * MM_TO_PT
+        pdf = _PDFWriter()
+        kids = " ".join(f"{7 + 2 * i} 0 R" for i in range(len(pages)))
+        yield pdf.raw(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        yield pdf.obj(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        yield pdf.obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>")
+        for num, body in _FIXED_OBJECTS.items():
+            yield pdf.obj(num, body)
+        for i, content in enumerate(self._map(render_pdf_page, pages, layout)):
+            page, stream = 7 + 2 * i, 8 + 2 * i
+            yield pdf.obj(
+                page,
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {w:.2f} {h:.2f}] "
+                f"/Resources << /Font << /F1 3 0 R /F2 6 0 R >> >> /Contents {stream} 0 R >>",
+            )
+            yield pdf.obj(stream, f"<< /Length {len(content)} /Filter /FlateDecode >>", content)
+        yield pdf.trailer(1)
+
+    def iter_sheet(self, fmt: str, stickers: list[Sticker], layout: SheetLayout = SheetLayout()) -> Iterator[bytes]:
+        if fmt == "pdf":
+            return self.iter_pdf(stickers, layout)
+        if fmt == "svg":
+            return self.iter_svg(stickers, layout)
+        raise ValueError(f"unknown sheet format: {fmt}")
+
+    def shutdown(self, wait: bool = False) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait, cancel_futures=not wait)
+
+
+sheet_renderer = SheetRenderer.from_env()
@@ -0,0 +1,100 @@
+"""站点上下文缓存。
+
+`AppSetting` 为单行全局配置，几乎每个页面都需要读取其中的站点标题、页脚与对外地址。
+此处将其读取为不可变的 `SiteContext` 并在进程内缓存：
+- 首次访问时加载一次（之后页面渲染不再查询 `AppSetting`）；
+- 保存系统配置后调用 `invalidate_site_context()` 失效；
+- 可选 `SITE_CACHE_TTL_SEC`（默认 60 秒）作为兜底，便于多 worker 部署时最终一致。
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+from sqlalchemy.orm import Session
+
+
+DEFAULT_SITE_TITLE = "Move Car 挪车码"
+
+
+def default_footer_html() -> str:
+    """默认页脚 HTML（更生动）。
+
+    说明：
+    - 更友好的文案与表情，突出“文明挪车 / 隐私友好 / 开源”。
+    - 管理员可在“系统配置”中自定义（支持 HTML），此处仅为默认兜底。
+    """
+    return (
+        '<div class="muted">'
+        '🚗 文明挪车 · 守护隐私 <span class="sep">|</span> '
+        '<a class="link" href="https://github.com/skyjt/MoveCar" target="_blank" rel="noopener">GitHub: skyjt/MoveCar</a> '
+        '<span class="sep">|</span> <span>Made with ❤️</span>'
+        "</div>"
+    )
+
+
+@dataclass(frozen=True)
+class SiteContext:
+    """站点上下文（只读快照）。
+
+    字段：
+    - title: 站点标题（未配置时为默认标题）
+    - footer_html: 页脚 HTML（未配置时为默认页脚）
+    - base_url: 后台配置的对外地址（未配置时为空字符串）
+    """
+    title: str
+    footer_html: str
+    base_url: str
+
+
+_lock = threading.Lock()
+_cached: SiteContext | None = None
+_loaded_at = 0.0
+
+
+def _load(db: Session) -> SiteContext:
+    """从数据库读取 `AppSetting` 并构造上下文；读取失败时返回默认值。"""
+    from ..models import AppSetting
+
+    try:
+        setting = db.query(AppSetting).first()
+    except Exception:
+        setting = None
+    return SiteContext(
+        title=(setting.site_title if setting and setting.site_title else DEFAULT_SITE_TITLE),
+        footer_html=(setting.footer_html if setting and setting.footer_html else default_footer_html()),
+        base_url=((setting.site_base_url or "").rstrip("/") if setting else ""),
+    )
+
+
+def peek_site_context() -> SiteContext | None:
+    """仅查缓存：未加载或已过期时返回 None，从不访问数据库（可在事件循环上调用）。"""
+    ttl = float(os.getenv("SITE_CACHE_TTL_SEC", "60"))
+    ctx = _cached
+    if ctx is not None and (ttl <= 0 or time.monotonic() - _loaded_at < ttl):
+        return ctx
+    return None
+
+
+def get_site_context(db: Session) -> SiteContext:
+    """获取站点上下文（命中缓存时不访问数据库）。"""
+    global _cached, _loaded_at
+    ctx = peek_site_context()
+    if ctx is not None:
+        return ctx
+    ctx = _cached
+    with _lock:
+        # 双重检查：并发未命中时仅由一个线程加载
+        if _cached is not None and _cached is not ctx:
+            return _cached
+        _cached = _load(db)
+        _loaded_at = time.monotonic()
+        return _cached
+
+
+def invalidate_site_context() -> None:
+    """使缓存失效（保存系统配置或重建数据库后调用）。"""
+    global _cached
+    with _lock:
+        _cached = None
@@ -0,0 +1,85 @@
+"""上传文件的流式落盘与大小限制。
+
+留言图片不再整体读入内存：按固定块大小（`CHUNK_SIZE`）流式写入上传目录下的临时文件，
+一旦超过 `MAX_IMAGE_MB` 立即中止并删除；留言提交成功后再原子重命名为正式文件名，
+因此每个上传的内存峰值为 O(块大小)，与文件大小无关。
+"""
+
+import os
+import tempfile
+from dataclasses import dataclass
+from typing import BinaryIO
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """上传内容超过大小限制。"""
+
+
+def max_image_bytes() -> int:
+    """单张图片大小上限（字节），来自 `MAX_IMAGE_MB`。"""
+    return int(os.getenv("MAX_IMAGE_MB", "5")) * 1024 * 1024
+
+
+@dataclass
+class StagedUpload:
+    """已落盘但尚未生效的上传文件。
+
+    - tmp_path: 上传目录下的临时文件（以 `.` 开头、`.part` 结尾，不会被当作正式文件）
+    - final_path: 提交后对外可见的文件路径
+    - size: 字节数
+    """
+    tmp_path: str
+    final_path: str
+    size: int
+
+    def commit(self, final_path: str | None = None) -> None:
+        """原子重命名为正式文件（同目录内 `os.replace`）；`final_path` 可在提交时改定文件名。"""
+        if final_path is not None:
+            self.final_path = final_path
+        os.replace(self.tmp_path, self.final_path)
+
+    def discard(self) -> None:
+        """删除临时文件（提交失败或被拒绝时调用）。"""
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def incoming_dir() -> str:
+    """未处理原图的暂存目录（`DATA_DIR/incoming`，不经 `/media` 对外提供）。
+
+    提交后的原图命名为 `<留言 id>_<随机串>.<扩展名>`，重启时据此重新交给图片流水线（见 `ImagePipeline.recover`）。
+    """
+    path = os.path.join(os.getenv("DATA_DIR", "./data"), "incoming")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def stage_upload(src: BinaryIO, final_path: str, max_bytes: int, chunk_size: int = CHUNK_SIZE) -> StagedUpload:
+    """将 `src` 分块复制到 `final_path` 同目录的临时文件。
+
+    超过 `max_bytes` 时删除临时文件并抛出 `UploadTooLarge`。
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(final_path) or ".", prefix=".", suffix=".part")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = src.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"upload exceeds {max_bytes} bytes")
+                out.write(chunk)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return StagedUpload(tmp_path=tmp_path, final_path=final_path, size=size)
@@ -0,0 +1,136 @@
+"""启动初始化：建表与迁移、默认管理员、遗留暂存图片回收、进程内缓存预热与模板预编译。
+
+导入 `app.main` 不再访问数据库；初始化在 lifespan 启动阶段执行（`APP_INIT`）：
+- `auto`（默认）：lifespan 启动时执行；多 worker 时借助数据目录下的文件锁由一个进程（leader）
+  完成建表/迁移/管理员引导与遗留暂存图片回收，同一次启动的其余 worker 只做本进程的缓存预热；
+- `skip`：跳过建表/迁移/管理员引导（已由部署步骤 `python -m app.cli init` 完成），只做缓存预热；
+- `import`：兼容旧行为，在 `create_app()` 中同步执行。
+
+未运行 lifespan 的嵌入方式（如不带 `with` 的 TestClient）由 `StartupGuardMiddleware`
+在首个请求前补做初始化。
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:  # 文件锁仅在类 Unix 平台可用；其它平台各进程各自初始化（幂等）
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+INIT_MODES = ("auto", "skip", "import")
+
+
+def init_mode() -> str:
+    """初始化模式（`APP_INIT`，未知取值按 `auto` 处理）。"""
+    mode = os.getenv("APP_INIT", "auto").strip().lower()
+    return mode if mode in INIT_MODES else "auto"
+
+
+@contextmanager
+def _leader_lock(path: str):
+    """独占文件锁：同一数据目录下的多个进程依次进入。"""
+    try:
+        f = open(path, "a+")
+    except OSError:  # 只读数据目录：不加锁
+        f = None
+    if f is None or fcntl is None:
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _launch_stamp() -> str | None:
+    """本次启动的标识：仅在多 worker（由父进程派生）且为文件库时返回，否则每个进程都需初始化。"""
+    from . import database
+    from .migrations import MIGRATIONS
+
+    if multiprocessing.parent_process() is None or database._is_memory_url(database.DB_URL):
+        return None
+    return f"{os.getppid()} {MIGRATIONS[-1].version} {database.DB_URL}"
+
+
+class Initializer:
+    """进程内只执行一次的启动初始化（线程安全）。"""
+
+    def __init__(self):
+        self.done = False
+        self.timings: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def run(self, mode: str | None = None) -> None:
+        """执行初始化；已完成时直接返回。"""
+        if self.done:
+            return
+        with self._lock:
+            if self.done:
+                return
+            self._run(mode or init_mode())
+            self.done = True
+
+    def _run(self, mode: str) -> None:
+        from .routes.pages import precompile_templates
+        from .services.blacklist import blacklist_index
+        from .services.codes import warm_code_cache
+        from .utils import ensure_dirs
+
+        data_dir, _ = ensure_dirs()
+        t0 = time.perf_counter()
+        if mode != "skip":
+            self._init_db(data_dir)
+        t1 = time.perf_counter()
+        # 预热扫码热路径的挪车码缓存与黑名单索引
+        warm_code_cache()
+        blacklist_index.load()
+        t2 = time.perf_counter()
+        precompile_templates(os.getenv("TEMPLATE_CACHE_DIR", os.path.join(data_dir, "jinja-cache")))
+        t3 = time.perf_counter()
+        self.timings = {"db": round(t1 - t0, 4), "warm": round(t2 - t1, 4), "templates": round(t3 - t2, 4)}
+        logger.info("startup init (%s): %s", mode, self.timings)
+
+    def _init_db(self, data_dir: str) -> None:
+        from .database import init_db
+
+        stamp = _launch_stamp()
+        stamp_path = os.path.join(data_dir, ".init-stamp")
+        with _leader_lock(os.path.join(data_dir, ".init.lock")):
+            if stamp is not None:
+                try:
+                    with open(stamp_path, encoding="utf-8") as f:
+                        if f.read() == stamp:
+                            return  # 同一次启动的 leader 已完成
+                except OSError:
+                    pass
+            init_db()
+            self._recover_incoming()
+            if stamp is not None:
+                try:
+                    with open(stamp_path, "w", encoding="utf-8") as f:
+                        f.write(stamp)
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _recover_incoming() -> None:
+        """上次运行被取消的图片任务留下的原图：重新交给流水线或删除（持有 leader 锁，避免重复提交）。"""
+        from .services.images import image_pipeline
+        from .services.uploads import incoming_dir
+        from .utils import ensure_dirs
+
+        resubmitted, removed = image_pipeline.recover(incoming_dir(), ensure_dirs()[1])
+        if resubmitted or removed:
+            logger.info("incoming images: %d resubmitted, %d removed", resubmitted, removed)
+
+
+initializer = Initializer()
@@ -34,10 +34,23 @@ def generate_public_code() -> str:
     return secrets.token_urlsafe(8)
 
 
+# 本机/测试客户端的别名统一视为 127.0.0.1（ASGI 未提供客户端地址时同样视为本机）
+_LOCAL_ALIASES = ("", "0.0.0.0", "testclient", "localhost")
+
+
+def normalize_ip(ip: str | None) -> str:
+    """规范化客户端地址（本机别名 -> 127.0.0.1），保证拉黑与校验时哈希一致。"""
+    return "127.0.0.1" if not ip or ip in _LOCAL_ALIASES else ip
+
+
 def hash_ip(ip: str) -> str:
-    """对 IP 基于 APP_SECRET 进行哈希（仅用于风控/审计，不可逆）。"""
-    secret = os.getenv("APP_SECRET", "")
-    return hashlib.sha256((secret + "|" + ip).encode("utf-8")).hexdigest()
+    """对 IP 基于 APP_SECRET 进行带密钥哈希（HMAC-SHA256，仅用于风控/审计，不可逆）。
+
+    实现见 `app/services/iphash.py`（预构造的 HMAC 对象 + LRU 缓存 + 密钥轮换）。
+    """
+    from .services.iphash import ip_hasher
+
+    return ip_hasher.hash(ip)
 
 
 def ensure_dirs():
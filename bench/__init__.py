@@ -0,0 +1 @@
+"""性能基准与压测工具（仅开发使用，不随发布包分发）。"""
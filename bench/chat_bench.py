@@ -0,0 +1,130 @@
+"""匿名聊天中枢基准（不经网络）。
+
+在一个事件循环上创建 N 个房间（每房间 1 个车主 + 1 个扫码者，使用内存中的假 WebSocket），
+每个扫码者发送 M 条消息，统计：
+- 每连接内存（tracemalloc）；
+- 扇出吞吐（消息/秒）；
+- 落库：`ChatWriter` 批量写入与逐条提交的写入耗时（临时 SQLite 库）。
+
+用法：
+    python -m bench.chat_bench -n 2000 -m 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault("APP_SECRET", "bench-secret")
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import database, models  # noqa: E402
+from app.database import Base, _make_engine  # noqa: E402
+from app.services.chat import ChatHub, ChatWriter, PendingMessage  # noqa: E402
+
+
+class NullWS:
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+    async def send_text(self, text):
+        self.count += 1
+
+    async def close(self, code=1000):
+        pass
+
+
+class Rec:
+    def __init__(self, i):
+        self.id, self.owner_id, self.display_name, self.public_code = i, 1, None, f"c{i}"
+        self.notify_channel, self.bark_base_url, self.bark_token = "NONE", None, None
+
+
+async def bench_hub(n: int, m: int) -> dict:
+    writer = ChatWriter()
+    writer._write = lambda batch: []
+    hub = ChatHub(writer=writer, max_connections=2 * n + 1)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    scanners = []
+    for i in range(n):
+        hub.join(NullWS(), "OWNER", Rec(i))
+        scanners.append(hub.join(NullWS(), "SCANNER", Rec(i)))
+    await asyncio.sleep(0)
+    per_conn = (tracemalloc.get_traced_memory()[0] - before) / (2 * n)
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    for j in range(m):
+        for c in scanners:
+            hub.post(c, f"msg {j}")
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - t0
+    await writer.stop()
+    return {
+        "rooms": n,
+        "connections": hub.connections,
+        "bytes_per_connection": round(per_conn),
+        "fanout_msgs_per_sec": round(n * m / elapsed),
+    }
+
+
+def bench_persist(total: int) -> dict:
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        eng = _make_engine(url)
+        Base.metadata.create_all(bind=eng)
+        Session = sessionmaker(bind=eng)
+        db = Session()
+        user = models.User(username="bench", password_hash="x")
+        db.add(user)
+        db.flush()
+        code = models.Code(public_code="bench", owner_id=user.id)
+        db.add(code)
+        db.commit()
+        code_id = code.id
+        db.close()
+
+        t0 = time.perf_counter()
+        for i in range(total):
+            db = Session()
+            db.add(models.Message(code_id=code_id, sender="SCANNER", content_text=f"m{i}"))
+            db.commit()
+            db.close()
+        out["per_message_commit_sec"] = round(time.perf_counter() - t0, 3)
+
+        orig = database.SessionLocal
+        database.SessionLocal = Session
+        try:
+            items = [PendingMessage(code_id, 1, "bench", "SCANNER", f"m{i}", None, datetime.utcnow()) for i in range(total)]
+            t0 = time.perf_counter()
+            for i in range(0, total, 100):
+                ChatWriter._write(items[i:i + 100])
+            out["batched_commit_sec"] = round(time.perf_counter() - t0, 3)
+        finally:
+            database.SessionLocal = orig
+            eng.dispose()
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=2000, help="房间数")
+    ap.add_argument("-m", type=int, default=5, help="每个扫码者发送条数")
+    ap.add_argument("-p", type=int, default=2000, help="落库对比的消息条数")
+    args = ap.parse_args(argv)
+    report = asyncio.run(bench_hub(args.n, args.m))
+    report.update(bench_persist(args.p))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""冷启动耗时基准。
+
+测量：
+- `import_ms`：子进程内 `import app.main` 的耗时（不含解释器自身启动）；导入不应访问数据库；
+- `first_response_ms`：启动 uvicorn 到首个 `GET /login` 返回 200 的耗时（含解释器启动、导入与 lifespan 初始化）：
+  - `cold`：全新数据目录与空库（建表、迁移、创建管理员、编译模板）；
+  - `warm`：沿用上一次的库与 Jinja 字节码缓存（常规重启 / 新 worker）；
+  - `skip`：`APP_INIT=skip`（初始化已由 `python -m app.cli init` 在部署阶段完成）。
+
+各项重复 `-n` 次取中位数；`warm` 的中位数超过 `--target-ms` 时退出码为 1。
+
+用法：
+    python -m bench.cold_start -n 5 --target-ms 2500
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_SNIPPET = "import time; t = time.perf_counter(); import app.main; print((time.perf_counter() - t) * 1000)"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _env(data_dir: str, **extra) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "DB_URL": f"sqlite:///{os.path.join(data_dir, 'app.db')}",
+        "DATA_DIR": data_dir,
+        "APP_SECRET": "cold-start-secret",
+        "LOAD_ENV_FILE": "0",
+        "SQL_DEBUG": "0",
+        "PYTHONPATH": ROOT,
+    })
+    env.update(extra)
+    return env
+
+
+def import_ms(data_dir: str) -> float:
+    out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=_env(data_dir),
+                         capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def first_response_ms(data_dir: str, timeout: float = 60, **extra) -> float:
+    port = _free_port()
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning", "--no-access-log"]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=_env(data_dir, **extra))
+    try:
+        with httpx.Client() as client:
+            while time.perf_counter() - t0 < timeout:
+                if proc.poll() is not None:
+                    raise RuntimeError(f"server exited with {proc.returncode}")
+                try:
+                    if client.get(f"http://127.0.0.1:{port}/login").status_code == 200:
+                        return (time.perf_counter() - t0) * 1000
+                except httpx.TransportError:
+                    pass
+                time.sleep(0.01)
+        raise RuntimeError("server did not become ready")
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def _summary(values: list[float]) -> dict:
+    return {"median": round(statistics.median(values), 1), "min": round(min(values), 1), "max": round(max(values), 1)}
+
+
+def run(n: int) -> dict:
+    cold, warm, skip, imports = [], [], [], []
+    with tempfile.TemporaryDirectory(prefix="movecar-cold-") as tmp:
+        for i in range(n):
+            with tempfile.TemporaryDirectory(dir=tmp) as fresh:
+                cold.append(first_response_ms(fresh))
+        shared = os.path.join(tmp, "shared")
+        os.makedirs(shared)
+        first_response_ms(shared)  # 建库并写入模板字节码缓存
+        for _ in range(n):
+            imports.append(import_ms(shared))
+            warm.append(first_response_ms(shared))
+            skip.append(first_response_ms(shared, APP_INIT="skip"))
+    return {
+        "python": sys.version.split()[0],
+        "runs": n,
+        "import_ms": _summary(imports),
+        "first_response_ms": {"cold": _summary(cold), "warm": _summary(warm), "skip": _summary(skip)},
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=5, help="每项重复次数")
+    ap.add_argument("--target-ms", type=float, default=2500, help="warm 首个响应耗时目标（中位数，毫秒）")
+    args = ap.parse_args(argv)
+    report = run(args.n)
+    report["target_ms"] = args.target_ms
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    warm = report["first_response_ms"]["warm"]["median"]
+    if warm > args.target_ms:
+        print(f"REGRESSION warm cold start {warm}ms > target {args.target_ms}ms", file=sys.stderr)
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""IP 哈希微基准（hashes/sec）。
+
+对比：
+- legacy：旧版 `hash_ip`（每次读取 `APP_SECRET` 环境变量并拼接字符串后 SHA-256）；
+- hmac：预构造 HMAC 对象，每次 `copy()` + `update()`（不使用缓存）；
+- hmac_cached：在 hmac 基础上加 LRU（`--ips` 个不同 IP 循环出现）；
+- candidates：黑名单匹配所需的全部候选哈希（含一个旧密钥与旧格式，带缓存）。
+
+用法：
+    python -m bench.iphash_bench -n 200000 --ips 1000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+from app.services.iphash import IPHasher
+
+
+def legacy_hash_ip(ip: str) -> str:
+    secret = os.getenv("APP_SECRET", "")
+    return hashlib.sha256((secret + "|" + ip).encode("utf-8")).hexdigest()
+
+
+def _time(fn, ips: list[str], n: int) -> float:
+    k = len(ips)
+    t0 = time.perf_counter()
+    for i in range(n):
+        fn(ips[i % k])
+    return time.perf_counter() - t0
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=200000, help="哈希次数")
+    ap.add_argument("--ips", type=int, default=1000, help="不同 IP 数量")
+    args = ap.parse_args(argv)
+    os.environ.setdefault("APP_SECRET", "bench-secret")
+    ips = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}" for i in range(args.ips)]
+    uncached = IPHasher(os.environ["APP_SECRET"], cache_size=0)
+    cached = IPHasher(os.environ["APP_SECRET"], previous=("old-secret",))
+    results = {
+        "legacy": _time(legacy_hash_ip, ips, args.n),
+        "hmac": _time(uncached.hash, ips, args.n),
+        "hmac_cached": _time(cached.hash, ips, args.n),
+        "candidates": _time(cached.candidates, ips, args.n),
+    }
+    report = {"n": args.n, "ips": args.ips}
+    for name, seconds in results.items():
+        report[name] = {"seconds": round(seconds, 4), "per_sec": round(args.n / seconds, 1)}
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
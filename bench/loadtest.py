@@ -0,0 +1,404 @@
+"""端到端压测：真实 uvicorn 进程 + 临时 SQLite 库 + 本地 Bark 桩服务。
+
+流程：
+1. 在临时目录建库并写入种子数据：N 个用户、每人 M 个码、每码 K 条留言；每隔几个码配置 Bark 通知（指向桩服务）；
+2. 以子进程启动 `uvicorn app.main:app`（`--workers` 可调），等待就绪后登录全部用户；
+3. `-c` 个并发虚拟用户在 `-d` 秒内按权重混合发起请求：
+   - landing：扫码落地页 `GET /c/{code}`；
+   - message / message_image：提交留言（纯文本 / 附一张 JPEG），通过 `X-Forwarded-For` 模拟不同扫码者
+     （uvicorn 默认信任来自本机的代理头），不会被按 IP 限流误伤；
+   - qr：二维码 `GET /qr/{code}.png`（少量不同 scale，兼顾缓存命中与未命中）；
+   - dashboard：车主仪表盘 HTML；poll：增量接口 `GET /api/v1/messages?since=` + `If-None-Match`；
+4. 输出 JSON 报告：各端点请求数、错误数、吞吐与 p50/p95/p99（毫秒），以及桩服务收到的通知数。
+
+基线：`--save-baseline` 保存报告；`--baseline` 与已存报告对比，吞吐下降或 p95 上升超过 `--tolerance`
+（默认 30%，p95 另有 5ms 的绝对容差以过滤噪声）时列出回归并以退出码 1 结束。
+仓库中的 `bench/loadtest_baseline.json` 为参考机器上的结果，不同机器之间的数值不可直接比较，
+升级前后应在同一台机器上各跑一次。压测端与服务端同机运行，单核机器上压测端本身会占用一部分 CPU。
+
+用法：
+    python -m bench.loadtest -u 20 -m 5 -k 20 -c 32 -d 20 --out report.json
+    python -m bench.loadtest --baseline bench/loadtest_baseline.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from bench.stub_bark import StubBarkServer
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "landing=40,message=10,message_image=3,qr=20,dashboard=12,poll=15"
+PASSWORD = "loadtest"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _jpeg(size: int = 480) -> bytes:
+    """生成一张带噪点的 JPEG（避免被压缩得过小，接近手机照片缩略后的体积）。"""
+    from PIL import Image
+
+    img = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def seed(users: int, codes: int, messages: int, bark_url: str, bark_every: int = 4) -> list[dict]:
+    """写入种子数据（调用前须已设置 `DB_URL`），返回 [{"username", "codes": [public_code]}]。"""
+    from sqlalchemy import insert
+
+    from app import database
+    from app.models import Code, CodeNotifyPref, Message, User
+    from app.utils import generate_public_code, hash_password
+
+    database.init_db()
+    db = database.SessionLocal()
+    out = []
+    try:
+        now = datetime.utcnow()
+        pw = hash_password(PASSWORD)
+        for u in range(users):
+            user = User(username=f"load{u}", password_hash=pw)
+            db.add(user)
+            db.flush()
+            publics = []
+            for c in range(codes):
+                code = Code(public_code=generate_public_code(), owner_id=user.id, display_name=f"车{c}")
+                db.add(code)
+                db.flush()
+                publics.append(code.public_code)
+                if (u * codes + c) % bark_every == 0:
+                    db.add(CodeNotifyPref(code_id=code.id, channel="BARK", bark_base_url=bark_url, bark_token=f"t{code.id}"))
+                if messages:
+                    db.execute(insert(Message), [
+                        {
+                            "code_id": code.id,
+                            "sender": "SCANNER",
+                            "content_text": f"种子留言 {i}",
+                            "processed": i % 3 == 0,
+                            "created_at": now - timedelta(minutes=messages - i),
+                        }
+                        for i in range(messages)
+                    ])
+            out.append({"username": user.username, "codes": publics})
+        db.commit()
+    finally:
+        db.close()
+    return out
+
+
+def start_server(env: dict, port: int, workers: int) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+           "--log-level", "warning", "--no-access-log"]
+    if workers > 1:
+        cmd += ["--workers", str(workers)]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env)
+
+
+async def wait_ready(base: str, proc: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with {proc.returncode}")
+            try:
+                if (await client.get(f"{base}/login")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not become ready")
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    """最近秩百分位数（输入须已排序）。"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.statuses: dict[str, dict[str, int]] = {}
+
+    def add(self, name: str, seconds: float, status: str, ok: bool) -> None:
+        """记录一次请求；`status` 为响应码或异常类名。"""
+        self.latencies.setdefault(name, []).append(seconds)
+        by_status = self.statuses.setdefault(name, {})
+        by_status[status] = by_status.get(status, 0) + 1
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            endpoints[name] = {
+                "requests": len(values),
+                "errors": self.errors.get(name, 0),
+                "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+                "max_ms": round(values[-1] * 1000, 2),
+                "status": self.statuses[name],
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "total": {
+                "requests": total,
+                "errors": sum(self.errors.values()),
+                "rps": round(total / elapsed, 1),
+            },
+            "endpoints": endpoints,
+        }
+
+
+def _parse_mix(spec: str) -> dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip():
+            mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(ACTIONS)
+    if unknown:
+        raise SystemExit(f"unknown actions in --mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def _scanner_ip() -> str:
+    return f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+
+
+async def _landing(ctx, anon, owner):
+    return await anon.get(f"/c/{random.choice(ctx['codes'])}"), (200,)
+
+
+async def _message(ctx, anon, owner):
+    code = random.choice(ctx["codes"])
+    resp = await anon.post(
+        f"/c/{code}", data={"content_text": "您好，您的车挡住出口了，麻烦挪一下"},
+        headers={"X-Forwarded-For": _scanner_ip()},
+    )
+    return resp, (302, 303)
+
+
+async def _message_image(ctx, anon, owner):
+    code = random.choice(ctx["codes"])
+    resp = await anon.post(
+        f"/c/{code}", data={"content_text": "附照片"},
+        files={"uploaded": ("car.jpg", ctx["jpeg"], "image/jpeg")},
+        headers={"X-Forwarded-For": _scanner_ip()},
+    )
+    return resp, (302, 303)
+
+
+async def _qr(ctx, anon, owner):
+    return await anon.get(f"/qr/{random.choice(ctx['codes'])}.png", params={"scale": random.choice((6, 8, 10))}), (200,)
+
+
+async def _dashboard(ctx, anon, owner):
+    return await owner["client"].get("/dashboard"), (200,)
+
+
+async def _poll(ctx, anon, owner):
+    headers = {"If-None-Match": owner["etag"]} if owner.get("etag") else {}
+    resp = await owner["client"].get("/api/v1/messages", params={"since": owner.get("since", 0), "limit": 100},
+                                     headers=headers)
+    if resp.status_code == 200:
+        owner["since"] = resp.json()["next_since"]
+        owner["etag"] = None
+    elif resp.status_code == 304:
+        owner["etag"] = resp.headers.get("etag", owner.get("etag"))
+    return resp, (200, 304)
+
+
+ACTIONS = {
+    "landing": _landing,
+    "message": _message,
+    "message_image": _message_image,
+    "qr": _qr,
+    "dashboard": _dashboard,
+    "poll": _poll,
+}
+
+
+async def drive(base: str, seeded: list[dict], concurrency: int, duration: float, mix: dict[str, float],
+                warmup: float) -> tuple[Recorder, float]:
+    # 空闲连接在 uvicorn 的 keep-alive 超时（5 秒）之前淘汰，避免复用已被服务端关闭的连接
+    limits = httpx.Limits(max_connections=concurrency + 8, max_keepalive_connections=concurrency + 8, keepalive_expiry=4)
+    anon = httpx.AsyncClient(base_url=base, limits=limits, timeout=30, follow_redirects=False)
+    owners = []
+    for u in seeded:
+        client = httpx.AsyncClient(base_url=base, limits=httpx.Limits(max_connections=4, keepalive_expiry=4),
+                                   timeout=30)
+        resp = await client.post("/login", data={"username": u["username"], "password": PASSWORD})
+        if resp.status_code not in (302, 303):
+            raise RuntimeError(f"login failed for {u['username']}: {resp.status_code}")
+        # 首次全量同步取得游标，之后的轮询只关心新增
+        since, more = 0, True
+        while more:
+            body = (await client.get("/api/v1/messages", params={"since": since, "limit": 500})).json()
+            since, more = body["next_since"], body["has_more"]
+        owners.append({"client": client, "since": since, "etag": None})
+    ctx = {"codes": [c for u in seeded for c in u["codes"]], "jpeg": _jpeg()}
+    names, weights = list(mix), list(mix.values())
+    recorder = Recorder()
+    start = time.perf_counter() + warmup
+    stop = start + duration
+
+    async def vu():
+        while True:
+            now = time.perf_counter()
+            if now >= stop:
+                return
+            name = random.choices(names, weights)[0]
+            owner = random.choice(owners)
+            t0 = time.perf_counter()
+            try:
+                resp, expected = await ACTIONS[name](ctx, anon, owner)
+                status, ok = str(resp.status_code), resp.status_code in expected
+            except httpx.HTTPError as e:
+                status, ok = type(e).__name__, False
+            if t0 >= start:
+                recorder.add(name, time.perf_counter() - t0, status, ok)
+
+    try:
+        await asyncio.gather(*(vu() for _ in range(concurrency)))
+    finally:
+        await anon.aclose()
+        for o in owners:
+            await o["client"].aclose()
+    return recorder, duration
+
+
+def compare(report: dict, baseline: dict, tolerance: float, abs_ms: float = 5.0) -> list[str]:
+    """与基线对比，返回回归说明列表（为空表示通过）。"""
+    problems = []
+    base_rps, rps = baseline["total"]["rps"], report["total"]["rps"]
+    if rps < base_rps * (1 - tolerance):
+        problems.append(f"throughput {rps} rps < baseline {base_rps} rps")
+    for name, cur in report["endpoints"].items():
+        base = baseline["endpoints"].get(name)
+        if not base:
+            continue
+        if cur["p95_ms"] > base["p95_ms"] * (1 + tolerance) and cur["p95_ms"] - base["p95_ms"] > abs_ms:
+            problems.append(f"{name}: p95 {cur['p95_ms']}ms > baseline {base['p95_ms']}ms")
+        if cur["errors"] > base["errors"]:
+            problems.append(f"{name}: {cur['errors']} errors (baseline {base['errors']})")
+    return problems
+
+
+def run(args) -> dict:
+    mix = _parse_mix(args.mix)
+    with tempfile.TemporaryDirectory(prefix="movecar-load-") as tmp, StubBarkServer() as bark:
+        env = dict(os.environ)
+        env.update({
+            "DB_URL": f"sqlite:///{os.path.join(tmp, 'load.db')}",
+            "DATA_DIR": os.path.join(tmp, "data"),
+            "APP_SECRET": "loadtest-secret",
+            "LOAD_ENV_FILE": "0",
+            "SQL_DEBUG": "0",
+            "PYTHONPATH": ROOT,
+        })
+        os.environ.update({k: env[k] for k in ("DB_URL", "DATA_DIR", "APP_SECRET", "LOAD_ENV_FILE", "SQL_DEBUG")})
+        t0 = time.perf_counter()
+        seeded = seed(args.users, args.codes, args.messages, bark.base_url)
+        seed_sec = time.perf_counter() - t0
+        port = _free_port()
+        proc = start_server(env, port, args.workers)
+        base = f"http://127.0.0.1:{port}"
+        try:
+            asyncio.run(wait_ready(base, proc))
+            recorder, elapsed = asyncio.run(drive(base, seeded, args.concurrency, args.duration, mix, args.warmup))
+            # 给发件箱投递器一点时间把最后一批通知送达桩服务
+            time.sleep(1.0)
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        report = {
+            "config": {
+                "users": args.users,
+                "codes_per_user": args.codes,
+                "messages_per_code": args.messages,
+                "concurrency": args.concurrency,
+                "duration_sec": args.duration,
+                "workers": args.workers,
+                "mix": mix,
+            },
+            "machine": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "seed_sec": round(seed_sec, 2),
+            **recorder.summary(elapsed),
+            "notifications": {"bark_received": bark.count},
+        }
+    return report
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-u", "--users", type=int, default=20, help="用户数")
+    ap.add_argument("-m", "--codes", type=int, default=5, help="每个用户的码数")
+    ap.add_argument("-k", "--messages", type=int, default=20, help="每个码的种子留言数")
+    ap.add_argument("-c", "--concurrency", type=int, default=32, help="并发虚拟用户数")
+    ap.add_argument("-d", "--duration", type=float, default=20, help="压测时长（秒）")
+    ap.add_argument("-w", "--workers", type=int, default=1, help="uvicorn worker 数")
+    ap.add_argument("--warmup", type=float, default=2, help="预热秒数（不计入统计）")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"请求权重（默认 {DEFAULT_MIX}）")
+    ap.add_argument("--seed", type=int, default=1, help="随机种子")
+    ap.add_argument("--out", help="报告输出路径（默认打印到标准输出）")
+    ap.add_argument("--save-baseline", help="将报告保存为基线")
+    ap.add_argument("--baseline", help="与基线报告对比")
+    ap.add_argument("--tolerance", type=float, default=0.3, help="允许的相对回归（默认 0.3）")
+    args = ap.parse_args(argv)
+    random.seed(args.seed)
+
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(report, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}", file=sys.stderr)
+        if problems:
+            raise SystemExit(1)
+        print("no regression against baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
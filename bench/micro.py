@@ -0,0 +1,308 @@
+"""热点函数微基准（离线、可跨提交对比、超阈值失败）。
+
+覆盖：
+- `RateLimiter.allow`（memory 后端，1000 个键轮流判定）；
+- 通知放行判定：`CircuitBreaker.allow`（每次发送 Bark 前的熔断检查）；
+- `hash_ip`（LRU 命中与未命中）、`hash_password` / `verify_password`、`generate_public_code`；
+- segno 二维码渲染：PNG 在 `qr_png` 允许的缩放范围两端及默认值（2/8/20），以及 SVG；
+- Jinja 渲染 `landing.html`、`dashboard.html`（5 个码 + 一整页留言，与线上上下文一致）。
+
+计时方式：每项自动确定单批次调用次数（单批不少于 `--min-time` 秒），重复 `--repeat` 批取最小值
+作为 ns/op（最小值受调度与 GC 噪声影响最小），全部项轮流测 `--rounds` 轮取居中一轮。每项之前紧挨着测量一个纯 Python 参照负载，
+以“参照单位”（ns/op ÷ 参照 ns）记录结果，使同一基线在不同机器间也大致可比；
+对比基线时疑似回归的项会复测（`--retries`），仍超出阈值才判定失败。
+
+用法：
+    python -m bench.micro                      # 运行全部并打印 JSON
+    python -m bench.micro -k qr                # 只运行名称包含 qr 的项
+    python -m bench.micro --baseline bench/micro_baseline.json   # 回归超过 30% 时退出码为 1
+    python -m bench.micro --save-baseline bench/micro_baseline.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+os.environ.setdefault("APP_SECRET", "bench-secret")
+# 只渲染模板、不访问数据库；避免导入页面模块时指向开发库
+os.environ.setdefault("DB_URL", "sqlite://")
+
+BENCHES: dict[str, Callable[[], Callable[[], object]]] = {}
+
+
+def bench(name: str):
+    """注册一项基准：被装饰函数负责准备数据并返回无参的被测调用。"""
+
+    def deco(factory):
+        BENCHES[name] = factory
+        return factory
+
+    return deco
+
+
+def _reference() -> int:
+    """参照负载：字典/字符串/排序的混合，代表一般解释器开销。"""
+    d = {}
+    for i in range(200):
+        d[f"k{i}"] = i * 7 % 13
+    return len(sorted(d.items(), key=lambda kv: kv[1]))
+
+
+@bench("rate_limiter.allow")
+def _rate_limiter():
+    from app.services.rate_limit import MemoryBackend, RateLimiter
+
+    limiter = RateLimiter(MemoryBackend(window=60, count=5, max_keys=100000))
+    keys = [(f"10.0.{i // 256}.{i % 256}", "abcDEF123") for i in range(1000)]
+    it = iter(range(1 << 62))
+    return lambda: limiter.allow(keys[next(it) % 1000])
+
+
+@bench("notify.breaker_allow")
+def _breaker_allow():
+    from app.services.notify import CircuitBreaker
+
+    breaker = CircuitBreaker()
+    breaker.record_failure("https://api.day.app")
+    return lambda: breaker.allow("https://api.day.app")
+
+
+@bench("hash_ip.hit")
+def _hash_ip_hit():
+    from app.utils import hash_ip
+
+    ips = [f"192.168.{i // 256}.{i % 256}" for i in range(256)]
+    it = iter(range(1 << 62))
+    return lambda: hash_ip(ips[next(it) % 256])
+
+
+@bench("hash_ip.miss")
+def _hash_ip_miss():
+    from app.utils import hash_ip
+
+    it = iter(range(1 << 62))
+
+    def call():
+        i = next(it)
+        return hash_ip(f"{(i >> 24) & 255}.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}")
+
+    return call
+
+
+@bench("hash_password")
+def _hash_password():
+    from app.utils import hash_password
+
+    return lambda: hash_password("correct horse battery staple")
+
+
+@bench("verify_password")
+def _verify_password():
+    from app.utils import hash_password, verify_password
+
+    stored = hash_password("correct horse battery staple")
+    return lambda: verify_password("correct horse battery staple", stored)
+
+
+@bench("generate_public_code")
+def _generate_public_code():
+    from app.utils import generate_public_code
+
+    return generate_public_code
+
+
+def _qr(kind: str, scale: int):
+    def factory():
+        from app.services.qr import render_qr
+
+        return lambda: render_qr("https://movecar.example.com/c/Xy3_k9PqLmA", kind, scale, 2)
+
+    return factory
+
+
+for _scale in (2, 8, 20):
+    bench(f"qr.png.scale{_scale}")(_qr("png", _scale))
+bench("qr.svg.scale8")(_qr("svg", 8))
+
+
+def _request(path: str):
+    from starlette.requests import Request
+
+    return Request({"type": "http", "method": "GET", "path": path, "query_string": b"", "headers": [], "session": {}})
+
+
+def _site_vars() -> dict:
+    from app.services.site import DEFAULT_SITE_TITLE, SiteContext
+
+    site = SiteContext(title=DEFAULT_SITE_TITLE, footer_html="<p>© 2026 Move Car</p>", base_url="https://movecar.example.com")
+    return {"site": site, "site_title": site.title, "site_footer_html": site.footer_html, "site_base_url": site.base_url}
+
+
+@bench("render.landing")
+def _render_landing():
+    from app.routes.pages import templates
+    from app.services.codes import CodeRecord
+
+    code = CodeRecord(1, "Xy3_k9PqLmA", 1, "ACTIVE", "京A·12345", "BARK", "https://api.day.app", "token")
+    tpl = templates.get_template("landing.html")
+    ctx = {"request": _request("/c/Xy3_k9PqLmA"), "session": {}, "error": None, "code": code, "chat_enabled": True, **_site_vars()}
+    return lambda: tpl.render(ctx)
+
+
+@bench("render.dashboard")
+def _render_dashboard():
+    from app.models import Code, User
+    from app.routes.pages import DASHBOARD_PAGE_SIZE, templates
+    from app.services.feed import MessageRow, encode_cursor
+
+    now = datetime(2026, 10, 18, 12, 0, 0)
+    user = User(id=1, username="admin")
+    codes = [
+        Code(id=i, public_code=f"code{i:07d}", owner_id=1, display_name=f"京A·1234{i}",
+             status="ACTIVE" if i % 4 else "INACTIVE", created_at=now - timedelta(days=i))
+        for i in range(1, 6)
+    ]
+    messages = [
+        MessageRow(
+            id=1000 - i, code_id=codes[i % 5].id, code_label=codes[i % 5].display_name,
+            content_text="您好，您的车挡住了出口，麻烦尽快挪一下，谢谢！" if i % 3 else None,
+            image_path=f"uploads/{i}.jpg" if i % 3 == 0 else None,
+            thumb_path=f"uploads/{i}.thumb.jpg" if i % 3 == 0 else None,
+            processed=i % 2 == 0, created_at=now - timedelta(minutes=7 * i),
+            notify_status="SENT" if i % 5 else "FAILED", notify_attempts=1 + i % 3,
+            notify_error=None if i % 5 else "timeout",
+        )
+        for i in range(DASHBOARD_PAGE_SIZE)
+    ]
+    tpl = templates.get_template("dashboard.html")
+    ctx = {
+        "request": _request("/dashboard"),
+        "session": {"user_id": 1},
+        "user": user,
+        "codes": codes,
+        "unprocessed": {c.id: 3 for c in codes},
+        "messages": messages,
+        "next_cursor": encode_cursor(messages[-1].created_at, messages[-1].id),
+        "cursor": None,
+        "filter_processed": "",
+        "filter_code": None,
+        "chat_enabled": True,
+        **_site_vars(),
+        "saved": None,
+    }
+    return lambda: tpl.render(ctx)
+
+
+def measure(fn: Callable[[], object], min_time: float, repeat: int) -> dict:
+    """返回最小/中位 ns/op；先按倍增确定单批次调用次数。"""
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= min_time:
+            break
+        number *= 2
+    samples = []
+    gc_was = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            t0 = time.perf_counter_ns()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter_ns() - t0) / number)
+    finally:
+        if gc_was:
+            gc.enable()
+    samples.sort()
+    return {"ns_per_op": round(samples[0], 1), "median_ns": round(samples[len(samples) // 2], 1), "number": number}
+
+
+def measure_item(name: str, min_time: float, repeat: int) -> dict:
+    """测量一项；参照负载紧挨着测量，抵消机器忙闲变化。"""
+    ref = measure(_reference, min_time, repeat)["ns_per_op"]
+    r = measure(BENCHES[name](), min_time, repeat)
+    r["relative"] = round(r["ns_per_op"] / ref, 4)
+    return r
+
+
+def run(pattern: str | None, min_time: float, repeat: int, rounds: int) -> dict:
+    """各项轮流测量 `rounds` 轮，每项取参照单位居中的一轮。"""
+    names = [name for name in BENCHES if not pattern or pattern in name]
+    samples: dict[str, list[dict]] = {name: [] for name in names}
+    for _ in range(rounds):
+        for name in names:
+            samples[name].append(measure_item(name, min_time, repeat))
+    results = {}
+    for name, rs in samples.items():
+        rs.sort(key=lambda r: r["relative"])
+        results[name] = rs[len(rs) // 2]
+    return {"python": sys.version.split()[0], "rounds": rounds, "results": results}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """按参照单位与基线对比，返回回归说明列表（为空表示通过）。"""
+    problems = []
+    for name, cur in report["results"].items():
+        base = baseline["results"].get(name)
+        if base and cur["relative"] > base["relative"] * (1 + tolerance):
+            pct = (cur["relative"] / base["relative"] - 1) * 100
+            problems.append(f"{name}: {cur['relative']} > baseline {base['relative']} (+{pct:.0f}%, {cur['ns_per_op']}ns/op)")
+    return problems
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-k", dest="pattern", help="只运行名称包含该子串的项")
+    ap.add_argument("--min-time", type=float, default=0.05, help="单批次最短耗时（秒）")
+    ap.add_argument("--repeat", type=int, default=7, help="重复批次数（取最小值）")
+    ap.add_argument("--rounds", type=int, default=3, help="轮数（各项轮流测量，取居中一轮）")
+    ap.add_argument("--out", help="报告输出路径（默认打印到标准输出）")
+    ap.add_argument("--save-baseline", help="将报告保存为基线")
+    ap.add_argument("--baseline", help="与基线报告对比")
+    ap.add_argument("--tolerance", type=float, default=0.3, help="允许的相对回归（默认 0.3）")
+    ap.add_argument("--retries", type=int, default=2, help="疑似回归项的复测次数")
+    ap.add_argument("--list", action="store_true", help="列出全部基准项")
+    args = ap.parse_args(argv)
+    if args.list:
+        print("\n".join(BENCHES))
+        return
+
+    report = run(args.pattern, args.min_time, args.repeat, args.rounds)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        problems = compare(report, baseline, args.tolerance)
+        # 疑似回归的项复测，取更好的一次，避免偶发抖动误报
+        for _ in range(args.retries):
+            if not problems:
+                break
+            for name in [p.split(":", 1)[0] for p in problems]:
+                again = measure_item(name, args.min_time, args.repeat)
+                if again["relative"] < report["results"][name]["relative"]:
+                    report["results"][name] = again
+            problems = compare(report, baseline, args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}", file=sys.stderr)
+        if problems:
+            raise SystemExit(1)
+        print("no regression against baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""通知发送吞吐基准（每秒通知数）。
+
+对比：
+- legacy：每条通知新建 `httpx.Client`（旧实现的方式）；
+- pooled：共享 `httpx.AsyncClient` 连接池 + 有界并发（当前实现）。
+
+用法：
+    python -m bench.notify_bench -n 500 -c 16 [--delay 0.005]
+输出 JSON：各模式的总耗时与 notifications/sec。
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from bench.stub_bark import StubBarkServer
+from app.services.notify import notify_http, send_bark_async
+
+
+def run_legacy(base_url: str, n: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        with httpx.Client(timeout=5.0) as client:
+            client.post(f"{base_url}/tok", json={"title": "t", "body": str(i)})
+    return time.perf_counter() - t0
+
+
+async def run_pooled(base_url: str, n: int, concurrency: int) -> float:
+    await notify_http.start()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with sem:
+            ok, msg = await send_bark_async(base_url, "tok", "t", str(i))
+            assert ok, msg
+
+    try:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n)))
+        return time.perf_counter() - t0
+    finally:
+        await notify_http.aclose()
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=500, help="通知条数")
+    ap.add_argument("-c", type=int, default=16, help="pooled 模式并发数")
+    ap.add_argument("--delay", type=float, default=0.0, help="桩服务每次响应延迟（秒）")
+    args = ap.parse_args(argv)
+    with StubBarkServer(delay=args.delay) as bark:
+        legacy = run_legacy(bark.base_url, args.n)
+        pooled = asyncio.run(run_pooled(bark.base_url, args.n, args.c))
+    report = {
+        "n": args.n,
+        "concurrency": args.c,
+        "legacy": {"seconds": round(legacy, 4), "per_sec": round(args.n / legacy, 1)},
+        "pooled": {"seconds": round(pooled, 4), "per_sec": round(args.n / pooled, 1)},
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""限流后端判定吞吐基准（decisions/sec）。
+
+对比 memory 与 sqlite 后端：
+- 单进程：对 `--keys` 个不同键轮流判定；
+- sqlite 多进程：`-p` 个进程共享同一库文件并发判定（模拟多 worker）；
+- 洪泛：memory 后端依次判定 `--flood` 个不同键，记录跟踪键数与内存占用（tracemalloc）。
+
+用法：
+    python -m bench.ratelimit_bench -n 20000 --keys 1000 -p 4 --flood 1000000
+输出 JSON：各场景的总耗时与 decisions/sec，以及洪泛后的键数与内存。
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+
+from app.services.rate_limit import MemoryBackend, SQLiteBackend
+
+
+def _run(backend, n: int, keys: int) -> float:
+    t0 = time.perf_counter()
+    for i in range(n):
+        backend.allow((f"10.0.{i % keys // 256}.{i % 256}", "bench"))
+    return time.perf_counter() - t0
+
+
+def _worker(path: str, n: int, keys: int, out) -> None:
+    out.put(_run(SQLiteBackend(path, window=60, count=10), n, keys))
+
+
+def run_sqlite_multi(path: str, n: int, keys: int, procs: int) -> float:
+    ctx = multiprocessing.get_context("spawn")
+    q = ctx.Queue()
+    workers = [ctx.Process(target=_worker, args=(path, n, keys, q)) for _ in range(procs)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for _ in workers:
+        q.get()
+    elapsed = time.perf_counter() - t0
+    for w in workers:
+        w.join()
+    return elapsed
+
+
+def run_flood(n: int, max_keys: int) -> dict:
+    backend = MemoryBackend(window=60, count=1, max_keys=max_keys)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    for i in range(n):
+        backend.allow((f"{i >> 16}.{(i >> 8) & 255}.{i & 255}", "bench"))
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "keys_seen": n,
+        "tracked_keys": len(backend),
+        "per_sec": round(n / elapsed, 1),
+        "memory_mb": round(current / 1e6, 1),
+        "peak_mb": round(peak / 1e6, 1),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=20000, help="每个进程的判定次数")
+    ap.add_argument("--keys", type=int, default=1000, help="不同键数量")
+    ap.add_argument("-p", type=int, default=4, help="sqlite 多进程场景的进程数")
+    ap.add_argument("--flood", type=int, default=0, help="洪泛场景的不同键数量（0 表示跳过）")
+    ap.add_argument("--max-keys", type=int, default=100_000, help="洪泛场景 memory 后端的键数上限")
+    args = ap.parse_args(argv)
+
+    def rate(seconds: float, total: int) -> dict:
+        return {"seconds": round(seconds, 4), "per_sec": round(total / seconds, 1)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = _run(MemoryBackend(window=60, count=10), args.n, args.keys)
+        sqlite_single = _run(SQLiteBackend(os.path.join(tmp, "single.db"), window=60, count=10), args.n, args.keys)
+        multi_path = os.path.join(tmp, "multi.db")
+        SQLiteBackend(multi_path, window=60, count=10)
+        sqlite_multi = run_sqlite_multi(multi_path, args.n, args.keys, args.p)
+    report = {
+        "n": args.n,
+        "keys": args.keys,
+        "memory": rate(memory, args.n),
+        "sqlite": rate(sqlite_single, args.n),
+        f"sqlite_x{args.p}_procs": rate(sqlite_multi, args.n * args.p),
+    }
+    if args.flood:
+        report["flood"] = run_flood(args.flood, args.max_keys)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
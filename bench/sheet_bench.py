@@ -0,0 +1,82 @@
+"""批量发放基准：创建 N 个挪车码并渲染 A4 多联打印文件。
+
+对比：
+- create_loop：逐个 `generate_public_code` + 单独提交（原先逐个新建的方式）；
+- create_bulk：`bulk_create_codes` 单事务批量写入；
+- render：PDF/SVG 打印文件在当前进程渲染与进程池渲染（`-j` 个 worker）的耗时。
+
+用法：
+    python -m bench.sheet_bench -n 1000 -j 4
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("APP_SECRET", "bench-secret")
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import Base, _make_engine  # noqa: E402
+from app.services.provision import bulk_create_codes, owner_stickers  # noqa: E402
+from app.services.sheet import SheetRenderer  # noqa: E402
+from app.utils import generate_public_code  # noqa: E402
+
+
+def _session(tmp: str):
+    eng = _make_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+    Base.metadata.create_all(bind=eng)
+    db = sessionmaker(bind=eng)()
+    user = models.User(username="bench", password_hash="x")
+    db.add(user)
+    db.commit()
+    return eng, db, user.id
+
+
+def bench_create(n: int) -> dict:
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        eng, db, owner_id = _session(tmp)
+        try:
+            t0 = time.perf_counter()
+            for i in range(n):
+                db.add(models.Code(public_code=generate_public_code(), owner_id=owner_id, display_name=f"loop-{i}"))
+                db.commit()
+            out["create_loop_sec"] = round(time.perf_counter() - t0, 3)
+            t0 = time.perf_counter()
+            codes = bulk_create_codes(db, owner_id, n, "bulk-")
+            out["create_bulk_sec"] = round(time.perf_counter() - t0, 3)
+            stickers = owner_stickers(db, owner_id, "https://movecar.example.com", codes[0].id, codes[-1].id)
+        finally:
+            db.close()
+            eng.dispose()
+    return out, stickers
+
+
+def bench_render(stickers, workers: int) -> dict:
+    out = {}
+    for label, renderer in (("serial", SheetRenderer(workers=1)), (f"pool_{workers}", SheetRenderer(workers=workers))):
+        for fmt in ("pdf", "svg"):
+            t0 = time.perf_counter()
+            size = sum(len(chunk) for chunk in renderer.iter_sheet(fmt, stickers))
+            out[f"{fmt}_{label}_sec"] = round(time.perf_counter() - t0, 3)
+            out[f"{fmt}_bytes"] = size
+        renderer.shutdown(wait=True)
+    return out
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=1000, help="挪车码数量")
+    ap.add_argument("-j", type=int, default=os.cpu_count() or 1, help="渲染进程数")
+    args = ap.parse_args(argv)
+    report, stickers = bench_create(args.n)
+    report.update(bench_render(stickers, args.j))
+    print(json.dumps({"count": args.n, "workers": args.j, "cpus": os.cpu_count(), **report}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""SQLite 并发读写吞吐基准。
+
+模拟扫码留言（每条一个事务写入 `messages`）与仪表盘读取（游标分页查询）并发进行，对比：
+- legacy：库默认配置（回滚日志、无 busy_timeout、读写共用默认连接池）；
+- profile：WAL + 调优 PRAGMA，单连接写引擎 + 只读连接池（当前实现）。
+
+用法：
+    python -m bench.sqlite_profile -w 8 -r 4 -n 200
+输出 JSON：各模式的写入/读取次数、每秒吞吐与 "database is locked" 错误数。
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("APP_SECRET", "bench-secret")
+
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import Base, _make_engine  # noqa: E402
+from app.migrations import run_migrations  # noqa: E402
+from app.services.feed import fetch_message_page  # noqa: E402
+
+
+def _setup(url: str) -> tuple[int, int]:
+    eng = _make_engine(url, profile=False)
+    Base.metadata.create_all(bind=eng)
+    run_migrations(eng)
+    db = sessionmaker(bind=eng)()
+    try:
+        user = models.User(username="bench", password_hash="x")
+        db.add(user)
+        db.flush()
+        code = models.Code(public_code="bench", owner_id=user.id)
+        db.add(code)
+        db.commit()
+        return user.id, code.id
+    finally:
+        db.close()
+        eng.dispose()
+
+
+def run(mode: str, writers: int, readers: int, per_writer: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        owner_id, code_id = _setup(url)
+        profile = mode == "profile"
+        writer = _make_engine(url, profile=profile)
+        reader = _make_engine(url, readonly=True, profile=True) if profile else writer
+        WriteSession = sessionmaker(bind=writer)
+        ReadSession = sessionmaker(bind=reader)
+        lock = threading.Lock()
+        stats = {"writes": 0, "reads": 0, "locked": 0}
+        done = threading.Event()
+
+        def write_loop(i: int):
+            for j in range(per_writer):
+                db = WriteSession()
+                try:
+                    db.add(models.Message(code_id=code_id, content_text=f"w{i}-{j}", ip_hash="h"))
+                    db.commit()
+                    with lock:
+                        stats["writes"] += 1
+                except OperationalError:
+                    db.rollback()
+                    with lock:
+                        stats["locked"] += 1
+                finally:
+                    db.close()
+
+        def read_loop():
+            while not done.is_set():
+                db = ReadSession()
+                try:
+                    fetch_message_page(db, owner_id, limit=50)
+                    with lock:
+                        stats["reads"] += 1
+                except OperationalError:
+                    with lock:
+                        stats["locked"] += 1
+                finally:
+                    db.close()
+
+        rthreads = [threading.Thread(target=read_loop) for _ in range(readers)]
+        wthreads = [threading.Thread(target=write_loop, args=(i,)) for i in range(writers)]
+        t0 = time.perf_counter()
+        for t in rthreads + wthreads:
+            t.start()
+        for t in wthreads:
+            t.join()
+        elapsed = time.perf_counter() - t0
+        done.set()
+        for t in rthreads:
+            t.join()
+        writer.dispose()
+        if reader is not writer:
+            reader.dispose()
+    return {
+        "seconds": round(elapsed, 3),
+        "writes": stats["writes"],
+        "writes_per_sec": round(stats["writes"] / elapsed, 1),
+        "reads": stats["reads"],
+        "reads_per_sec": round(stats["reads"] / elapsed, 1),
+        "locked_errors": stats["locked"],
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-w", type=int, default=8, help="写线程数")
+    ap.add_argument("-r", type=int, default=4, help="读线程数")
+    ap.add_argument("-n", type=int, default=200, help="每个写线程的写入条数")
+    args = ap.parse_args(argv)
+    report = {
+        "writers": args.w,
+        "readers": args.r,
+        "per_writer": args.n,
+        "legacy": run("legacy", args.w, args.r, args.n),
+        "profile": run("profile", args.w, args.r, args.n),
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
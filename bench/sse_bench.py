@@ -0,0 +1,72 @@
+"""SSE 事件代理扇出基准。
+
+在单个事件循环上挂起 N 个订阅者（模拟空闲的仪表盘长连接），从工作线程（模拟同步路由）
+向同一车主发布事件，统计全部连接收到事件的耗时与进程内存增量。
+
+用法：
+    python -m bench.sse_bench -n 5000 -e 20
+"""
+
+import argparse
+import asyncio
+import json
+import resource
+import threading
+import time
+
+from app.services.events import EventBroker
+
+
+def _rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run(n: int, events: int) -> dict:
+    broker = EventBroker(queue_size=100, heartbeat=30, max_connections=n, max_age=3600)
+    rss0 = _rss_mb()
+    received = 0
+    done = asyncio.Event()
+
+    async def client():
+        nonlocal received
+        async for chunk in broker.stream(1):
+            if chunk.startswith("event:"):
+                received += 1
+                if received == n * events:
+                    done.set()
+
+    t0 = time.perf_counter()
+    tasks = [asyncio.create_task(client()) for _ in range(n)]
+    while len(broker) < n:
+        await asyncio.sleep(0.01)
+    connect_sec = time.perf_counter() - t0
+    rss1 = _rss_mb()
+
+    t0 = time.perf_counter()
+    threading.Thread(
+        target=lambda: [broker.publish(1, "message", {"id": i, "content_text": "挡路了"}) for i in range(events)]
+    ).start()
+    await asyncio.wait_for(done.wait(), timeout=120)
+    fanout_sec = time.perf_counter() - t0
+    broker.close()
+    await asyncio.gather(*tasks)
+    return {
+        "subscribers": n,
+        "events": events,
+        "connect_sec": round(connect_sec, 3),
+        "fanout_sec": round(fanout_sec, 3),
+        "deliveries_per_sec": round(n * events / fanout_sec),
+        "rss_per_subscriber_kb": round((rss1 - rss0) * 1024 / n, 2),
+    }
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("-n", type=int, default=5000, help="订阅者数量")
+    ap.add_argument("-e", type=int, default=20, help="发布事件数")
+    args = ap.parse_args(argv)
+    print(json.dumps(asyncio.run(run(args.n, args.e)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
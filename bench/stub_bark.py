@@ -0,0 +1,86 @@
+"""本地 Bark 桩服务。
+
+在后台线程中启动一个最小的 HTTP 服务，模拟 `POST {base}/{token}` 接口，
+用于测试通知发送、熔断与基准测试（无需外网）。
+
+用法：
+    with StubBarkServer() as bark:
+        send_bark(bark.base_url, "token", "标题", "正文")
+        assert bark.count == 1
+"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubBarkServer:
+    """可配置响应码与延迟的 Bark 桩服务。
+
+    属性：
+    - status: 返回的 HTTP 状态码（默认 200，可在运行中修改以模拟故障）
+    - delay: 每次响应前的延迟秒数
+    - received: 已收到的 (token, payload) 列表
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, status: int = 200, delay: float = 0.0):
+        self.status = status
+        self.delay = delay
+        self.received: list[tuple[str, dict]] = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持 keep-alive，便于对比连接复用
+
+            def do_POST(self):  # noqa: N802
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    payload = json.loads(raw or b"{}")
+                except ValueError:
+                    payload = {}
+                with server._lock:
+                    server.received.append((self.path.strip("/"), payload))
+                if server.delay:
+                    time.sleep(server.delay)
+                code = server.status
+                body = json.dumps({"code": code, "message": "success" if code == 200 else "error"}).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def count(self) -> int:
+        with self._lock:
+            return len(self.received)
+
+    def start(self) -> "StubBarkServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="stub-bark", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "StubBarkServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
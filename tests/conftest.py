@@ -0,0 +1,90 @@
+import os
+import re
+from contextlib import contextmanager
+
+import pytest
+
+# 测试中开启 SQL 调试：Server-Timing 响应头与 N+1 检测（须在导入 app 之前设置）
+os.environ.setdefault("SQL_DEBUG", "1")
+
+from bench.stub_bark import StubBarkServer  # noqa: E402
+from app.services.metrics import capture_requests  # noqa: E402
+
+APP_DATA = "app-data"
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    """测试库、数据目录与 Jinja 字节码缓存放在本次会话的临时目录下，不写入仓库中的 `data/`。
+
+    测试模块在收集阶段就会导入 `app.main`（挂载 `/media` 时即读取 `DATA_DIR`），因此在收集之前设置环境变量；
+    目录取自会话的 `tmp_path_factory`，与 `app_data_dir` 夹具返回的是同一个目录。
+    """
+    data_dir = config._tmp_path_factory.mktemp(APP_DATA, numbered=False)
+    os.environ["DB_URL"] = f"sqlite:///{data_dir / 'test.db'}"
+    os.environ["DATA_DIR"] = str(data_dir)
+    os.environ["TEMPLATE_CACHE_DIR"] = str(data_dir / "jinja-cache")
+
+
+@pytest.fixture(scope="session")
+def app_data_dir(tmp_path_factory):
+    """本次测试会话的数据目录（`DATA_DIR`）。"""
+    return tmp_path_factory.getbasetemp() / APP_DATA
+
+
+@pytest.fixture(scope="session", autouse=True)
+def app_initialized(app_data_dir):
+    """导入应用不再初始化数据库：测试会话开始时执行一次启动初始化（直接访问数据库的测试依赖它）。"""
+    assert os.environ["DATA_DIR"] == str(app_data_dir)
+    os.environ.setdefault("APP_SECRET", "test-secret")
+    from app.startup import initializer
+
+    initializer.run()
+
+
+@pytest.fixture
+def new_code():
+    """以 admin 登录并新建一个挪车码，返回 (code_id, public_code)。
+
+    用法：
+        code_id, public = new_code(client, "备注")
+    """
+
+    def create(client, name: str = "测试码") -> tuple[int, str]:
+        client.post("/login", data={"username": "admin", "password": "admin"})
+        client.post("/codes", data={"display_name": name})
+        # 仪表盘按创建时间倒序，第一个即为刚创建的码
+        m = re.search(r'data-id="(\d+)"\s+data-public="([A-Za-z0-9_\-]+)"', client.get("/dashboard").text)
+        assert m, "code not found on dashboard"
+        return int(m.group(1)), m.group(2)
+
+    return create
+
+
+@pytest.fixture
+def stub_bark():
+    """本地 Bark 桩服务（随机端口），用于通知相关测试。"""
+    with StubBarkServer() as server:
+        yield server
+
+
+@pytest.fixture
+def max_queries():
+    """断言代码块内每个 HTTP 请求的 SQL 语句数不超过上限，且没有重复语句（N+1）。
+
+    用法：
+        with max_queries(3):
+            client.get("/dashboard")
+    """
+
+    @contextmanager
+    def check(limit: int, allow_duplicates: bool = False):
+        with capture_requests() as captured:
+            yield captured
+        assert captured, "no request captured"
+        for method, route, stats in captured:
+            assert stats.db_queries <= limit, f"{method} {route}: {stats.report()}"
+            if not allow_duplicates:
+                assert not stats.duplicates(), f"{method} {route}: {stats.report()}"
+
+    return check
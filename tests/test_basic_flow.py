@@ -13,8 +13,9 @@ from app.database import init_db  # noqa: E402
 
 def setup_module(module):
     # ensure fresh db
-    if os.path.exists("data/test.db"):
-        os.remove("data/test.db")
+    db_path = os.environ["DB_URL"].split("sqlite:///", 1)[-1]
+    if os.path.exists(db_path):
+        os.remove(db_path)
     os.makedirs("app/uploads", exist_ok=True)
     init_db()
 
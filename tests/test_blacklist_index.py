@@ -0,0 +1,59 @@
+import os
+import re
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Blacklist  # noqa: E402
+from app.services.blacklist import BlacklistIndex, blacklist_index  # noqa: E402
+from app.utils import hash_ip  # noqa: E402
+
+
+def test_index_expiry_global_and_compaction():
+    idx = BlacklistIndex()
+    idx.clear()
+    idx._loaded = True  # 不从数据库加载
+    past = datetime.utcnow() - timedelta(minutes=1)
+    future = datetime.utcnow() + timedelta(minutes=5)
+    idx.add(1, "a", until=None)
+    idx.add(1, "b", until=past)
+    idx.add(None, "g", until=future)
+    assert idx.is_blocked(1, "a")
+    assert not idx.is_blocked(1, "b")  # 已过期
+    assert idx.is_blocked(2, "g") and idx.is_blocked(1, "g")  # 全局条目
+    assert not idx.is_blocked(2, "a")
+    assert idx.compact() == 1 and len(idx) == 2
+    idx.drop_code(1)
+    assert not idx.is_blocked(1, "a") and idx.is_blocked(1, "g")
+
+
+def test_blocklist_api_updates_index_and_global_rows_load():
+    client = TestClient(app)
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    client.post("/codes", data={"display_name": "黑名单索引"})
+    r = client.get("/dashboard")
+    code_id, public_code = re.search(r'data-id="(\d+)"\s+data-public="([A-Za-z0-9_\-]+)"', r.text).groups()
+
+    r = client.post("/api/v1/blocklist", data={"code_id": code_id, "ip": "10.9.8.7", "ttl_minutes": 5})
+    assert r.status_code == 200
+    assert blacklist_index.is_blocked(int(code_id), hash_ip("10.9.8.7"))
+
+    # 全局条目（code_id 为空）与已过期条目：重载后前者生效、后者被跳过
+    db = SessionLocal()
+    try:
+        db.add(Blacklist(code_id=None, ip_hash=hash_ip("10.1.1.1")))
+        db.add(Blacklist(code_id=int(code_id), ip_hash=hash_ip("10.2.2.2"), until=datetime.utcnow() - timedelta(seconds=1)))
+        db.commit()
+    finally:
+        db.close()
+    blacklist_index.load()
+    assert blacklist_index.is_blocked(int(code_id), hash_ip("10.1.1.1"))
+    assert not blacklist_index.is_blocked(int(code_id), hash_ip("10.2.2.2"))
+    # 测试客户端按本机地址（127.0.0.1）处理，不受上述条目影响
+    r = client.post(f"/c/{public_code}", data={"content_text": "未拉黑"}, follow_redirects=False)
+    assert r.status_code == 302
@@ -0,0 +1,137 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Message  # noqa: E402
+from app.services.chat import ChatHub, ChatWriter  # noqa: E402
+
+
+def test_chat_disabled_rejects_connection(monkeypatch, new_code):
+    monkeypatch.setenv("ANON_CHAT_ENABLED", "false")
+    client = TestClient(app)
+    _, public = new_code(client, "聊天关闭")
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/chat/{public}"):
+            pass
+
+
+def test_chat_room_roundtrip_and_batched_persist(monkeypatch, new_code):
+    monkeypatch.setenv("ANON_CHAT_ENABLED", "true")
+    with TestClient(app) as client:
+        code_id, public = new_code(client, "聊天")
+        with client.websocket_connect(f"/ws/owner/{code_id}") as owner:
+            with client.websocket_connect(f"/ws/chat/{public}") as scanner:
+                assert scanner.receive_json() == {"type": "presence", "owner_online": True}
+                scanner.send_json({"text": "麻烦挪车"})
+                assert scanner.receive_json()["text"] == "麻烦挪车"
+                got = owner.receive_json()
+                assert got["sender"] == "SCANNER" and got["text"] == "麻烦挪车"
+                owner.send_json({"text": "马上到"})
+                assert scanner.receive_json()["sender"] == "OWNER"
+                assert owner.receive_json()["text"] == "马上到"
+                # 聊天限流：默认 10 秒内 5 条
+                for i in range(5):
+                    scanner.send_json({"text": f"第{i}条"})
+                frames = [scanner.receive_json() for _ in range(5)]
+                assert frames[-1]["type"] == "error" and frames[-1]["retry_after"] >= 1
+    # lifespan 退出时批量写入剩余消息
+    db = SessionLocal()
+    try:
+        rows = db.query(Message.sender, Message.content_text, Message.processed).filter(Message.code_id == code_id).all()
+    finally:
+        db.close()
+    assert ("SCANNER", "麻烦挪车", False) in rows and ("OWNER", "马上到", True) in rows
+    assert len(rows) == 6
+    page = TestClient(app)
+    page.post("/login", data={"username": "admin", "password": "admin"})
+    text = page.get(f"/dashboard?code={code_id}").text
+    assert "麻烦挪车" in text and "马上到" not in text
+
+
+def test_slow_consumer_is_evicted_and_writer_batches():
+    class FakeWS:
+        def __init__(self, stalled=False):
+            self.stalled, self.sent, self.closed = stalled, [], None
+
+        async def send_text(self, text):
+            if self.stalled:
+                await asyncio.sleep(3600)  # 客户端不再读取
+            self.sent.append(text)
+
+        async def close(self, code=1000):
+            self.closed = code
+
+    class Rec:
+        id, owner_id, display_name, public_code = 1, 1, None, "x"
+        notify_channel, bark_base_url, bark_token = "NONE", None, None
+
+    async def scenario():
+        writes = []
+        writer = ChatWriter(batch_size=50, flush_ms=50)
+        writer._write = lambda batch: writes.append(len(batch)) or []
+        hub = ChatHub(send_queue=2, writer=writer)
+        slow_ws = FakeWS(stalled=True)
+        owner = hub.join(slow_ws, "OWNER", Rec())
+        scanner = hub.join(FakeWS(), "SCANNER", Rec())
+        for i in range(10):
+            hub.post(scanner, f"m{i}")
+            await asyncio.sleep(0)
+        assert owner.closed and slow_ws.closed == 1013
+        assert hub.connections == 1
+        assert sum('"m' in t for t in scanner.ws.sent) == 10
+        # 车主被断开后扫码者收到离线通知
+        assert '{"type":"presence","owner_online":false}' in scanner.ws.sent
+        await writer.flush()
+        assert writes == [10]
+        await writer.stop()
+
+    asyncio.run(scenario())
+
+
+def test_failed_batch_is_retried_then_reported_to_senders():
+    from app.services.metrics import chat_write_failures
+
+    class FakeWS:
+        def __init__(self):
+            self.sent = []
+
+        async def send_text(self, text):
+            self.sent.append(text)
+
+        async def close(self, code=1000):
+            pass
+
+    class Rec:
+        id, owner_id, display_name, public_code = 1, 1, None, "x"
+        notify_channel, bark_base_url, bark_token = "NONE", None, None
+
+    def broken(batch):
+        calls.append(len(batch))
+        raise RuntimeError("database is locked")
+
+    async def scenario():
+        writer = ChatWriter(batch_size=10, flush_ms=10)
+        writer.RETRY_DELAY = 0
+        writer._write = broken
+        hub = ChatHub(writer=writer)
+        scanner = hub.join(FakeWS(), "SCANNER", Rec())
+        hub.post(scanner, "丢失的消息")
+        await writer.flush()
+        await asyncio.sleep(0.01)
+        await writer.stop()
+        return scanner.ws.sent
+
+    calls = []
+    dropped = chat_write_failures.value(("dropped",))
+    sent = asyncio.run(scenario())
+    assert calls == [1, 1]
+    assert chat_write_failures.value(("dropped",)) == dropped + 1
+    assert '{"type":"error","detail":"消息保存失败，请重新发送","text":"丢失的消息"}' in sent
@@ -0,0 +1,90 @@
+import os
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.services.codes import code_cache  # noqa: E402
+
+
+def test_landing_populates_cache_and_toggle_invalidates(new_code):
+    client = TestClient(app)
+    code_id, public_code = new_code(client)
+    r = client.get(f"/c/{public_code}")
+    assert r.status_code == 200 and "Code not found" not in r.text
+    rec = code_cache.get(public_code)
+    assert rec is not None and rec.active and rec.id == code_id
+    # 暂停后缓存失效，落地页立即反映新状态
+    r = client.post(f"/api/v1/codes/{code_id}/toggle")
+    assert r.json()["status"] == "PAUSED"
+    assert code_cache.get(public_code) is None
+    r = client.get(f"/c/{public_code}")
+    assert "Code not found" in r.text
+
+
+def test_notify_save_invalidates_cache(new_code):
+    client = TestClient(app)
+    code_id, public_code = new_code(client)
+    client.get(f"/c/{public_code}")
+    assert code_cache.get(public_code).notify_channel == "NONE"
+    client.post(f"/codes/{code_id}/notify", data={"channel": "BARK", "bark_base_url": "http://127.0.0.1:9", "bark_token": "t"})
+    client.get(f"/c/{public_code}")
+    rec = code_cache.get(public_code)
+    assert rec.notify_channel == "BARK" and rec.bark_token == "t"
+
+
+def test_submit_rechecks_stale_cache_in_write_transaction(new_code):
+    from app.database import SessionLocal
+    from app.models import Code, Message
+
+    client = TestClient(app)
+    code_id, public_code = new_code(client)
+    client.get(f"/c/{public_code}")
+    assert code_cache.get(public_code).active
+    # 模拟另一个 worker 暂停该码：本进程缓存仍是启用状态
+    db = SessionLocal()
+    try:
+        db.query(Code).filter(Code.id == code_id).update({Code.status: "PAUSED"})
+        db.commit()
+    finally:
+        db.close()
+    r = TestClient(app).post(f"/c/{public_code}", data={"content_text": "挪车"}, follow_redirects=False)
+    assert r.status_code == 404
+    assert code_cache.get(public_code) is None
+    db = SessionLocal()
+    try:
+        assert db.query(Message).filter(Message.code_id == code_id).count() == 0
+    finally:
+        db.close()
+
+
+def test_notify_test_does_not_hold_writer_during_bark_call(stub_bark, new_code):
+    import threading
+    import time
+
+    from app.database import ReadSessionLocal
+    from app.models import CodeNotifyPref
+
+    client = TestClient(app)
+    code_id, _ = new_code(client)
+    client.post(f"/codes/{code_id}/notify", data={"channel": "BARK", "bark_base_url": stub_bark.base_url, "bark_token": "t"})
+    stub_bark.delay = 1.0
+    results = []
+    t = threading.Thread(target=lambda: results.append(client.post(f"/codes/{code_id}/notify/test", follow_redirects=False)))
+    t.start()
+    time.sleep(0.3)
+    # Bark 请求进行中，写入不应等待测试通知释放写连接
+    other = TestClient(app)
+    other_id, _ = new_code(other)
+    t0 = time.perf_counter()
+    assert other.post(f"/api/v1/codes/{other_id}/toggle").json()["status"] == "PAUSED"
+    assert time.perf_counter() - t0 < 0.5
+    t.join()
+    assert "test=1" in results[0].headers["location"]
+    db = ReadSessionLocal()
+    try:
+        pref = db.query(CodeNotifyPref).filter(CodeNotifyPref.code_id == code_id).one()
+        assert pref.last_test_ok is True and pref.last_test_at is not None
+    finally:
+        db.close()
@@ -0,0 +1,50 @@
+import os
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Message, User  # noqa: E402
+from app.services.feed import decode_cursor, encode_cursor, fetch_message_page  # noqa: E402
+
+
+def test_cursor_roundtrip_and_invalid():
+    ts = datetime(2026, 1, 2, 3, 4, 5, 123456)
+    assert decode_cursor(encode_cursor(ts, 42)) == (ts, 42)
+    assert decode_cursor("not-a-cursor!") is None
+    assert decode_cursor(None) is None
+
+
+def test_keyset_pages_and_filters(new_code):
+    client = TestClient(app)
+    code_id, _ = new_code(client, "分页码")
+    base = datetime.utcnow() + timedelta(days=1)
+    db = SessionLocal()
+    try:
+        owner_id = db.query(User).filter(User.username == "admin").one().id
+        # 相同时间戳的留言也必须按 id 稳定切分
+        for i in range(7):
+            db.add(Message(code_id=code_id, content_text=f"feed-{i}", processed=(i % 2 == 0),
+                           created_at=base - timedelta(seconds=i // 2)))
+        db.commit()
+
+        seen, cursor = [], None
+        while True:
+            rows, cursor = fetch_message_page(db, owner_id, cursor=cursor, limit=3, code_id=code_id)
+            seen.extend(r.id for r in rows)
+            assert all(r.code_label == "分页码" for r in rows)
+            if cursor is None:
+                break
+        assert len(seen) == 7 and len(set(seen)) == 7
+
+        rows, _ = fetch_message_page(db, owner_id, limit=50, processed=False, code_id=code_id)
+        assert len(rows) == 3 and not any(r.processed for r in rows)
+    finally:
+        db.close()
+
+    r = client.get(f"/dashboard?code={code_id}&processed=0")
+    assert r.status_code == 200
+    assert "feed-1" in r.text and "feed-0" not in r.text
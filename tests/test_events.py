@@ -0,0 +1,79 @@
+import asyncio
+import os
+import re
+import threading
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.services.events import EventBroker, event_broker  # noqa: E402
+
+
+def test_broker_delivers_across_threads_and_degrades_to_resync():
+    async def scenario():
+        broker = EventBroker(queue_size=2, heartbeat=0.05, max_age=5)
+        stream = broker.stream(7)
+        assert (await stream.__anext__()).startswith("retry:")
+        assert broker.has_subscribers(7) and len(broker) == 1
+        # 线程池中的同步路由发布
+        t = threading.Thread(target=broker.publish, args=(7, "message", {"id": 1}))
+        t.start()
+        t.join()
+        assert await stream.__anext__() == 'event: message\ndata: {"id":1}\n\n'
+        assert await stream.__anext__() == ": ping\n\n"
+        # 队列溢出：清空并只保留 resync，随后结束连接
+        for i in range(5):
+            broker.publish(7, "message", {"id": i})
+        assert (await stream.__anext__()).startswith("event: resync")
+        try:
+            await stream.__anext__()
+            raise AssertionError("stream should end after resync")
+        except StopAsyncIteration:
+            pass
+        assert len(broker) == 0 and not broker.has_subscribers(7)
+
+    asyncio.run(scenario())
+
+
+def test_broker_close_ends_streams():
+    async def scenario():
+        broker = EventBroker(heartbeat=10, max_age=60)
+        stream = broker.stream(1)
+        await stream.__anext__()
+        broker.close()
+        chunks = [c async for c in stream]
+        assert chunks == [] and len(broker) == 0
+
+    asyncio.run(scenario())
+
+
+def test_dashboard_events_route_and_publish(monkeypatch):
+    client = TestClient(app)
+    assert client.get("/dashboard/events").status_code == 401
+
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    client.post("/codes", data={"display_name": "实时"})
+    page = client.get("/dashboard").text
+    code_id = int(re.search(r'data-id="(\d+)"', page).group(1))
+    public = re.search(r'data-public="([^"]+)"', page).group(1)
+
+    published = []
+    monkeypatch.setattr(event_broker, "has_subscribers", lambda owner_id: True)
+    monkeypatch.setattr(event_broker, "publish", lambda owner_id, event, data: published.append((event, data)))
+    client.post(f"/c/{public}", data={"content_text": "挡路了"}, follow_redirects=False)
+    event, data = published[-1]
+    assert event == "message" and data["code_id"] == code_id and data["content_text"] == "挡路了"
+    assert re.search(rf'data-unprocessed="{code_id}">1 条未处理', client.get("/dashboard").text)
+
+    client.post(f"/api/v1/messages/{data['id']}/mark")
+    assert published[-1] == ("processed", {"id": data["id"], "code_id": code_id})
+    assert re.search(rf'data-unprocessed="{code_id}" hidden>0 条未处理', client.get("/dashboard").text)
+
+    # 连接到期后主动结束，响应为 text/event-stream
+    monkeypatch.setattr(event_broker, "max_age", 0.2)
+    r = client.get("/dashboard/events")
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert r.text.startswith("retry: 5000")
@@ -0,0 +1,75 @@
+import io
+import os
+import time
+
+import pytest
+
+from app.services.images import ImagePipeline, process_image, sniff_image_type, strip_metadata
+
+PIL = pytest.importorskip("PIL")
+from PIL import Image  # noqa: E402
+
+
+def _jpeg_with_gps(w=3000, h=2000) -> bytes:
+    img = Image.new("RGB", (w, h), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    exif[0x8825] = {1: "N", 2: (31.0, 14.0, 0.0)}  # GPSInfo
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", exif=exif)
+    return buf.getvalue()
+
+
+def test_sniff_image_type():
+    assert sniff_image_type(b"\xff\xd8\xff\xe0" + b"\0" * 12) == "jpeg"
+    assert sniff_image_type(b"\x89PNG\r\n\x1a\n" + b"\0" * 8) == "png"
+    assert sniff_image_type(b"RIFF\0\0\0\0WEBPVP8 ") == "webp"
+    assert sniff_image_type(b"<html><script>") is None
+
+
+def test_process_image_strips_exif_and_downscales(tmp_path):
+    src = tmp_path / "1_abc.jpg"
+    src.write_bytes(_jpeg_with_gps())
+    with Image.open(src) as im:
+        assert im.getexif().get(0x8825)
+    out, thumb = process_image(str(src), max_dim=800, quality=75, thumb_dim=120)
+    with Image.open(out) as im:
+        assert im.format == "WEBP" and max(im.size) == 800
+        assert not im.getexif()
+    with Image.open(thumb) as im:
+        assert max(im.size) == 120
+    assert os.path.getsize(out) < src.stat().st_size
+
+
+def test_pipeline_runs_in_process_pool(tmp_path):
+    src = tmp_path / "2_def.png"
+    Image.new("RGBA", (50, 40), (0, 0, 255, 128)).save(src)
+    pipeline = ImagePipeline(workers=1, max_dim=32, thumb_dim=16)
+    try:
+        public = tmp_path / "public"
+        public.mkdir()
+        fut = pipeline.submit(-1, str(src), str(public))
+        out, thumb = fut.result(timeout=60)
+        assert out == str(public / "2_def_p.webp")
+        # 留言不存在时，回调会清理产物与原图
+        deadline = time.time() + 5
+        while src.exists() and time.time() < deadline:
+            time.sleep(0.05)
+        assert not src.exists()
+    finally:
+        pipeline.shutdown(wait=True)
+
+
+@pytest.mark.parametrize("fmt,ext", [("JPEG", "jpg"), ("PNG", "png"), ("WEBP", "webp")])
+def test_strip_metadata_without_decoding(tmp_path, fmt, ext):
+    exif = Image.Exif()
+    exif[0x010F] = "PhoneMaker"
+    exif[0x8825] = {1: "N", 2: (31.0, 14.0, 0.0)}
+    src, dst = tmp_path / f"a.{ext}", tmp_path / f"b.{ext}"
+    Image.new("RGB", (64, 48), (10, 200, 10)).save(src, format=fmt, exif=exif)
+    assert b"PhoneMaker" in src.read_bytes()
+    strip_metadata(str(src), str(dst))
+    assert b"PhoneMaker" not in dst.read_bytes()
+    with Image.open(dst) as im:
+        im.load()
+        assert im.size == (64, 48) and not im.getexif()
@@ -0,0 +1,30 @@
+import hashlib
+import hmac
+
+from app.services.blacklist import BlacklistIndex
+from app.services.iphash import IPHasher, legacy_hash_ip
+
+
+def test_hmac_matches_reference_and_is_cached():
+    h = IPHasher("new-secret", cache_size=8)
+    expected = hmac.new(b"new-secret", b"1.2.3.4", hashlib.sha256).hexdigest()
+    assert h.hash("1.2.3.4") == expected
+    assert h.hash("1.2.3.4") == expected
+    assert h.hash.cache_info().hits == 1
+
+
+def test_rotation_keeps_old_hashes_matchable():
+    old = IPHasher("old-secret", legacy=False)
+    rotated = IPHasher("new-secret", previous=("old-secret",))
+    cands = rotated.candidates("5.6.7.8")
+    assert cands[0] == rotated.hash("5.6.7.8") != old.hash("5.6.7.8")
+    assert old.hash("5.6.7.8") in cands
+    # 升级前（旧版 sha256(secret|ip)）写入的条目
+    assert legacy_hash_ip("5.6.7.8", "old-secret") in cands
+
+    idx = BlacklistIndex()
+    idx._loaded = True
+    idx.add(3, old.hash("5.6.7.8"))
+    assert idx.is_blocked_any(3, rotated.candidates("5.6.7.8"))
+    # 过渡期结束（移除旧密钥）后旧条目不再匹配
+    assert not idx.is_blocked_any(3, IPHasher("new-secret", legacy=False).candidates("5.6.7.8"))
@@ -0,0 +1,60 @@
+import os
+import re
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.routes import pages  # noqa: E402
+from app.services.rate_limit import MemoryBackend  # noqa: E402
+
+
+def test_messages_since_cursor_and_conditional_get(monkeypatch):
+    monkeypatch.setattr(pages.rate_limiter, "backend", MemoryBackend(window=60, count=10))
+    client = TestClient(app)
+    assert client.get("/api/v1/messages").status_code == 401
+
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    client.post("/codes", data={"display_name": "增量接口"})
+    page = client.get("/dashboard").text
+    code_id = int(re.search(r'data-id="(\d+)"', page).group(1))
+    public = re.search(r'data-public="([^"]+)"', page).group(1)
+
+    first = client.get("/api/v1/messages", params={"code_id": code_id})
+    assert first.status_code == 200 and first.json()["items"] == []
+    cursor, etag = first.json()["next_since"], first.headers["etag"]
+
+    # 无变化：304 且无响应体
+    again = client.get("/api/v1/messages", params={"code_id": code_id}, headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+
+    anon = TestClient(app)
+    for text in ("第一条", "第二条"):
+        anon.post(f"/c/{public}", data={"content_text": text}, follow_redirects=False)
+    # 留言新增后 ETag 失效
+    changed = client.get("/api/v1/messages", params={"code_id": code_id}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+
+    resp = client.get("/api/v1/messages", params={"since": cursor, "code_id": code_id, "limit": 1})
+    body = resp.json()
+    assert [m["content_text"] for m in body["items"]] == ["第一条"] and body["has_more"] is True
+    resp = client.get("/api/v1/messages", params={"since": body["next_since"], "code_id": code_id})
+    body = resp.json()
+    assert [m["content_text"] for m in body["items"]] == ["第二条"] and body["has_more"] is False
+    assert body["unprocessed"][str(code_id)] == 2
+    cursor = body["next_since"]
+
+    # 以新游标轮询：首次 200（空），之后无变化时 304
+    poll = client.get("/api/v1/messages", params={"since": cursor, "code_id": code_id})
+    assert poll.json()["items"] == [] and poll.json()["next_since"] == cursor
+    etag = poll.headers["etag"]
+    hit = client.get("/api/v1/messages", params={"since": cursor, "code_id": code_id}, headers={"If-None-Match": etag})
+    assert hit.status_code == 304
+
+    # 标记处理同样使 ETag 失效
+    client.post(f"/api/v1/messages/{body['items'][0]['id']}/mark")
+    resp = client.get("/api/v1/messages", params={"since": cursor, "code_id": code_id}, headers={"If-None-Match": etag})
+    assert resp.status_code == 200 and resp.json()["items"] == []
+    assert resp.json()["unprocessed"][str(code_id)] == 1
@@ -0,0 +1,52 @@
+import os
+import re
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.services.metrics import Histogram, http_db_time, rate_limit_decisions  # noqa: E402
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 0.5, 3.0):
+        h.observe(v, ("/x",))
+    lines = list(h.samples())
+    assert lines == [
+        't_seconds_bucket{route="/x",le="0.1"} 1',
+        't_seconds_bucket{route="/x",le="1"} 3',
+        't_seconds_bucket{route="/x",le="+Inf"} 4',
+        't_seconds_sum{route="/x"} 4.05',
+        't_seconds_count{route="/x"} 4',
+    ]
+
+
+def test_metrics_endpoint_reports_route_templates_and_hot_paths():
+    anon = TestClient(app)
+    assert anon.get("/metrics").status_code == 403
+
+    client = TestClient(app)
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    client.post("/codes", data={"display_name": "指标"})
+    public = re.search(r'data-public="([^"]+)"', client.get("/dashboard").text).group(1)
+    denied = rate_limit_decisions.value(("message", "deny"))
+    anon.get(f"/c/{public}")
+    anon.get(f"/qr/{public}.png?scale=3")
+    for _ in range(2):
+        anon.post(f"/c/{public}", data={"content_text": "挡路"}, follow_redirects=False)
+    assert rate_limit_decisions.value(("message", "deny")) == denied + 1
+    assert http_db_time.count(("/dashboard",)) >= 1
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200 and resp.headers["content-type"].startswith("text/plain")
+    body = resp.text
+    # 按路由模板而非实际路径聚合
+    assert 'movecar_http_request_duration_seconds_count{method="GET",route="/c/{public_code}"}' in body
+    assert 'movecar_http_requests_total{method="POST",route="/c/{public_code}",status="429"}' in body
+    assert f"/c/{public}" not in body
+    assert 'movecar_blacklist_checks_total{result="miss"}' in body
+    assert 'movecar_threadpool_tokens{state="waiting"} 0' in body
+    assert re.search(r'movecar_http_db_seconds_sum\{route="/dashboard"\} \d', body)
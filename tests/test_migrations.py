@@ -0,0 +1,62 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app import models  # noqa: E402,F401
+from app.database import Base  # noqa: E402
+from app.migrations import HOT_PATH_INDEXES, MIGRATIONS, check_query_plans, current_version, run_migrations  # noqa: E402
+
+
+def _legacy_engine(tmp_path):
+    """模拟旧版本库：缺少新增字段与全部热点索引。"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}", future=True)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name, _table, _cols in HOT_PATH_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("ALTER TABLE messages DROP COLUMN thumb_path"))
+        conn.execute(text("ALTER TABLE app_setting DROP COLUMN footer_html"))
+    return engine
+
+
+def test_migrations_upgrade_legacy_db_idempotently(tmp_path):
+    engine = _legacy_engine(tmp_path)
+    assert check_query_plans(engine)  # 旧库的热点查询存在全表扫描
+
+    assert run_migrations(engine) == [m.version for m in MIGRATIONS]
+    assert current_version(engine) == MIGRATIONS[-1].version
+    insp = inspect(engine)
+    assert "thumb_path" in {c["name"] for c in insp.get_columns("messages")}
+    assert "footer_html" in {c["name"] for c in insp.get_columns("app_setting")}
+    indexes = {ix["name"] for t in ("messages", "blacklist", "codes", "code_notify_pref", "notify_outbox")
+               for ix in insp.get_indexes(t)}
+    assert {name for name, _t, _c in HOT_PATH_INDEXES} <= indexes
+
+    # 再次执行不做任何事
+    assert run_migrations(engine) == []
+
+
+def test_fresh_schema_hot_queries_use_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}", future=True)
+    Base.metadata.create_all(bind=engine)
+    # 新库已由模型建好最新结构，迁移只记录版本
+    run_migrations(engine)
+    assert check_query_plans(engine) == {}
+
+
+def test_init_db_fails_loudly_when_a_migration_fails(monkeypatch):
+    from app import database
+
+    def broken(engine):
+        raise RuntimeError("migration 99 failed")
+
+    calls = []
+    monkeypatch.setattr("app.migrations.run_migrations", broken)
+    monkeypatch.setattr(database, "bootstrap_admin", lambda: calls.append(1))
+    with pytest.raises(RuntimeError, match="migration 99"):
+        database.init_db()
+    assert calls == []
@@ -0,0 +1,61 @@
+import asyncio
+
+from app.services import notify
+from app.services.notify import CircuitBreaker, notify_http, send_bark_async
+
+
+def test_pooled_client_delivers_to_stub(stub_bark):
+    async def run():
+        await notify_http.start()
+        try:
+            return [await send_bark_async(stub_bark.base_url, "tok", "标题", f"正文{i}") for i in range(3)]
+        finally:
+            await notify_http.aclose()
+
+    results = asyncio.run(run())
+    assert all(ok for ok, _ in results)
+    assert stub_bark.count == 3
+    token, payload = stub_bark.received[0]
+    assert token == "tok" and payload == {"title": "标题", "body": "正文0"}
+
+
+def test_circuit_breaker_fails_fast_for_dead_server(stub_bark, monkeypatch):
+    monkeypatch.setattr(notify, "breaker", CircuitBreaker(failure_threshold=2, reset_timeout=60))
+    stub_bark.status = 500
+    for _ in range(2):
+        ok, msg = asyncio.run(send_bark_async(stub_bark.base_url, "tok", "t", "b"))
+        assert not ok and "HTTP 500" in msg
+    # 熔断后不再发出请求
+    ok, msg = asyncio.run(send_bark_async(stub_bark.base_url, "tok", "t", "b"))
+    assert not ok and "熔断" in msg
+    assert stub_bark.count == 2
+
+
+def test_circuit_breaker_half_open_recovers():
+    cb = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    cb.record_failure("http://x")
+    assert cb.is_open("http://x")
+    assert cb.allow("http://x")  # 半开探测
+    assert not cb.allow("http://x")  # 探测进行中，其余请求快速失败
+    cb.record_success("http://x")
+    assert not cb.is_open("http://x") and cb.allow("http://x")
+
+
+def test_cancelled_probe_releases_half_open(stub_bark, monkeypatch):
+    cb = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    monkeypatch.setattr(notify, "breaker", cb)
+    cb.record_failure(stub_bark.base_url)
+    stub_bark.delay = 2.0
+
+    async def run():
+        task = asyncio.create_task(send_bark_async(stub_bark.base_url, "tok", "t", "b"))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(run())
+    # 被取消的探测不再占用半开名额，下一次请求可以继续探测
+    assert cb.allow(stub_bark.base_url)
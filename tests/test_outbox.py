@@ -0,0 +1,113 @@
+import os
+import re
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import NotifyOutbox  # noqa: E402
+from app.services import outbox as outbox_service  # noqa: E402
+
+
+def _code_with_bark(client: TestClient):
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    client.post("/codes", data={"display_name": "通知码"})
+    r = client.get("/dashboard")
+    m = re.search(r'data-id="(\d+)"\s+data-public="([A-Za-z0-9_\-]+)"', r.text)
+    code_id, public_code = int(m.group(1)), m.group(2)
+    client.post(f"/codes/{code_id}/notify", data={"channel": "BARK", "bark_base_url": "http://127.0.0.1:9", "bark_token": "tk"})
+    return code_id, public_code
+
+
+def _outbox_rows(code_id):
+    db = SessionLocal()
+    try:
+        return db.query(NotifyOutbox).filter(NotifyOutbox.code_id == code_id).all()
+    finally:
+        db.close()
+
+
+def test_submit_enqueues_and_dispatcher_delivers(monkeypatch):
+    client = TestClient(app)
+    code_id, public_code = _code_with_bark(client)
+    r = client.post(f"/c/{public_code}", data={"content_text": "发件箱"}, follow_redirects=False)
+    assert r.status_code == 302
+    rows = _outbox_rows(code_id)
+    assert len(rows) == 1 and rows[0].status == "PENDING" and rows[0].message_id
+    assert "待推送" in client.get("/dashboard").text
+
+    sent = []
+
+    async def fake_deliver(job):
+        sent.append(job)
+        return True, "ok"
+
+    monkeypatch.setattr(outbox_service, "deliver", fake_deliver)
+    dispatcher = outbox_service.OutboxDispatcher()
+    assert dispatcher.drain_once() >= 1
+    assert any(j.token == "tk" and j.body == "发件箱" for j in sent)
+    assert _outbox_rows(code_id)[0].status == "SENT"
+
+
+def test_failed_delivery_retries_then_dead_letters(monkeypatch):
+    client = TestClient(app)
+    code_id, public_code = _code_with_bark(client)
+    client.post(f"/c/{public_code}", data={"content_text": "失败重试"})
+    async def failing_deliver(job):
+        return False, "HTTP 500"
+
+    monkeypatch.setattr(outbox_service, "deliver", failing_deliver)
+    dispatcher = outbox_service.OutboxDispatcher(max_attempts=2, retry_base=0, retry_max=0)
+    dispatcher.drain_once()
+    row = _outbox_rows(code_id)[0]
+    assert row.status == "PENDING" and row.attempts == 1 and row.last_error == "HTTP 500"
+    dispatcher.drain_once()
+    row = _outbox_rows(code_id)[0]
+    assert row.status == "DEAD" and row.attempts == 2
+
+
+def test_messages_within_window_coalesce_into_one_digest(monkeypatch):
+    from app.models import Message
+
+    monkeypatch.setenv("NOTIFY_COALESCE_SEC", "600")
+    client = TestClient(app)
+    code_id, _public_code = _code_with_bark(client)
+    db = SessionLocal()
+    try:
+        for text in ("第一条", "第二条", "第三条"):
+            msg = Message(code_id=code_id, content_text=text)
+            db.add(msg)
+            outbox_service.enqueue_notification(db, msg, "BARK", "http://127.0.0.1:9", "digest", "挪车提醒", text)
+            db.flush()
+        db.commit()
+    finally:
+        db.close()
+
+    sent = []
+
+    async def fake_deliver(job):
+        sent.append(job)
+        return True, "ok"
+
+    monkeypatch.setattr(outbox_service, "deliver", fake_deliver)
+    dispatcher = outbox_service.OutboxDispatcher()
+    dispatcher.drain_once()
+    digests = [j for j in sent if j.token == "digest"]
+    assert len(digests) == 1 and digests[0].body == "3 条新留言，最新：第三条"
+    assert [r.status for r in _outbox_rows(code_id)] == ["SENT"] * 3
+
+    # 窗口内的新留言顺延到窗口结束，不会立即推送，但也不会丢弃
+    db = SessionLocal()
+    try:
+        msg = Message(code_id=code_id, content_text="第四条")
+        db.add(msg)
+        outbox_service.enqueue_notification(db, msg, "BARK", "http://127.0.0.1:9", "digest", "挪车提醒", "第四条")
+        db.commit()
+    finally:
+        db.close()
+    sent.clear()
+    dispatcher.drain_once()
+    assert not [j for j in sent if j.token == "digest"]
+    assert sorted(r.status for r in _outbox_rows(code_id)) == ["PENDING", "SENT", "SENT", "SENT"]
@@ -0,0 +1,61 @@
+import os
+import re
+import xml.dom.minidom
+
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Code  # noqa: E402
+from app.services import provision  # noqa: E402
+from app.services.sheet import SheetRenderer, Sticker  # noqa: E402
+
+
+def test_bulk_create_and_sheet_download():
+    client = TestClient(app)
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    r = client.post("/api/v1/codes/bulk", data={"count": "30", "name_prefix": "车队-"})
+    data = r.json()
+    assert data["ok"] and data["count"] == 30
+    codes = data["codes"]
+    assert len({c["public_code"] for c in codes}) == 30
+    assert codes[0]["display_name"] == "车队-01" and codes[-1]["display_name"] == "车队-30"
+    assert [c["id"] for c in codes] == sorted(c["id"] for c in codes)
+
+    r = client.get(data["sheet_url"])
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/pdf"
+    assert r.content.startswith(b"%PDF-") and r.content.rstrip().endswith(b"%%EOF")
+    assert b"/Count 3 " in r.content  # 30 张，每页 12 张
+
+    r = client.get(data["sheet_url"].replace(".pdf", ".svg"))
+    assert r.headers["content-type"].startswith("image/svg+xml")
+    doc = xml.dom.minidom.parseString(r.content)
+    assert len(doc.getElementsByTagName("path")) == 30
+
+    assert client.post("/api/v1/codes/bulk", data={"count": "0"}).status_code == 400
+    assert client.get("/codes/sheet.png").status_code == 404
+
+
+def test_unique_public_codes_skips_collisions(monkeypatch):
+    db = SessionLocal()
+    try:
+        existing = db.query(Code.public_code).first()[0]
+        seq = iter([existing, "dup-a", "dup-a", "fresh-b", "fresh-c"])
+        monkeypatch.setattr("app.utils.generate_public_code", lambda: next(seq))
+        assert provision.unique_public_codes(db, 2) == ["dup-a", "fresh-b"]
+    finally:
+        db.close()
+
+
+def test_pdf_xref_offsets_point_at_objects():
+    stickers = [Sticker(f"c{i}", None, f"https://example.com/c/c{i}") for i in range(13)]
+    pdf = b"".join(SheetRenderer(workers=1).iter_pdf(stickers))
+    start = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+    entries = pdf[start:].split(b"\n")[3:]
+    for num, line in enumerate(entries[:10], start=1):
+        offset = int(line[:10])
+        assert pdf[offset:].startswith(f"{num} 0 obj".encode())
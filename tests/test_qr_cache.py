@@ -0,0 +1,93 @@
+import os
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.services import qr as qr_service  # noqa: E402
+
+
+def test_qr_png_etag_and_304(new_code):
+    client = TestClient(app)
+    _, public = new_code(client)
+    r = client.get(f"/qr/{public}.png?scale=4&border=1")
+    assert r.status_code == 200 and r.headers["content-type"] == "image/png"
+    assert r.content.startswith(b"\x89PNG")
+    etag = r.headers["etag"]
+    assert "max-age" in r.headers["cache-control"]
+    r2 = client.get(f"/qr/{public}.png?scale=4&border=1", headers={"If-None-Match": etag})
+    assert r2.status_code == 304 and r2.content == b""
+    assert r2.headers["etag"] == etag
+
+
+def test_qr_svg_variant_and_unknown_code(new_code):
+    client = TestClient(app)
+    r = client.get(f"/qr/{new_code(client)[1]}.svg")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("image/svg+xml")
+    assert b"<svg" in r.content
+    # 未知码不渲染、不缓存
+    assert TestClient(app).get("/qr/no-such-code.png?scale=20").status_code == 404
+
+
+def test_qr_resolves_on_loop_from_caches_and_varies_by_host(monkeypatch, new_code):
+    from app.routes import pages
+    from app.services.site import SiteContext
+
+    monkeypatch.setattr(pages, "peek_site_context", lambda: SiteContext(title="t", footer_html="", base_url=""))
+    monkeypatch.delenv("APP_BASE_URL", raising=False)
+    client = TestClient(app)
+    _, public = new_code(client)
+    client.get(f"/c/{public}")  # 预热码缓存
+    # 两个缓存都命中时不查库
+    monkeypatch.setattr(pages, "_qr_source", lambda *a: pytest.fail("database lookup with warm caches"))
+    r = client.get(f"/qr/{public}.png")
+    assert r.status_code == 200
+    assert r.headers["vary"] == "Host" and r.headers["cache-control"] == "public, max-age=300"
+    monkeypatch.setenv("APP_BASE_URL", "https://qr.example.com")
+    r = client.get(f"/qr/{public}.png")
+    assert "vary" not in r.headers and r.headers["cache-control"] == "public, max-age=2592000"
+
+def test_qr_cache_single_flight_and_lru(monkeypatch, tmp_path):
+    calls = []
+    real = qr_service.render_qr
+    gate = threading.Event()
+
+    def slow_render(*args):
+        calls.append(args)
+        gate.wait(1)
+        return real(*args)
+
+    monkeypatch.setattr(qr_service, "render_qr", slow_render)
+    cache = qr_service.QRCache(max_items=2, disk_dir=str(tmp_path))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("https://x/c/1", persist=True))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    gate.set()
+    for t in threads:
+        t.join()
+    # 并发未命中只渲染一次，所有线程拿到同一结果
+    assert len(calls) == 1
+    assert len({id(r) for r in results}) == 1
+    cache.get("https://x/c/2", persist=True)
+    cache.get("https://x/c/3", persist=True)
+    assert cache.peek("https://x/c/1") is None
+    # 内存淘汰后从磁盘缓存读取，不再渲染
+    cache.get("https://x/c/1", persist=True)
+    assert len(calls) == 3
+
+
+def test_qr_disk_cache_is_bounded_and_opt_in(tmp_path):
+    cache = qr_service.QRCache(max_items=1, disk_dir=str(tmp_path), disk_max_files=2)
+    cache.get("https://host-controlled/c/1")
+    assert os.listdir(tmp_path) == []
+    for i in range(4):
+        cache.get(f"https://x/c/{i}", persist=True)
+    assert len(os.listdir(tmp_path)) == 2
+    # 重启后按 mtime 重建索引，仍满足上限
+    cache = qr_service.QRCache(max_items=1, disk_dir=str(tmp_path), disk_max_files=1)
+    assert len(os.listdir(tmp_path)) == 1
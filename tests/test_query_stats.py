@@ -0,0 +1,73 @@
+import os
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.middleware import MetricsMiddleware  # noqa: E402
+from app.models import Code, Message, User  # noqa: E402
+from app.routes import pages  # noqa: E402
+from app.services.metrics import capture_requests  # noqa: E402
+from app.services.rate_limit import MemoryBackend  # noqa: E402
+
+
+def test_hot_routes_stay_within_query_budget(max_queries, monkeypatch):
+    monkeypatch.setattr(pages.rate_limiter, "backend", MemoryBackend(window=60, count=100))
+    client = TestClient(app)
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    client.post("/codes", data={"display_name": "查询预算"})
+    public = re.search(r'data-public="([^"]+)"', client.get("/dashboard").text).group(1)
+    anon = TestClient(app)
+    for i in range(5):
+        anon.post(f"/c/{public}", data={"content_text": f"第{i}条"}, follow_redirects=False)
+
+    # 码与站点配置走进程内缓存
+    with max_queries(2):
+        anon.get(f"/c/{public}")
+    with max_queries(3):
+        anon.post(f"/c/{public}", data={"content_text": "再来一条"}, follow_redirects=False)
+    # 会话用户 + 码列表连同未处理数 + 一页留言；码与留言数量不影响语句数
+    with max_queries(3):
+        resp = client.get("/dashboard")
+    assert re.search(r'db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+', resp.headers["server-timing"])
+
+
+def test_repeated_statements_reported_with_call_site():
+    db = SessionLocal()
+    try:
+        owner = db.query(User).filter(User.username == "admin").one()
+        for i in range(3):
+            code = Code(public_code=f"nplus1-{os.getpid()}-{i}", owner_id=owner.id)
+            db.add(code)
+            db.flush()
+            db.add(Message(code_id=code.id, content_text="x"))
+        db.commit()
+        owner_id = owner.id
+    finally:
+        db.close()
+
+    demo = FastAPI()
+
+    @demo.get("/lazy")
+    def lazy():
+        s = SessionLocal()
+        try:
+            msgs = s.query(Message).join(Code).filter(Code.owner_id == owner_id).order_by(Message.id.desc()).limit(3).all()
+            return [m.code.public_code for m in msgs]  # 逐条懒加载 m.code
+        finally:
+            s.close()
+
+    demo.add_middleware(MetricsMiddleware, record=False, server_timing=True, sql_debug=True)
+    with capture_requests() as captured:
+        resp = TestClient(demo).get("/lazy")
+    assert resp.status_code == 200 and "server-timing" in resp.headers
+    (_method, route, stats), = captured
+    assert route == "/lazy" and stats.db_queries == 4
+    (sql, count, sites), = stats.duplicates()
+    assert count == 3 and "FROM codes" in sql
+    assert any(site.startswith("tests/test_query_stats.py:") for site in sites)
@@ -0,0 +1,75 @@
+import multiprocessing
+
+from app.services.rate_limit import MemoryBackend, SQLiteBackend
+
+
+def test_memory_backend_gcra_and_retry_after():
+    b = MemoryBackend(window=10, count=2)
+    # 2 次突发后按 5 秒一次的速率补充
+    assert b.allow("k", now=100.0) and b.allow("k", now=100.5)
+    d = b.check("k", now=101.0)
+    assert not d.allowed and abs(d.retry_after - 4.0) < 1e-6
+    assert b.allow("k", now=105.0)
+
+
+def test_memory_backend_bounded_keys():
+    b = MemoryBackend(window=60, count=1, max_keys=1000)
+    for i in range(50_000):
+        b.allow(("ip", i), now=1000.0)
+    assert len(b) == 1000
+    # 最近访问的键仍受限，被淘汰的键视为新键
+    assert not b.allow(("ip", 49_999), now=1001.0)
+    # 空闲键（TAT 已过去）被清理
+    assert b.sweep(now=2000.0) == 1000 and len(b) == 0
+
+
+def test_memory_backend_expires_idle_keys_incrementally():
+    b = MemoryBackend(window=10, count=1, sweep_batch=4)
+    for i in range(100):
+        b.allow(i, now=0.0)
+    # 每次判定只从队头清理有限个空闲键
+    b.allow("new", now=20.0)
+    assert len(b) == 100 + 1 - 4
+    for _ in range(30):
+        b.allow("new", now=20.0)
+    assert list(b._tat) == ["new"]
+    # 队头键仍在限流中（TAT > now）时停止，不扫描其后的键
+    b = MemoryBackend(window=10, count=1, sweep_batch=4)
+    b.allow("live", now=5.0)
+    b.allow("idle", now=0.0)
+    b.allow("other", now=12.0)
+    assert list(b._tat) == ["live", "idle", "other"]
+
+
+def test_sqlite_backend_shares_quota_between_instances(tmp_path):
+    path = str(tmp_path / "rl.db")
+    # 两个实例模拟两个 worker 进程
+    a, b = SQLiteBackend(path, window=60, count=3), SQLiteBackend(path, window=60, count=3)
+    t = 6000.0
+    results = [a.allow(("1.2.3.4", "c1"), now=t), b.allow(("1.2.3.4", "c1"), now=t + 1),
+               a.allow(("1.2.3.4", "c1"), now=t + 2)]
+    assert results == [True, True, True]
+    d = b.check(("1.2.3.4", "c1"), now=t + 3)
+    assert not d.allowed and abs(d.retry_after - 17.0) < 1e-6
+    assert b.allow(("5.6.7.8", "c1"), now=t + 3)
+    assert a.allow(("1.2.3.4", "c1"), now=t + 20)
+    assert a.sweep(now=t + 1000) == 2
+
+
+def _hammer(path, n, out):
+    backend = SQLiteBackend(path, window=3600, count=50)
+    out.put(sum(backend.allow("shared") for _ in range(n)))
+
+
+def test_sqlite_backend_across_processes(tmp_path):
+    path = str(tmp_path / "rl.db")
+    SQLiteBackend(path, window=3600, count=50)
+    ctx = multiprocessing.get_context("spawn")
+    q = ctx.Queue()
+    procs = [ctx.Process(target=_hammer, args=(path, 40, q)) for _ in range(3)]
+    for p in procs:
+        p.start()
+    total = sum(q.get(timeout=60) for _ in procs)
+    for p in procs:
+        p.join()
+    assert total == 50
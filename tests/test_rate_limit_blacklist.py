@@ -33,6 +33,7 @@ def test_rate_limit_blocks_second_request():
     assert r.status_code in (200, 302)
     r = client.post(f"/c/{code}", data={"content_text": "second"})
     assert r.status_code == 429
+    assert 1 <= int(r.headers["Retry-After"]) <= 120
 
 
 def test_blacklist_blocks_request():
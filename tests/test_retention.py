@@ -0,0 +1,112 @@
+import asyncio
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.models import Message  # noqa: E402
+from app import database  # noqa: E402
+from app.services.retention import RetentionJob  # noqa: E402
+
+
+def _touch(path: str, data: bytes = b"x" * 10) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_retention_archives_deletes_and_sweeps(tmp_path, monkeypatch, new_code):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    client = TestClient(app)
+    code_id, _ = new_code(client, "保留期")
+    r = client.post(f"/api/v1/codes/{code_id}/retention", data={"days": "7"})
+    assert r.json()["retention_days"] == 7
+
+    now = datetime.utcnow()
+    _touch(uploads / "old.jpg")
+    _touch(uploads / "keep.jpg")
+    _touch(uploads / "orphan.jpg")
+    _touch(uploads / ".staging.part")
+    (tmp_path / "incoming").mkdir()
+    _touch(tmp_path / "incoming" / "12_abcdef.png")  # 处理任务被取消后滞留的原图
+    db = SessionLocal()
+    try:
+        old = Message(code_id=code_id, content_text="旧留言", image_path="/media/old.jpg",
+                      created_at=now - timedelta(days=30))
+        new = Message(code_id=code_id, content_text="新留言", image_path="/media/keep.jpg",
+                      created_at=now - timedelta(days=1))
+        db.add_all([old, new])
+        db.commit()
+        old_id, new_id = old.id, new.id
+    finally:
+        db.close()
+
+    job = RetentionJob(default_days=0, batch_size=1, archive_dir=str(tmp_path / "archive"), orphan_grace=0,
+                       sweep_orphans=True)
+    report = job.run_once(now=now)
+    assert report.deleted >= 1
+    assert sorted(os.listdir(uploads)) == [".staging.part", "keep.jpg"]
+    assert os.listdir(tmp_path / "incoming") == []
+
+    db = SessionLocal()
+    try:
+        assert db.get(Message, old_id) is None and db.get(Message, new_id) is not None
+    finally:
+        db.close()
+    month = (now - timedelta(days=30)).strftime("%Y-%m")
+    with gzip.open(tmp_path / "archive" / f"messages-{month}.ndjson.gz", "rt", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f]
+    assert any(r["id"] == old_id and r["content_text"] == "旧留言" for r in rows)
+
+
+def test_code_delete_removes_image_files(tmp_path, monkeypatch, new_code):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    client = TestClient(app)
+    code_id, _ = new_code(client, "删除清理")
+    _touch(uploads / "a.webp")
+    _touch(uploads / "a_t.webp")
+    db = SessionLocal()
+    try:
+        db.add(Message(code_id=code_id, image_path="/media/a.webp", thumb_path="/media/a_t.webp"))
+        db.commit()
+    finally:
+        db.close()
+    r = client.post(f"/api/v1/codes/{code_id}/delete")
+    assert r.status_code == 200
+    assert os.listdir(uploads) == []
+
+
+def test_retention_defaults_are_opt_in(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATA_DIR", str(tmp_path))
+    for name in ("RETENTION_DAYS", "RETENTION_ENABLED", "RETENTION_SWEEP_ORPHANS"):
+        monkeypatch.delenv(name, raising=False)
+    uploads = tmp_path / "uploads"
+    uploads.mkdir()
+    _touch(uploads / "unreferenced.jpg")
+    with database.engine.connect() as conn:
+        mode = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+
+    job = RetentionJob.from_env()
+    assert not job.enabled and not job.sweep_orphans_enabled
+    asyncio.run(job.start())
+    assert job._task is None
+    # 手动运行：不删除上传目录中的文件，也不切换 auto_vacuum 模式（不做完整 VACUUM）
+    job.orphan_grace = 0
+    job.run_once()
+    assert os.listdir(uploads) == ["unreferenced.jpg"]
+    with database.engine.connect() as conn:
+        assert conn.execute(text("PRAGMA auto_vacuum")).scalar() == mode
+
+    monkeypatch.setenv("RETENTION_DAYS", "30")
+    assert RetentionJob.from_env().enabled
@@ -0,0 +1,35 @@
+import os
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.database import SessionLocal  # noqa: E402
+from app.services import site as site_service  # noqa: E402
+
+
+def test_site_context_cached_and_invalidated_on_save():
+    client = TestClient(app)
+    client.post("/login", data={"username": "admin", "password": "admin"})
+    r = client.post(
+        "/settings/site",
+        data={"site_base_url": "https://a.example.com/", "site_title": "标题A", "site_footer_html": "<b>页脚A</b>"},
+        follow_redirects=False,
+    )
+    assert r.status_code == 302
+    db = SessionLocal()
+    try:
+        ctx = site_service.get_site_context(db)
+        assert ctx.title == "标题A" and ctx.base_url == "https://a.example.com"
+        # 命中缓存时返回同一对象
+        assert site_service.get_site_context(db) is ctx
+    finally:
+        db.close()
+    r = client.get("/")
+    assert "<b>页脚A</b>" in r.text
+    # 再次保存后缓存失效，页面立即反映新配置
+    client.post("/settings/site", data={"site_base_url": "", "site_title": "", "site_footer_html": ""})
+    r = client.get("/")
+    assert "<b>页脚A</b>" not in r.text
+    assert "skyjt/MoveCar" in r.text
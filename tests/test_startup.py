@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app import startup  # noqa: E402
+from app.routes.pages import templates  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(code: str, tmp_path) -> str:
+    env = dict(os.environ, DB_URL=f"sqlite:///{tmp_path / 'cold.db'}", DATA_DIR=str(tmp_path / "data"), PYTHONPATH=ROOT)
+    env.pop("APP_INIT", None)
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    return out.stdout.strip()
+
+
+def test_import_has_no_db_side_effects_and_first_request_initializes(tmp_path):
+    code = (
+        "import os\n"
+        "import app.main\n"
+        f"print(os.path.exists({str(tmp_path / 'cold.db')!r}))\n"
+        "from fastapi.testclient import TestClient\n"
+        "from app.startup import initializer\n"
+        "r = TestClient(app.main.app).post('/login', data={'username': 'admin', 'password': 'admin'}, follow_redirects=False)\n"
+        "print(r.status_code, initializer.done)\n"
+    )
+    assert _python(code, tmp_path).splitlines() == ["False", "302 True"]
+
+
+def test_leader_stamp_skips_db_init_for_sibling_workers(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr("app.database.init_db", lambda: calls.append(1))
+    monkeypatch.setattr(startup, "_launch_stamp", lambda: "4242 6 sqlite:///x.db")
+    for _ in range(3):
+        startup.Initializer()._init_db(str(tmp_path))
+    assert calls == [1]
+    # 新的一次启动（父进程不同）重新初始化
+    monkeypatch.setattr(startup, "_launch_stamp", lambda: "4243 6 sqlite:///x.db")
+    startup.Initializer()._init_db(str(tmp_path))
+    assert calls == [1, 1]
+
+
+def test_templates_precompiled_without_auto_reload():
+    assert startup.initializer.done
+    assert templates.env.auto_reload is False
+    cache_dir = os.path.join(os.getenv("DATA_DIR", "./data"), "jinja-cache")
+    assert any(name.endswith(".cache") for name in os.listdir(cache_dir))
@@ -0,0 +1,113 @@
+import io
+import os
+import re
+import struct
+import time
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+os.environ.setdefault("DB_URL", "sqlite:///data/test.db")
+os.environ.setdefault("APP_SECRET", "test-secret")
+
+from app.main import app  # noqa: E402
+from app.services.uploads import UploadTooLarge, stage_upload  # noqa: E402
+
+
+def _png_1px() -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    ihdr = struct.pack(">IIBBBBB", 1, 1, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(b"\0\xff\0\0\xff")) + chunk(b"IEND", b"")
+
+
+PNG_1PX = _png_1px()
+
+
+def test_image_upload_is_committed_without_leftovers(new_code):
+    client = TestClient(app)
+    code_id, public_code = new_code(client)
+    files = {"uploaded": ("a.png", PNG_1PX, "image/png")}
+    r = client.post(f"/c/{public_code}", data={"content_text": "带图"}, files=files, follow_redirects=False)
+    assert r.status_code == 302
+    uploads = os.path.join(os.getenv("DATA_DIR", "./data"), "uploads")
+    assert not [f for f in os.listdir(uploads) if f.endswith(".part")]
+    # 原图只在私有暂存目录；处理完成前留言不带图片链接
+    deadline = time.time() + 60
+    while True:
+        m = re.search(r'href="(/media/[^"]+)"', client.get(f"/dashboard?code={code_id}").text)
+        if m or time.time() > deadline:
+            break
+        time.sleep(0.1)
+    assert m and m.group(1).endswith(".webp")
+    assert client.get(m.group(1)).content[:4] == b"RIFF"
+
+
+def test_image_published_stripped_when_pipeline_disabled(monkeypatch, new_code):
+    from app.routes import pages
+
+    monkeypatch.setattr(pages.image_pipeline, "enabled", False)
+    client = TestClient(app)
+    code_id, public_code = new_code(client)
+    files = {"uploaded": ("a.png", PNG_1PX, "image/png")}
+    client.post(f"/c/{public_code}", data={"content_text": "无处理"}, files=files, follow_redirects=False)
+    path = re.search(r'href="(/media/[^"]+)"', client.get(f"/dashboard?code={code_id}").text).group(1)
+    assert client.get(path).content == PNG_1PX
+    incoming = os.path.join(os.getenv("DATA_DIR", "./data"), "incoming")
+    assert not [f for f in os.listdir(incoming) if os.path.basename(path)[len("/media/"):] in f]
+
+
+def test_oversized_content_length_rejected_before_parsing(new_code):
+    client = TestClient(app)
+    _, public_code = new_code(client)
+    big = b"\0" * (6 * 1024 * 1024)
+    r = client.post(f"/c/{public_code}", files={"uploaded": ("big.png", big, "image/png")})
+    assert r.status_code == 413
+    # 被拒绝的请求不消耗频控额度
+    r = client.post(f"/c/{public_code}", data={"content_text": "ok"}, follow_redirects=False)
+    assert r.status_code == 302
+
+
+def test_stage_upload_aborts_at_limit(tmp_path):
+    src = io.BytesIO(b"x" * 1000)
+    with pytest.raises(UploadTooLarge):
+        stage_upload(src, str(tmp_path / "f.png"), max_bytes=999, chunk_size=100)
+    assert list(tmp_path.iterdir()) == []
+    staged = stage_upload(io.BytesIO(b"y" * 500), str(tmp_path / "g.png"), max_bytes=999, chunk_size=100)
+    assert staged.size == 500 and not os.path.exists(staged.final_path)
+    staged.commit()
+    assert (tmp_path / "g.png").read_bytes() == b"y" * 500
+
+
+def test_recover_resubmits_or_removes_leftover_incoming(tmp_path, new_code):
+    from app.database import SessionLocal
+    from app.models import Message
+    from app.services.images import ImagePipeline
+
+    client = TestClient(app)
+    code_id, _ = new_code(client)
+    db = SessionLocal()
+    try:
+        msg = Message(code_id=code_id, content_text="重启前未处理")
+        db.add(msg)
+        db.commit()
+        msg_id = msg.id
+    finally:
+        db.close()
+    incoming, public = tmp_path / "incoming", tmp_path / "uploads"
+    incoming.mkdir()
+    public.mkdir()
+    (incoming / f"{msg_id}_00ff.png").write_bytes(PNG_1PX)
+    (incoming / "999999999_00aa.png").write_bytes(PNG_1PX)  # 留言已不存在
+    (incoming / ".abc.part").write_bytes(b"x")  # 中断的上传
+
+    assert ImagePipeline(enabled=False).recover(str(incoming), str(public), before=time.time() + 1) == (1, 2)
+    assert os.listdir(incoming) == []
+    assert os.listdir(public) == [f"{msg_id}_00ff.png"]
+    db = SessionLocal()
+    try:
+        assert db.get(Message, msg_id).image_path == f"/media/{msg_id}_00ff.png"
+    finally:
+        db.close()